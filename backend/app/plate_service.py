@@ -0,0 +1,391 @@
+import os
+import re
+import threading
+
+import cv2
+import numpy as np
+import pytesseract
+from PIL import Image
+
+from metrics import stage
+from tracing import current_span
+
+TESSERACT_WHITELIST = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# "full": detect on the decoded frame as-is (ultralytics resizes internally),
+# annotate and OCR at full size with a fixed 3x crop upscale.
+# "two_stage": detect on a letterboxed DETECT_IMGSZ copy, annotate that copy,
+# and OCR crops cut from the full-resolution frame scaled to PLATE_TARGET_HEIGHT.
+PLATE_PIPELINE = os.getenv("PLATE_PIPELINE", "full")
+DETECT_IMGSZ = int(os.getenv("DETECT_IMGSZ", "640"))
+DETECT_CONF = float(os.getenv("DETECT_CONF", "0.65"))
+PLATE_TARGET_HEIGHT = int(os.getenv("PLATE_TARGET_HEIGHT", "96"))
+# Decode JPEGs at 1/2, 1/4 or 1/8 scale (cv2.IMREAD_REDUCED_COLOR_*) when
+# plates stay legible at that size; 1 decodes at full resolution.
+IMREAD_REDUCTION = int(os.getenv("IMREAD_REDUCTION", "1"))
+
+IMREAD_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+PLATE_CLASS_NAMES = {
+    0: 'Lorry', 1: 'bike', 2: 'bus', 3: 'car',
+    4: 'number plate', 5: 'three wheeler',
+    6: 'three wheeler', 7: 'van'
+}
+
+
+def preprocess_plate(crop, scale: float = 3, bilateral=(11, 30, 30), threshold: str = "otsu",
+                     min_height_ratio: float = 0.5, dilate: int = 2):
+    """
+    Binarize a BGR plate crop and keep only character-sized components.
+    bilateral is (diameter, sigma colour, sigma space) or None, threshold is
+    "otsu" or "adaptive", components shorter than min_height_ratio of the
+    tallest are dropped, and dilate is the final kernel size (0 for none).
+    """
+    with stage("plate_resize"):
+        gray    = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        if scale != 1:
+            interpolation = cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA
+            resized = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation)
+        else:
+            resized = gray
+    with stage("plate_bilateral"):
+        blur    = cv2.bilateralFilter(resized, *bilateral) if bilateral else resized
+    with stage("plate_threshold"):
+        if threshold == "adaptive":
+            thresh = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                           cv2.THRESH_BINARY, 31, 10)
+        else:
+            _, thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3,3))
+        morphed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+
+    with stage("plate_components"):
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(morphed, connectivity=8)
+        heights = stats[1:, cv2.CC_STAT_HEIGHT] if num_labels>1 else np.array([])
+        max_h   = heights.max() if heights.size else 0
+        min_h   = max_h * min_height_ratio
+
+        mask = np.zeros_like(morphed)
+        for i, stat in enumerate(stats[1:], start=1):
+            if stat[cv2.CC_STAT_HEIGHT] >= min_h:
+                mask[labels == i] = 255
+    if not dilate:
+        return mask
+    with stage("plate_dilate"):
+        return cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_RECT, (dilate, dilate)), iterations=1)
+
+
+# -------------------------------------------------------------------
+# OCR cascade
+# -------------------------------------------------------------------
+# Recognizers tried in order until one reads a plate with at least
+# OCR_MIN_CONFIDENCE (that also matches PLATE_PATTERN, when one is set); the
+# best read so far is returned otherwise.
+OCR_CASCADE = [n.strip() for n in os.getenv("OCR_CASCADE", "tesseract_psm8,tesseract_psm7").split(",") if n.strip()]
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "0.8"))
+# Accepted plate formats once separators are stripped; unset (the default)
+# accepts any non-empty read, so foreign plates still stop the cascade on
+# confidence. Sri Lankan plates ("WPCAB1234", "CAB1234", "251234"):
+#   PLATE_PATTERN=^(?:[A-Z]{2})?(?:[A-Z]{1,3}\d{4}|\d{2,3}\d{4})$
+PLATE_PATTERN = re.compile(os.getenv("PLATE_PATTERN")) if os.getenv("PLATE_PATTERN") else None
+
+CRNN_WEIGHTS = os.getenv("CRNN_WEIGHTS")
+CRNN_CONFIG = os.getenv("CRNN_CONFIG", "TPS-ResNet-BiLSTM-Attn")
+CRNN_CHARACTER = os.getenv("CRNN_CHARACTER", "0123456789abcdefghijklmnopqrstuvwxyz")
+# Model.optimize_for_inference mode: none, fold (BN folding + channels_last), compile or freeze
+CRNN_OPTIMIZE = os.getenv("CRNN_OPTIMIZE", "fold").lower()
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+def valid_plate(text: str) -> bool:
+    if PLATE_PATTERN is None:
+        return bool(text)
+    return bool(PLATE_PATTERN.match(text))
+
+
+class TesseractRecognizer:
+    """
+    Tesseract with a fixed page segmentation mode. Uses a persistent
+    tesserocr API handle per thread when tesserocr is installed (per-symbol
+    confidences, no process spawn), else pytesseract (word confidences).
+    """
+
+    def __init__(self, psm: int):
+        self.psm = psm
+        self._local = threading.local()
+
+    def _api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = self._local.api = tesserocr.PyTessBaseAPI(psm=self.psm, oem=tesserocr.OEM.LSTM_ONLY)
+            api.SetVariable("tessedit_char_whitelist", TESSERACT_WHITELIST)
+        return api
+
+    def __call__(self, mask):
+        """(characters, per-character confidences in 0..1)"""
+        chars, confidences = [], []
+        if tesserocr is not None:
+            api = self._api()
+            api.SetImage(Image.fromarray(mask))
+            api.Recognize()
+            iterator = api.GetIterator()
+            if iterator is not None:
+                for symbol in tesserocr.iterate_level(iterator, tesserocr.RIL.SYMBOL):
+                    char = symbol.GetUTF8Text(tesserocr.RIL.SYMBOL)
+                    if char:
+                        chars.append(char)
+                        confidences.append(symbol.Confidence(tesserocr.RIL.SYMBOL) / 100)
+            return chars, confidences
+        data = pytesseract.image_to_data(
+            Image.fromarray(mask),
+            config=f'--psm {self.psm} --oem 1 -c tessedit_char_whitelist={TESSERACT_WHITELIST}',
+            output_type=pytesseract.Output.DICT
+        )
+        for word, conf in zip(data["text"], data["conf"]):
+            word = word.strip()
+            if word and float(conf) >= 0:
+                chars.extend(word)
+                confidences.extend([float(conf) / 100] * len(word))
+        return chars, confidences
+
+
+class CRNNRecognizer:
+    """The CRNN Model (CRNN_CONFIG, e.g. TPS-ResNet-BiLSTM-Attn) loaded once from CRNN_WEIGHTS"""
+
+    def __init__(self, weights: str = CRNN_WEIGHTS, config: str = CRNN_CONFIG,
+                 character: str = CRNN_CHARACTER, optimize: str = CRNN_OPTIMIZE):
+        import argparse
+        import torch
+        from model import Model
+
+        if not weights:
+            raise ValueError("CRNN_WEIGHTS is not set")
+        if optimize not in ("none", "fold", "compile", "freeze"):
+            raise ValueError(f"Unknown CRNN_OPTIMIZE mode: {optimize}")
+        transformation, feature, sequence, prediction = config.split("-")
+        self.attention = prediction == "Attn"
+        self.tokens = (["[GO]", "[s]"] if self.attention else ["[CTCblank]"]) + list(character)
+        self.opt = argparse.Namespace(
+            Transformation=transformation, FeatureExtraction=feature,
+            SequenceModeling=sequence, Prediction=prediction,
+            num_fiducial=20, imgH=32, imgW=100, input_channel=1, output_channel=512,
+            hidden_size=256, num_class=len(self.tokens), batch_max_length=25)
+        self.torch = torch
+        self.model = Model(self.opt).eval()
+        try:
+            # Memory-mapped weights assigned in place: every worker maps the
+            # same page-cache pages instead of holding a private copy
+            state, assign = torch.load(weights, map_location="cpu", mmap=True), True
+        except (TypeError, RuntimeError):
+            # torch < 2.1, or a legacy (non-zip) checkpoint
+            state, assign = torch.load(weights, map_location="cpu"), False
+        state = {k.replace("module.", "", 1): v for k, v in state.items()}
+        if assign:
+            self.model.load_state_dict(state, assign=True)
+        else:
+            self.model.load_state_dict(state)
+        if optimize != "none":
+            self.model = self.model.optimize_for_inference(compile=optimize == "compile",
+                                                           freeze=optimize == "freeze")
+
+    def __call__(self, mask):
+        torch = self.torch
+        resized = cv2.resize(mask, (self.opt.imgW, self.opt.imgH), interpolation=cv2.INTER_AREA)
+        batch = torch.from_numpy(resized).float().div(255).sub(0.5).div(0.5)[None, None]
+        text = torch.zeros(1, self.opt.batch_max_length + 1, dtype=torch.long)
+        with torch.no_grad():
+            probs = self.model(batch, text, is_train=False).softmax(2)[0]
+        confidences, indices = probs.max(1)
+
+        chars, char_confidences, previous = [], [], None
+        for index, confidence in zip(indices.tolist(), confidences.tolist()):
+            token = self.tokens[index]
+            if self.attention:
+                if token == "[s]":
+                    break
+            elif index == 0 or index == previous:   # CTC blank or repeat
+                previous = index
+                continue
+            previous = index
+            chars.append(token.upper())
+            char_confidences.append(confidence)
+        return chars, char_confidences
+
+
+_recognizers = {}
+_recognizers_lock = threading.Lock()
+
+
+def get_recognizer(name: str):
+    """Recognizer by cascade name (tesseract_psm<N> or crnn), created once per process."""
+    recognizer = _recognizers.get(name)
+    if recognizer is None:
+        with _recognizers_lock:
+            recognizer = _recognizers.get(name)
+            if recognizer is None:
+                if name.startswith("tesseract_psm"):
+                    recognizer = TesseractRecognizer(int(name[len("tesseract_psm"):]))
+                elif name == "crnn":
+                    recognizer = CRNNRecognizer()
+                else:
+                    raise ValueError(f"Unknown OCR recognizer '{name}'")
+                _recognizers[name] = recognizer
+    return recognizer
+
+
+def read_plate(mask, cascade=None, min_confidence: float = None) -> dict:
+    """
+    Run the OCR cascade on a preprocessed plate mask, stopping at the first
+    valid read (see PLATE_PATTERN) with enough confidence. Returns the best
+    read as {"text", "confidence", "char_confidences", "engine", "valid"};
+    the plate confidence is the mean of its character confidences.
+    """
+    cascade = cascade or OCR_CASCADE
+    min_confidence = OCR_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    parent = current_span()
+    best = None
+    for name in cascade:
+        with stage(name):
+            chars, confidences = get_recognizer(name)(mask)
+            kept = [(c, p) for c, p in zip(chars, confidences) if c in TESSERACT_WHITELIST]
+            text = "".join(c for c, _ in kept)
+            confidence = sum(p for _, p in kept) / len(kept) if kept else 0.0
+            result = {
+                "text": text,
+                "confidence": round(confidence, 3),
+                "char_confidences": [round(p, 3) for _, p in kept],
+                "engine": name,
+                "valid": valid_plate(text),
+            }
+            span = current_span()
+            span.set_attribute("ocr.found", bool(text))
+            span.set_attribute("ocr.confidence", result["confidence"])
+        if best is None or (result["valid"], result["confidence"]) > (best["valid"], best["confidence"]):
+            best = result
+        if result["valid"] and result["confidence"] >= min_confidence:
+            break
+    parent.set_attribute("ocr.engine", best["engine"] if best and best["text"] else "none")
+    parent.set_attribute("ocr.confidence", best["confidence"] if best else 0.0)
+    return best
+
+
+def letterbox(frame, size: int):
+    """
+    Fit frame into a size x size square (aspect kept, INTER_AREA, grey
+    padding) and return (image, scale, (pad_x, pad_y)); a box (x, y) in the
+    square maps back to ((x - pad_x) / scale, (y - pad_y) / scale).
+    """
+    h, w = frame.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = round(w * scale), round(h * scale)
+    resized = frame if (new_w, new_h) == (w, h) else cv2.resize(frame, (new_w, new_h),
+                                                              interpolation=cv2.INTER_AREA)
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    boxed = cv2.copyMakeBorder(resized, pad_y, size - new_h - pad_y, pad_x, size - new_w - pad_x,
+                               cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return boxed, scale, (pad_x, pad_y)
+
+
+def crop_scale(crop_height: int, target_height: int = PLATE_TARGET_HEIGHT) -> float:
+    """Resize factor that brings a plate crop to about target_height (never more than 3x)."""
+    return min(3.0, max(0.5, target_height / max(crop_height, 1)))
+
+
+class PlateRecognitionService:
+    def __init__(self, model_path, pipeline: str = PLATE_PIPELINE, imgsz: int = DETECT_IMGSZ,
+                 reduction: int = IMREAD_REDUCTION):
+        """Vehicle and number-plate detector plus plate OCR"""
+        if pipeline not in ("full", "two_stage"):
+            raise ValueError(f"Unknown plate pipeline '{pipeline}'")
+        if reduction not in IMREAD_FLAGS:
+            raise ValueError(f"IMREAD reduction must be one of {sorted(IMREAD_FLAGS)}")
+        # Imported here so the preprocessing and OCR helpers work without ultralytics
+        from ultralytics import YOLO
+
+        self.model = YOLO(model_path)
+        # Requests run predict on threadpool threads; the predictor is not thread-safe
+        self.predict_lock = threading.Lock()
+        self.class_names = PLATE_CLASS_NAMES
+        self.pipeline = pipeline
+        self.imgsz = imgsz
+        self.reduction = reduction
+
+    def decode(self, image_bytes):
+        with stage("imdecode"):
+            return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), IMREAD_FLAGS[self.reduction])
+
+    def detect(self, frame, annotate: bool = True):
+        """
+        Detections as (label, (x1, y1, x2, y2)) in frame coordinates, and the
+        annotated image (the frame itself, or its detection-size copy; None
+        unless annotate).
+        """
+        annotated = None
+        if self.pipeline == "full":
+            with self.predict_lock, stage("yolo_predict"):
+                det = self.model.predict(frame, conf=DETECT_CONF, verbose=False)[0]
+            if annotate:
+                with stage("plot"):
+                    annotated = det.plot()
+            scale, pad_x, pad_y = 1.0, 0, 0
+        else:
+            with stage("letterbox"):
+                boxed, scale, (pad_x, pad_y) = letterbox(frame, self.imgsz)
+            with self.predict_lock, stage("yolo_predict"):
+                det = self.model.predict(boxed, imgsz=self.imgsz, conf=DETECT_CONF, verbose=False)[0]
+            if annotate:
+                with stage("plot"):
+                    h, w = frame.shape[:2]
+                    annotated = np.ascontiguousarray(
+                        det.plot()[pad_y:pad_y + round(h * scale), pad_x:pad_x + round(w * scale)])
+
+        h, w = frame.shape[:2]
+        detections = []
+        for box in det.boxes:
+            x1, y1, x2, y2 = box.xyxy[0].tolist()
+            x1, x2 = (int(np.clip((x - pad_x) / scale, 0, w)) for x in (x1, x2))
+            y1, y2 = (int(np.clip((y - pad_y) / scale, 0, h)) for y in (y1, y2))
+            detections.append((self.class_names.get(int(box.cls[0]), "unknown"), (x1, y1, x2, y2)))
+        return detections, annotated, scale
+
+    def read(self, crop):
+        """OCR cascade result (see read_plate) for a crop cut from the decoded frame"""
+        scale = 3 if self.pipeline == "full" else crop_scale(crop.shape[0])
+        with stage("plate_preprocess"):
+            mask = preprocess_plate(crop, scale)
+        with stage("plate_ocr"):
+            return read_plate(mask)
+
+    def recognize(self, image_bytes, annotate: bool = True):
+        """
+        (annotated image, vehicle labels, plate reads) for an encoded frame
+        (any bytes-like object); raises ValueError when it is not a
+        decodable image.
+        """
+        frame = self.decode(image_bytes)
+        if frame is None:
+            raise ValueError("Bad image")
+        detections, annotated, scale = self.detect(frame, annotate)
+
+        vehicles, plates = [], []
+        for label, (x1, y1, x2, y2) in detections:
+            if label == "number plate":
+                if x2 <= x1 or y2 <= y1:
+                    continue
+                plate = self.read(frame[y1:y2, x1:x2])
+                plates.append(plate)
+                text, color = plate["text"], (0, 255, 255)
+            else:
+                vehicles.append(label)
+                text, color = label, (0, 255, 0)
+            if annotated is not None:
+                # Labels go on the annotated image, which may be the scaled copy
+                ax, ay = int(x1 * scale), int(y1 * scale)
+                cv2.putText(annotated, text, (ax, max(ay - 10, 0)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+        return annotated, vehicles, plates
@@ -1,12 +1,18 @@
+import threading
+
 from ultralytics import YOLO
 import cv2
 import numpy as np
 import base64
 
+from metrics import stage
+
 class SlotDetectionService:
     def __init__(self, model_path):
         """Initialize with pre-trained parking slot detection model"""
         self.model = YOLO(model_path)
+        # Requests run predict on threadpool threads; the predictor is not thread-safe
+        self.predict_lock = threading.Lock()
         self.class_names = {
             0: 'empty',
             1: 'occupied'
@@ -16,17 +22,19 @@ class SlotDetectionService:
         """Detect parking slots using pre-trained model"""
         # Convert bytes to numpy array
         np_arr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        with stage("slots_imdecode"):
+            image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
         
         if image is None:
             raise ValueError("Failed to decode image")
 
         # Run inference with pre-trained model
-        results = self.model.predict(
-            source=image,
-            conf=0.25,  # Confidence threshold
-            iou=0.45    # NMS IOU threshold
-        )
+        with self.predict_lock, stage("slots_yolo_predict"):
+            results = self.model.predict(
+                source=image,
+                conf=0.25,  # Confidence threshold
+                iou=0.45    # NMS IOU threshold
+            )
         detections = results[0]
 
         # Create annotated image
@@ -61,11 +69,12 @@ class SlotDetectionService:
             })
 
         # Encode annotated image
-        success, encoded_image = cv2.imencode(".png", annotated_img)
-        if not success:
-            raise ValueError("Failed to encode annotated image")
-        
-        b64_image = base64.b64encode(encoded_image.tobytes()).decode("utf-8")
+        with stage("slots_png_encode"):
+            success, encoded_image = cv2.imencode(".png", annotated_img)
+            if not success:
+                raise ValueError("Failed to encode annotated image")
+
+            b64_image = base64.b64encode(encoded_image.tobytes()).decode("utf-8")
 
         # Prepare results
         return {
@@ -0,0 +1,101 @@
+"""
+Shared helpers for the benchmark scripts: latency statistics, run metadata
+and result files.
+
+Every run writes benchmarks/results/<timestamp>-<commit>-<name>.json holding
+the commit, host and settings next to the numbers, so two runs can be
+compared with compare.py.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+PERCENTILES = (50, 90, 95, 99)
+
+# Allow running as `python benchmarks/<script>.py` from backend/
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+        return out + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+
+def environment() -> dict:
+    return {
+        "commit": git_commit(),
+        "host": socket.gethostname(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "time": datetime.utcnow().isoformat(timespec="seconds"),
+    }
+
+
+def latency_stats(samples_ms, elapsed_s: float = None, errors: int = 0) -> dict:
+    """Count, mean, percentiles and max of latencies in milliseconds (+ rate if elapsed is given)."""
+    arr = np.asarray(samples_ms, dtype=float)
+    stats = {"count": int(arr.size), "errors": int(errors)}
+    if arr.size:
+        stats["mean_ms"] = round(float(arr.mean()), 3)
+        for p, v in zip(PERCENTILES, np.percentile(arr, PERCENTILES)):
+            stats[f"p{p}_ms"] = round(float(v), 3)
+        stats["max_ms"] = round(float(arr.max()), 3)
+    if elapsed_s:
+        stats["throughput_rps"] = round((arr.size + errors) / elapsed_s, 2)
+    total = arr.size + errors
+    stats["error_rate"] = round(errors / total, 4) if total else 0.0
+    return stats
+
+
+def time_call(fn, repeat: int, warmup: int = 3) -> list:
+    """Latencies (ms) of `repeat` calls of fn() after `warmup` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def save_results(name: str, settings: dict, results: dict, path: str = None, summary: dict = None) -> str:
+    env = environment()
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{stamp}-{env['commit']}-{name}.json")
+    record = {"benchmark": name, "environment": env, "settings": settings, "results": results}
+    if summary is not None:
+        record["summary"] = summary
+    with open(path, "w") as f:
+        json.dump(record, f, indent=2)
+    return path
+
+
+def print_table(results: dict):
+    """One line per benchmark: count, latency columns, throughput and error rates."""
+    cols = ["count", "mean_ms"] + [f"p{p}_ms" for p in PERCENTILES] + ["max_ms", "throughput_rps",
+                                                                        "error_rate", "contention_rate"]
+    print(f"{'benchmark':<28}" + "".join(f"{c:>17}" for c in cols))
+    for name, stats in results.items():
+        print(f"{name:<28}" + "".join(f"{stats.get(c, ''):>17}" for c in cols))
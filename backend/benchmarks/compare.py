@@ -0,0 +1,67 @@
+"""
+Compare two benchmark result files (e.g. before and after a change).
+
+    python benchmarks/compare.py results/<before>.json results/<after>.json --threshold 10
+
+Prints each shared benchmark's p50/p95/p99, throughput and error rate with
+the relative change, and exits with status 1 when a latency percentile got
+slower (or throughput lower) by more than --threshold percent.
+"""
+
+import sys
+import json
+import argparse
+
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+KEYS = LATENCY_KEYS + ("throughput_rps", "error_rate", "contention_rate")
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(before: dict, after: dict, threshold: float) -> list:
+    """Print the comparison; returns the (benchmark, key, change%) regressions."""
+    regressions = []
+    print(f"before: {before['environment']['commit']} ({before['environment']['time']})")
+    print(f"after:  {after['environment']['commit']} ({after['environment']['time']})\n")
+    print(f"{'benchmark':<28}{'metric':<17}{'before':>12}{'after':>12}{'change':>10}")
+    for name in sorted(set(before["results"]) & set(after["results"])):
+        b, a = before["results"][name], after["results"][name]
+        for key in KEYS:
+            if key not in b and key not in a:
+                continue
+            pct = change(b.get(key), a.get(key))
+            flag = ""
+            if pct is not None and (
+                    (key in LATENCY_KEYS and pct > threshold) or
+                    (key == "throughput_rps" and pct < -threshold)):
+                flag = "  REGRESSION"
+                regressions.append((name, key, round(pct, 1)))
+            pct_text = f"{pct:+.1f}%" if pct is not None else "-"
+            print(f"{name:<28}{key:<17}{b.get(key, '-'):>12}{a.get(key, '-'):>12}{pct_text:>10}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    args = parser.parse_args()
+    before, after = load(args.before), load(args.after)
+    if before["settings"] != after["settings"]:
+        print("warning: the runs used different settings\n")
+    regressions = compare(before, after, args.threshold)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
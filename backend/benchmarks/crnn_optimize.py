@@ -0,0 +1,118 @@
+"""
+Parity and latency of Model.optimize_for_inference against the plain model.
+
+For each CRNN configuration, builds the model (random weights, with random
+BatchNorm statistics so folding is exercised, or --crnn-weights), copies it
+once per mode and checks that the optimized copy gives the same output as the
+plain one in eval mode:
+
+    plain            Model.eval(), as loaded before optimize_for_inference
+    fold             BN folding only
+    fold_cl          BN folding + channels_last (CRNN_OPTIMIZE=fold)
+    compile          fold_cl + torch.compile
+    freeze           fold_cl + torch.jit.trace/freeze
+
+A mode whose max absolute difference exceeds --tolerance fails the run
+(exit status 1); latency is reported for every mode that passes.
+
+    python benchmarks/crnn_optimize.py --configs TPS-ResNet-BiLSTM-Attn None-VGG-BiLSTM-CTC --batch 1 8
+"""
+
+import sys
+import copy
+import argparse
+
+from common import latency_stats, print_table, save_results, time_call
+from micro import crnn_options
+
+MODES = {
+    "fold": dict(channels_last=False),
+    "fold_cl": dict(channels_last=True),
+    "compile": dict(channels_last=True, compile=True),
+    "freeze": dict(channels_last=True, freeze=True),
+}
+
+
+def build_model(config: str, weights: str = None):
+    import torch
+    from model import Model
+
+    transformation, feature, sequence, prediction = config.split("-")
+    opt = crnn_options(argparse.Namespace(transformation=transformation, feature=feature,
+                                          sequence=sequence, prediction=prediction))
+    torch.manual_seed(0)
+    model = Model(opt)
+    if weights:
+        state = torch.load(weights, map_location="cpu")
+        model.load_state_dict({k.replace("module.", "", 1): v for k, v in state.items()})
+    else:
+        # Freshly initialised BNs are identities; give them something to fold
+        with torch.no_grad():
+            for module in model.modules():
+                if isinstance(module, torch.nn.BatchNorm2d):
+                    module.running_mean.normal_(0, 0.1)
+                    module.running_var.uniform_(0.5, 1.5)
+                    module.weight.uniform_(0.5, 1.5)
+                    module.bias.normal_(0, 0.1)
+    return model.eval(), opt
+
+
+def run(config: str, args) -> dict:
+    import torch
+
+    plain, opt = build_model(config, args.crnn_weights)
+    results = {}
+    for batch_size in args.batch:
+        batch = torch.rand(batch_size, opt.input_channel, opt.imgH, opt.imgW)
+        text = torch.zeros(batch_size, opt.batch_max_length + 1, dtype=torch.long)
+        with torch.no_grad():
+            expected = plain(batch, text, is_train=False)
+            results[f"{config}_b{batch_size}_plain"] = latency_stats(
+                time_call(lambda: plain(batch, text, is_train=False), args.repeat))
+        for mode in args.modes:
+            name = f"{config}_b{batch_size}_{mode}"
+            try:
+                model = copy.deepcopy(plain).optimize_for_inference(batch_size=batch_size, **MODES[mode])
+                with torch.no_grad():
+                    diff = (model(batch, text, is_train=False) - expected).abs().max().item()
+                    samples = time_call(lambda: model(batch, text, is_train=False), args.repeat) \
+                        if diff <= args.tolerance else []
+            except Exception as e:   # e.g. torch.compile without a compiler toolchain
+                print(f"skip {name}: {type(e).__name__}: {e}")
+                continue
+            results[name] = latency_stats(samples)
+            results[name].update(max_abs_diff=diff, parity=diff <= args.tolerance)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time CRNN Model.optimize_for_inference")
+    parser.add_argument("--configs", nargs="*", default=["TPS-ResNet-BiLSTM-Attn"],
+                        help="Transformation-FeatureExtraction-SequenceModeling-Prediction")
+    parser.add_argument("--modes", nargs="*", choices=list(MODES), default=["fold", "fold_cl", "freeze"])
+    parser.add_argument("--batch", nargs="*", type=int, default=[1])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--threads", type=int, help="torch.set_num_threads")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="Max absolute output difference")
+    parser.add_argument("--crnn-weights", help="Optional CRNN checkpoint (random weights otherwise)")
+    parser.add_argument("--output", help="Result file (default benchmarks/results/...)")
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    results = {}
+    for config in args.configs:
+        results.update(run(config, args))
+    print_table(results)
+    failed = [name for name, r in results.items() if r.get("parity") is False]
+    for name in failed:
+        print(f"PARITY FAILED {name}: max abs diff {results[name]['max_abs_diff']:.3g} > {args.tolerance}")
+    settings = {k: v for k, v in vars(args).items() if k != "output"}
+    print("\nSaved", save_results("crnn_optimize", settings, results, args.output))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
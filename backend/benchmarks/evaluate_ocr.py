@@ -0,0 +1,190 @@
+"""
+Accuracy/latency evaluation of plate preprocessing and OCR configurations.
+
+Runs every combination of the given preprocess_plate parameters and OCR
+cascades over a labeled set of plate crops, one configuration per worker
+process, and reports per configuration:
+
+    exact_match   share of crops read exactly as labeled
+    cer           character error rate (edit distance / label length, pooled)
+    p50/p95       latency of the whole crop -> text path and of every stage
+
+plus the Pareto front over (exact_match, p95 latency) and the fastest
+configuration that reaches --target-accuracy.
+
+The dataset is a directory of crops named <anything>_<PLATE>.jpg (the
+label is the last "_" field of the name), or a labels.csv beside them with
+"filename,plate" rows. Without --dataset, seeded synthetic crops are used.
+
+    python benchmarks/evaluate_ocr.py --dataset plates/ --bilateral 11,30,30 9,75,75 none \
+        --height-ratio 0.4 0.5 0.6 --dilate 0 2 --cascade tesseract_psm8,tesseract_psm7 tesseract_psm7
+"""
+
+import os
+import csv
+import time
+import argparse
+import itertools
+import multiprocessing
+from collections import defaultdict
+
+from common import latency_stats, save_results
+from frames import labeled_plate_crops
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_dataset(path: str) -> list:
+    """[(crop, label)] from a directory of labeled crops."""
+    import cv2
+
+    labels_file = os.path.join(path, "labels.csv")
+    if os.path.exists(labels_file):
+        with open(labels_file, newline="") as f:
+            labeled = [(row[0], row[1]) for row in csv.reader(f) if row and row[0] != "filename"]
+    else:
+        labeled = [(name, os.path.splitext(name)[0].rsplit("_", 1)[-1])
+                   for name in sorted(os.listdir(path)) if name.lower().endswith(IMAGE_EXTENSIONS)]
+    return [(cv2.imread(os.path.join(path, name), cv2.IMREAD_COLOR), label.strip().upper())
+            for name, label in labeled]
+
+
+def edit_distance(a: str, b: str) -> int:
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        row = [i]
+        for j, cb in enumerate(b, 1):
+            row.append(min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = row
+    return prev[-1]
+
+
+def parse_bilateral(value: str):
+    return None if value.lower() == "none" else tuple(int(v) for v in value.split(","))
+
+
+def config_name(config: dict) -> str:
+    bilateral = "none" if config["bilateral"] is None else "-".join(map(str, config["bilateral"]))
+    return (f"s{config['scale']}_bf{bilateral}_{config['threshold']}_h{config['min_height_ratio']}"
+            f"_d{config['dilate']}_{'+'.join(n.replace('tesseract_', '') for n in config['cascade'])}"
+            f"_c{config['min_confidence']}")
+
+
+# -------------------------------------------------------------------
+# Workers
+# -------------------------------------------------------------------
+_dataset = None
+_timings = defaultdict(list)   # stage -> latencies (ms) of the configuration being evaluated
+
+
+def init_worker(dataset_path: str, synthetic: int):
+    global _dataset
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")   # one Tesseract thread per worker
+    import cv2
+    from metrics import add_stage_observer
+
+    cv2.setNumThreads(1)
+    add_stage_observer(lambda name, seconds: _timings[name].append(seconds * 1000))
+    _dataset = load_dataset(dataset_path) if dataset_path else labeled_plate_crops(synthetic)
+
+
+def evaluate(config: dict) -> tuple:
+    from app.plate_service import preprocess_plate, read_plate
+
+    _timings.clear()
+    preprocess = {k: config[k] for k in ("scale", "bilateral", "threshold", "min_height_ratio", "dilate")}
+    exact = distance = characters = errors = 0
+    confidences, totals = [], []
+    for crop, label in _dataset:
+        started = time.perf_counter()
+        try:
+            read = read_plate(preprocess_plate(crop, **preprocess), config["cascade"],
+                              config["min_confidence"])
+        except Exception:
+            errors += 1
+            continue
+        totals.append((time.perf_counter() - started) * 1000)
+        exact += read["text"] == label
+        distance += edit_distance(read["text"], label)
+        characters += len(label)
+        confidences.append(read["confidence"])
+
+    result = latency_stats(totals, errors=errors)
+    result.update(
+        exact_match=round(exact / len(_dataset), 4) if _dataset else 0.0,
+        cer=round(distance / characters, 4) if characters else 1.0,
+        mean_confidence=round(sum(confidences) / len(confidences), 3) if confidences else 0.0,
+        stages={name: {k: v for k, v in latency_stats(samples).items() if k in ("count", "p50_ms", "p95_ms")}
+                for name, samples in sorted(_timings.items())},
+        config={**config, "cascade": ",".join(config["cascade"])},
+    )
+    return config_name(config), result
+
+
+# -------------------------------------------------------------------
+# Summary
+# -------------------------------------------------------------------
+def pareto_front(results: dict) -> list:
+    """Configurations no other beats on both exact match and p95 latency, fastest first."""
+    scored = [(name, r["exact_match"], r.get("p95_ms", float("inf"))) for name, r in results.items()]
+    front = [name for name, acc, p95 in scored
+             if not any((a >= acc and p < p95) or (a > acc and p <= p95) for _, a, p in scored)]
+    return sorted(front, key=lambda name: results[name].get("p95_ms", float("inf")))
+
+
+def print_summary(results: dict, front: list, target: float):
+    print(f"{'configuration':<58}{'exact':>8}{'cer':>8}{'p50_ms':>10}{'p95_ms':>10}")
+    for name, r in sorted(results.items(), key=lambda kv: (-kv[1]["exact_match"], kv[1].get("p95_ms", 0))):
+        mark = " *" if name in front else ""
+        print(f"{name:<58}{r['exact_match']:>8}{r['cer']:>8}{r.get('p50_ms', '-'):>10}"
+              f"{r.get('p95_ms', '-'):>10}{mark}")
+    print("\n* Pareto front (exact match vs p95 latency)")
+    eligible = [name for name in front if results[name]["exact_match"] >= target]
+    if eligible:
+        best = eligible[0]
+        print(f"Fastest configuration with exact match >= {target}: {best}")
+        for stage_name, s in results[best]["stages"].items():
+            print(f"    {stage_name:<20} p50 {s.get('p50_ms', '-'):>8} ms   p95 {s.get('p95_ms', '-'):>8} ms")
+    else:
+        print(f"No configuration reaches exact match >= {target}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate plate preprocessing/OCR configurations")
+    parser.add_argument("--dataset", help="Directory of labeled plate crops (default: synthetic crops)")
+    parser.add_argument("--synthetic", type=int, default=50, help="Synthetic crops when no --dataset")
+    parser.add_argument("--scale", nargs="*", type=float, default=[3])
+    parser.add_argument("--bilateral", nargs="*", type=parse_bilateral, default=[(11, 30, 30)],
+                        help='"d,sigmaColor,sigmaSpace" or "none"')
+    parser.add_argument("--threshold", nargs="*", choices=["otsu", "adaptive"], default=["otsu"])
+    parser.add_argument("--height-ratio", nargs="*", type=float, default=[0.5])
+    parser.add_argument("--dilate", nargs="*", type=int, default=[2])
+    parser.add_argument("--cascade", nargs="*", default=["tesseract_psm8,tesseract_psm7"],
+                        help="Comma-separated recognizer cascades")
+    parser.add_argument("--min-confidence", nargs="*", type=float, default=[0.8])
+    parser.add_argument("--target-accuracy", type=float, default=0.9)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", help="Result file (default benchmarks/results/...)")
+    args = parser.parse_args()
+
+    grid = [dict(scale=scale, bilateral=bilateral, threshold=threshold, min_height_ratio=ratio,
+                 dilate=dilate, cascade=cascade.split(","), min_confidence=confidence)
+            for scale, bilateral, threshold, ratio, dilate, cascade, confidence in itertools.product(
+                args.scale, args.bilateral, args.threshold, args.height_ratio, args.dilate,
+                args.cascade, args.min_confidence)]
+    print(f"Evaluating {len(grid)} configurations")
+
+    with multiprocessing.Pool(min(args.workers, len(grid)), initializer=init_worker,
+                              initargs=(args.dataset, args.synthetic)) as pool:
+        results = dict(pool.imap_unordered(evaluate, grid))
+
+    front = pareto_front(results)
+    print_summary(results, front, args.target_accuracy)
+    settings = {k: v for k, v in vars(args).items() if k not in ("output", "workers")}
+    summary = {"pareto_front": front,
+               "fastest_on_target": next((n for n in front if results[n]["exact_match"] >= args.target_accuracy), None)}
+    print("\nSaved", save_results("ocr_eval", settings, results, args.output, summary=summary))
+
+
+if __name__ == "__main__":
+    main()
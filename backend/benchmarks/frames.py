@@ -0,0 +1,93 @@
+"""
+Sample camera frames for the /predict_ocr and model benchmarks.
+
+Frames are read from benchmarks/frames/ (any .jpg/.jpeg/.png; drop real
+gate captures there). When it holds none, a fixed, seeded set of synthetic
+frames is generated into it: a vehicle-coloured box with a white plate and
+dark characters, so repeated runs and different machines time the same
+pixels.
+"""
+
+import os
+import glob
+import random
+
+import numpy as np
+
+from common import BENCH_DIR
+
+FRAMES_DIR = os.path.join(BENCH_DIR, "frames")
+FRAME_SIZE = (1280, 720)
+SYNTHETIC_COUNT = 8
+PLATE_CHARS = "ABCDEFGHJKLMNPRSTUVWXYZ"
+
+
+def synthetic_plate(rng: random.Random) -> str:
+    return "".join(rng.choice(PLATE_CHARS) for _ in range(rng.choice((2, 3)))) + \
+        "".join(rng.choice("0123456789") for _ in range(4))
+
+
+def synthesize(count: int = SYNTHETIC_COUNT, seed: int = 0, size=FRAME_SIZE) -> list:
+    """Write `count` synthetic frames to FRAMES_DIR; returns [(path, plate)]."""
+    import cv2
+
+    os.makedirs(FRAMES_DIR, exist_ok=True)
+    rng = random.Random(seed)
+    out = []
+    for i in range(count):
+        w, h = size
+        img = np.full((h, w, 3), 90, np.uint8)
+        img[h // 2:, :] = 60                                      # road
+        bx, by = rng.randint(100, w - 700), rng.randint(80, h - 480)
+        colour = tuple(rng.randint(40, 220) for _ in range(3))
+        cv2.rectangle(img, (bx, by), (bx + 600, by + 400), colour, -1)
+        px, py = bx + 180, by + 280
+        cv2.rectangle(img, (px, py), (px + 260, py + 70), (245, 245, 245), -1)
+        cv2.rectangle(img, (px, py), (px + 260, py + 70), (0, 0, 0), 2)
+        plate = synthetic_plate(rng)
+        cv2.putText(img, plate, (px + 12, py + 52), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (10, 10, 10), 4)
+        path = os.path.join(FRAMES_DIR, f"synthetic_{i:02d}_{plate}.jpg")
+        cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        out.append((path, plate))
+    return out
+
+
+def labeled_plate_crops(count: int = SYNTHETIC_COUNT, seed: int = 0) -> list:
+    """[(crop, plate)]: tight BGR plate crops (as cut from a detection box) and their text."""
+    import cv2
+
+    rng = random.Random(seed)
+    crops = []
+    for _ in range(count):
+        crop = np.full((70, 260, 3), 240, np.uint8)
+        plate = synthetic_plate(rng)
+        cv2.putText(crop, plate, (12, 52), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (10, 10, 10), 4)
+        noise = np.random.default_rng(rng.randint(0, 2**31)).normal(0, 12, crop.shape)
+        crops.append((np.clip(crop + noise, 0, 255).astype(np.uint8), plate))
+    return crops
+
+
+def plate_crops(count: int = SYNTHETIC_COUNT, seed: int = 0) -> list:
+    """Tight BGR plate crops for the preprocessing benchmark."""
+    return [crop for crop, _ in labeled_plate_crops(count, seed)]
+
+
+def frame_paths() -> list:
+    paths = sorted(p for ext in ("jpg", "jpeg", "png")
+                   for p in glob.glob(os.path.join(FRAMES_DIR, f"*.{ext}")))
+    return paths or [p for p, _ in synthesize()]
+
+
+def load_frame_bytes() -> list:
+    """Encoded frames as uploaded by the camera client."""
+    out = []
+    for path in frame_paths():
+        with open(path, "rb") as f:
+            out.append((os.path.basename(path), f.read()))
+    return out
+
+
+def load_frames() -> list:
+    """Decoded BGR frames for the model micro-benchmarks."""
+    import cv2
+    return [cv2.imread(p, cv2.IMREAD_COLOR) for p in frame_paths()]
@@ -0,0 +1,192 @@
+"""
+asyncio load generator for the booking and inference API.
+
+Each virtual user registers and logs in once, then loops until the run
+ends, picking an action by weight:
+
+    session   POST /slots/book -> /slots/park -> /slots/clear on a random
+              slot of its vehicle type (users compete for the same slots)
+    list      GET /slots
+    login     POST /login
+    ocr       POST /predict_ocr with one of the sample frames (synthetic
+              unless benchmarks/frames/ holds real captures, see frames.py;
+              synthetic frames time the pipeline, not OCR accuracy)
+
+Per endpoint it reports latency percentiles of successful calls,
+throughput, contention (4xx business rejections such as "slot not free")
+and error rates (5xx, timeouts, connection failures).
+
+    python benchmarks/load_test.py --url http://localhost:8000 --users 50 --duration 30
+    python benchmarks/load_test.py --in-process     # serve main.app in this process
+
+MONGO_URI defaults to mongomock, so --in-process needs no mongod (main.py
+still loads its YOLO weights); remote runs never connect to it.
+"""
+
+import os
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+
+from common import latency_stats, print_table, save_results
+from frames import load_frame_bytes
+
+# Importing the backend needs a MONGO_URI; its handles are lazy, so nothing connects
+os.environ.setdefault("MONGO_URI", "mongomock://localhost/parking_bench")
+from parking_slot_crud import ALLOWED_RANGES
+
+DEFAULT_MIX = "session=6,list=3,login=1,ocr=0"
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.contention = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint: str, started: float, status: int):
+        if 200 <= status < 300:
+            self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+        elif 400 <= status < 500:
+            self.contention[endpoint] += 1
+        else:
+            self.errors[endpoint] += 1
+
+    def results(self, elapsed: float) -> dict:
+        out = {}
+        for endpoint in sorted(set(self.latencies) | set(self.contention) | set(self.errors)):
+            stats = latency_stats(self.latencies[endpoint], elapsed, self.errors[endpoint])
+            rejected = self.contention[endpoint]
+            total = stats["count"] + stats["errors"] + rejected
+            stats["contention"] = rejected
+            stats["contention_rate"] = round(rejected / total, 4) if total else 0.0
+            stats["throughput_rps"] = round(total / elapsed, 2)
+            out[endpoint] = stats
+        return out
+
+
+class VirtualUser:
+    def __init__(self, client, recorder: Recorder, index: int, run_id: str,
+                 frames: list, idempotency: bool):
+        self.client, self.recorder = client, recorder
+        self.username = f"bench_{run_id}_{index}"
+        self.plate = f"B{run_id[:4].upper()}{index:05d}"
+        self.vehicle_type = random.choice(list(ALLOWED_RANGES))
+        self.frames = frames
+        self.idempotency = idempotency
+
+    async def call(self, endpoint: str, method: str, path: str, **kwargs):
+        if self.idempotency and method == "POST" and path.startswith("/slots/"):
+            kwargs.setdefault("headers", {})["Idempotency-Key"] = uuid.uuid4().hex
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            status = response.status_code
+        except Exception:
+            response, status = None, 599
+        self.recorder.record(endpoint, started, status)
+        return response
+
+    async def setup(self):
+        body = {"username": self.username, "vehicle_plate": self.plate}
+        await self.call("register", "POST", "/register", json=body)
+
+    async def session(self):
+        low, high = ALLOWED_RANGES[self.vehicle_type]
+        slot_id = random.randint(low, high)
+        action = {"slot_id": slot_id, "vehicle_plate": self.plate,
+                  "username": self.username, "vehicle_type": self.vehicle_type}
+        booked = await self.call("book", "POST", "/slots/book", json=action)
+        if booked is None or booked.status_code != 200:
+            return
+        parked = await self.call("park", "POST", "/slots/park", json=action)
+        if parked is None or parked.status_code != 200:
+            return
+        await self.call("clear", "POST", "/slots/clear",
+                        json={"slot_id": slot_id, "username": self.username})
+
+    async def list_slots(self):
+        await self.call("list", "GET", "/slots")
+
+    async def login(self):
+        await self.call("login", "POST", "/login",
+                        json={"username": self.username, "vehicle_plate": self.plate})
+
+    async def ocr(self):
+        name, data = random.choice(self.frames)
+        await self.call("predict_ocr", "POST", "/predict_ocr",
+                        files={"file": (name, data, "image/jpeg")})
+
+    async def run(self, mix: dict, deadline: float, think_time: float):
+        actions = {"session": self.session, "list": self.list_slots,
+                   "login": self.login, "ocr": self.ocr}
+        names = [n for n, w in mix.items() if w > 0]
+        weights = [mix[n] for n in names]
+        await self.setup()
+        while time.perf_counter() < deadline:
+            await actions[random.choices(names, weights)[0]]()
+            if think_time:
+                await asyncio.sleep(random.expovariate(1 / think_time))
+
+
+def parse_mix(spec: str) -> dict:
+    return {k.strip(): float(v) for k, v in (part.split("=") for part in spec.split(","))}
+
+
+async def run_load(client, users: int, duration: float, mix: dict, think_time: float,
+                   idempotency: bool, seed: int) -> dict:
+    random.seed(seed)
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    frames = load_frame_bytes() if mix.get("ocr") else []
+    vus = [VirtualUser(client, recorder, i, run_id, frames, idempotency) for i in range(users)]
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(vu.run(mix, deadline, think_time) for vu in vus))
+    return recorder.results(time.perf_counter() - started)
+
+
+async def main_async(args) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    kwargs = {"timeout": args.timeout, "limits": limits}
+    mix = parse_mix(args.mix)
+    if not args.in_process:
+        async with httpx.AsyncClient(base_url=args.url, **kwargs) as client:
+            return await run_load(client, args.users, args.duration, mix, args.think_time,
+                                  args.idempotency, args.seed)
+
+    from main import app
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", **kwargs) as client:
+            return await run_load(client, args.users, args.duration, mix, args.think_time,
+                                  args.idempotency, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the parking API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--in-process", action="store_true", help="Serve main.app in this process")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Action weights (default {DEFAULT_MIX})")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between actions (s)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--idempotency", action="store_true", help="Send Idempotency-Key headers")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Result file (default benchmarks/results/...)")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print_table(results)
+    settings = {k: v for k, v in vars(args).items() if k != "output"}
+    print("\nSaved", save_results("load", settings, results, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Micro-benchmarks for the inference path, one stage at a time.
+
+    preprocess   app.plate_service.preprocess_plate on synthetic plate crops
+    tesseract    app.plate_service.read_plate (needs the tesseract binary)
+    crnn         the CRNN Model stages (Transformation, FeatureExtraction,
+                 SequenceModeling, Prediction) and a full forward pass on a
+                 random batch, for the configuration given on the command line
+    yolo         YOLO predict on the sample frames for each --imgsz, as-is and
+                 letterboxed beforehand (PLATE_PIPELINE=two_stage)
+    serialize    encoding --slots slot documents for GET /slots: jsonable_encoder +
+                 json.dumps (FastAPI's default) vs responses.APIResponse (orjson,
+                 and MessagePack when installed)
+
+    python benchmarks/micro.py                      # everything whose dependencies are installed
+    python benchmarks/micro.py --only crnn --batch 8 --feature ResNet
+"""
+
+import os
+import argparse
+import itertools
+
+from common import BACKEND_DIR, latency_stats, print_table, save_results, time_call
+from frames import load_frames, plate_crops
+
+
+def bench_preprocess(args) -> dict:
+    from app.plate_service import preprocess_plate
+    crops = plate_crops()
+    i = itertools.count()
+    samples = time_call(lambda: preprocess_plate(crops[next(i) % len(crops)]), args.repeat)
+    return {"preprocess_plate": latency_stats(samples)}
+
+
+def bench_tesseract(args) -> dict:
+    from app.plate_service import preprocess_plate, read_plate
+    masks = [preprocess_plate(c) for c in plate_crops()]
+    i = itertools.count()
+    samples = time_call(lambda: read_plate(masks[next(i) % len(masks)]), max(args.repeat // 10, 5), warmup=1)
+    return {"tesseract_read_plate": latency_stats(samples)}
+
+
+def crnn_options(args):
+    character = "0123456789abcdefghijklmnopqrstuvwxyz"
+    num_class = len(character) + (2 if args.prediction == "Attn" else 1)
+    return argparse.Namespace(
+        Transformation=args.transformation, FeatureExtraction=args.feature,
+        SequenceModeling=args.sequence, Prediction=args.prediction,
+        num_fiducial=20, imgH=32, imgW=100, input_channel=1, output_channel=512,
+        hidden_size=256, num_class=num_class, batch_max_length=25)
+
+
+def bench_crnn(args) -> dict:
+    import torch
+    from model import Model
+
+    torch.manual_seed(0)
+    opt = crnn_options(args)
+    model = Model(opt).eval()
+    if args.crnn_weights:
+        state = torch.load(args.crnn_weights, map_location="cpu")
+        model.load_state_dict({k.replace("module.", "", 1): v for k, v in state.items()})
+    batch = torch.rand(args.batch, opt.input_channel, opt.imgH, opt.imgW)
+    text = torch.zeros(args.batch, opt.batch_max_length + 1, dtype=torch.long)
+    results = {}
+
+    with torch.no_grad():
+        x = batch
+        if opt.Transformation == "TPS":
+            results["crnn_transformation"] = latency_stats(time_call(lambda: model.Transformation(batch), args.repeat))
+            x = model.Transformation(batch)
+        results["crnn_feature_extraction"] = latency_stats(time_call(lambda: model.FeatureExtraction(x), args.repeat))
+        feature = model.AdaptiveAvgPool(model.FeatureExtraction(x).permute(0, 3, 1, 2)).squeeze(3)
+        context = feature
+        if opt.SequenceModeling == "BiLSTM":
+            results["crnn_sequence_modeling"] = latency_stats(time_call(lambda: model.SequenceModeling(feature), args.repeat))
+            context = model.SequenceModeling(feature).contiguous()
+        if opt.Prediction == "CTC":
+            predict = lambda: model.Prediction(context)
+        else:
+            predict = lambda: model.Prediction(context, text, False, batch_max_length=opt.batch_max_length)
+        results["crnn_prediction"] = latency_stats(time_call(predict, args.repeat))
+        results["crnn_forward"] = latency_stats(time_call(lambda: model(batch, text, is_train=False), args.repeat))
+    return results
+
+
+def bench_yolo(args) -> dict:
+    from ultralytics import YOLO
+    from app.plate_service import letterbox
+
+    frames = load_frames()
+    results = {}
+    for weights in args.yolo_weights:
+        path = weights if os.path.isabs(weights) else os.path.join(BACKEND_DIR, weights)
+        if not os.path.exists(path):
+            print(f"skip yolo {weights}: file not found")
+            continue
+        model = YOLO(path)
+        for imgsz in args.imgsz:
+            i = itertools.count()
+            predict = lambda: model.predict(frames[next(i) % len(frames)], imgsz=imgsz, conf=0.25, verbose=False)
+            results[f"yolo_{os.path.basename(weights)}_{imgsz}"] = latency_stats(time_call(predict, args.repeat))
+            # Two-stage pipeline: letterbox first (INTER_AREA), so predict does no resizing
+            boxed = lambda: letterbox(frames[next(i) % len(frames)], imgsz)[0]
+            predict = lambda: model.predict(boxed(), imgsz=imgsz, conf=0.25, verbose=False)
+            results[f"yolo_{os.path.basename(weights)}_{imgsz}_letterbox"] = latency_stats(time_call(predict, args.repeat))
+    return results
+
+
+def bench_serialize(args) -> dict:
+    import json
+    from datetime import datetime, timedelta
+    from fastapi.encoders import jsonable_encoder
+    from parking_slot_crud import new_slot_doc
+    from responses import dumps, msgpack, packb
+
+    now = datetime.utcnow()
+    slots = [dict(new_slot_doc(i), status="parked", parked_vehicle_plate=f"CAB{i:04d}",
+                  booked_time=now - timedelta(hours=1), parked_time=now) for i in range(1, args.slots + 1)]
+    results = {
+        "serialize_jsonable_encoder": latency_stats(time_call(
+            lambda: json.dumps(jsonable_encoder(slots)).encode(), args.repeat)),
+        "serialize_orjson": latency_stats(time_call(lambda: dumps(slots), args.repeat)),
+    }
+    if msgpack is not None:
+        results["serialize_msgpack"] = latency_stats(time_call(lambda: packb(slots), args.repeat))
+    return results
+
+
+BENCHMARKS = {"preprocess": bench_preprocess, "tesseract": bench_tesseract,
+              "crnn": bench_crnn, "yolo": bench_yolo, "serialize": bench_serialize}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for plate preprocessing and models")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="Subset to run")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--threads", type=int, help="torch.set_num_threads")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--transformation", default="TPS", choices=["TPS", "None"])
+    parser.add_argument("--feature", default="ResNet", choices=["VGG", "RCNN", "ResNet"])
+    parser.add_argument("--sequence", default="BiLSTM", choices=["BiLSTM", "None"])
+    parser.add_argument("--prediction", default="Attn", choices=["Attn", "CTC"])
+    parser.add_argument("--crnn-weights", help="Optional CRNN checkpoint (random weights otherwise)")
+    parser.add_argument("--yolo-weights", nargs="*", default=["best5.pt", "parking.pt"])
+    parser.add_argument("--imgsz", nargs="*", type=int, default=[640])
+    parser.add_argument("--slots", type=int, default=1000, help="Slot documents per serialize call")
+    parser.add_argument("--output", help="Result file (default benchmarks/results/...)")
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        try:
+            results.update(BENCHMARKS[name](args))
+        except ImportError as e:
+            print(f"skip {name}: {e}")
+        except Exception as e:
+            print(f"{name} failed: {e}")
+    print_table(results)
+    settings = {k: v for k, v in vars(args).items() if k != "output"}
+    print("\nSaved", save_results("micro", settings, results, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Memory per API worker: pre-forked (serve.py) vs independent (uvicorn --workers).
+
+For every mode and worker count, starts the server, waits until it answers,
+optionally sends --warmup /predict_ocr requests so every worker has run
+inference, then reads /proc/<pid>/smaps_rollup of the server and its
+workers (Linux only):
+
+    pss_mb          proportional set size; shared pages are split between
+                    the processes mapping them, so the sum is the real total
+    private_mb      pages only this process maps (what each extra worker costs)
+    shared_mb       pages shared with other processes (model weights when pre-forked)
+
+and the marginal PSS of one more worker between consecutive counts.
+
+    python benchmarks/worker_memory.py --workers 1 2 4 8 --warmup 20
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+
+from common import BACKEND_DIR, save_results
+from frames import load_frame_bytes
+
+MODES = {
+    "prefork": lambda n, port: [sys.executable, "serve.py", "--workers", str(n), "--port", str(port),
+                                "--host", "127.0.0.1", "--log-level", "warning"],
+    "independent": lambda n, port: [sys.executable, "-m", "uvicorn", "main:app", "--workers", str(n),
+                                    "--port", str(port), "--host", "127.0.0.1", "--log-level", "warning"],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def children(pid: int) -> list:
+    """Direct child pids, from /proc/<pid>/task/*/children."""
+    out = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            out.extend(int(p) for p in f.read().split())
+    return out
+
+
+def is_worker(pid: int) -> bool:
+    with open(f"/proc/{pid}/cmdline", "rb") as f:
+        return b"resource_tracker" not in f.read()
+
+
+def smaps(pid: int) -> dict:
+    """Memory of one process in MB from /proc/<pid>/smaps_rollup."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": round(values.get("Rss", 0), 1),
+        "pss_mb": round(values.get("Pss", 0), 1),
+        "private_mb": round(values.get("Private_Clean", 0) + values.get("Private_Dirty", 0), 1),
+        "shared_mb": round(values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0), 1),
+    }
+
+
+def wait_ready(url: str, timeout: float) -> bool:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url + "/metrics", timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def warm_up(url: str, requests: int):
+    import httpx
+
+    frames = load_frame_bytes()
+    with httpx.Client(timeout=60) as client:
+        for i in range(requests):
+            name, data = frames[i % len(frames)]
+            # New connections so the kernel spreads them over the workers
+            client.post(url + "/predict_ocr", files={"file": (name, data, "image/jpeg")},
+                        headers={"Connection": "close"})
+
+
+def measure(mode: str, workers: int, warmup: int, timeout: float) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(MODES[mode](workers, port), cwd=BACKEND_DIR)
+    try:
+        if not wait_ready(url, timeout):
+            raise RuntimeError(f"{mode} server with {workers} workers did not start")
+        # Let every worker finish its lifespan start-up
+        deadline = time.monotonic() + timeout
+        while len([p for p in children(server.pid) if is_worker(p)]) < workers and time.monotonic() < deadline:
+            time.sleep(0.5)
+        time.sleep(2)
+        if warmup:
+            warm_up(url, warmup)
+        pids = [p for p in children(server.pid) if is_worker(p)]
+        parent = smaps(server.pid)
+        per_worker = [smaps(p) for p in pids]
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    total_pss = parent["pss_mb"] + sum(w["pss_mb"] for w in per_worker)
+    return {
+        "workers": len(per_worker),
+        "total_pss_mb": round(total_pss, 1),
+        "parent": parent,
+        "worker_pss_mb": round(sum(w["pss_mb"] for w in per_worker) / max(len(per_worker), 1), 1),
+        "worker_private_mb": round(sum(w["private_mb"] for w in per_worker) / max(len(per_worker), 1), 1),
+        "worker_shared_mb": round(sum(w["shared_mb"] for w in per_worker) / max(len(per_worker), 1), 1),
+        "worker_rss_mb": round(sum(w["rss_mb"] for w in per_worker) / max(len(per_worker), 1), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory per API worker process")
+    parser.add_argument("--modes", nargs="*", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--workers", nargs="*", type=int, default=[1, 2, 4])
+    parser.add_argument("--warmup", type=int, default=0, help="/predict_ocr requests before measuring")
+    parser.add_argument("--timeout", type=float, default=180, help="Seconds to wait for start-up")
+    parser.add_argument("--output", help="Result file (default benchmarks/results/...)")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'run':<18}{'total_pss_mb':>14}{'worker_pss':>12}{'private':>10}{'shared':>10}{'marginal_mb':>13}")
+    for mode in args.modes:
+        previous = None
+        for n in sorted(set(args.workers)):
+            r = measure(mode, n, args.warmup, args.timeout)
+            if previous is not None:
+                r["marginal_mb"] = round((r["total_pss_mb"] - previous["total_pss_mb"]) /
+                                         (r["workers"] - previous["workers"]), 1)
+            previous = results[f"{mode}_{n}"] = r
+            print(f"{mode + '_' + str(n):<18}{r['total_pss_mb']:>14}{r['worker_pss_mb']:>12}"
+                  f"{r['worker_private_mb']:>10}{r['worker_shared_mb']:>10}{r.get('marginal_mb', '-'):>13}")
+    settings = {k: v for k, v in vars(args).items() if k != "output"}
+    print("\nSaved", save_results("worker_memory", settings, results, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# booking_expiry.py
+
+import os
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import parking_slot_crud as crud
+
+logger = logging.getLogger(__name__)
+
+BOOKING_TTL_MINUTES = float(os.getenv("BOOKING_TTL_MINUTES", "15"))
+
+
+class BookingExpiryScheduler:
+    """
+    Releases "booked" slots that are not parked within `ttl`.
+
+    Deadlines live in a min-heap ordered by expiry time, so the worker thread
+    only wakes up when the earliest booking is due instead of scanning slots.
+    Entries for bookings that were parked or cleared in this process are
+    dropped lazily; the conditional update in crud.expire_booking() makes the
+    release a no-op for anything that changed in another worker.
+    """
+
+    def __init__(self, ttl_minutes: float = BOOKING_TTL_MINUTES):
+        self.ttl = timedelta(minutes=ttl_minutes)
+        self._heap = []      # (expires_at, slot_id, plate, booked_time)
+        self._live = {}      # slot_id -> booked_time of the booking we are tracking
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    # ---------------------------------------------------------------
+    # Scheduling
+    # ---------------------------------------------------------------
+    def schedule(self, slot_id: int, plate: str, booked_time: datetime):
+        with self._cond:
+            self._live[slot_id] = booked_time
+            heapq.heappush(self._heap, (booked_time + self.ttl, slot_id, plate, booked_time))
+            self._cond.notify()
+
+    def cancel(self, slot_id: int):
+        with self._cond:
+            self._live.pop(slot_id, None)
+
+    def on_slot_event(self, event: dict):
+        if event["event"] == "booked":
+            self.schedule(event["slot_id"], event["plate"], event["booked_time"])
+        elif event["event"] in ("parked", "cleared", "expired"):
+            self.cancel(event["slot_id"])
+
+    # ---------------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------------
+    def load_existing(self) -> int:
+        """Schedule bookings that already exist (e.g. made before a restart)."""
+        now = datetime.utcnow()
+        # Bookings made before timestamps were recorded start their TTL now
+        crud.slots.update_many({"status": "booked", "booked_time": None},
+                               {"$set": {"booked_time": now}})
+        booked = crud.get_booked_slots()
+        for doc in booked:
+            self.schedule(doc["slot_id"], doc["parked_vehicle_plate"], doc["booked_time"])
+        return len(booked)
+
+    def start(self) -> "BookingExpiryScheduler":
+        crud.add_slot_listener(self.on_slot_event)
+        count = self.load_existing()
+        logger.info("Booking expiry scheduler tracking %d bookings (TTL %s)", count, self.ttl)
+        self._thread = threading.Thread(target=self._run, name="booking-expiry", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _pop_due(self) -> list:
+        """Wait until at least one booking is due and return all due entries."""
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                timeout = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                    continue
+                now = datetime.utcnow()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    _, slot_id, plate, booked_time = heapq.heappop(self._heap)
+                    if self._live.get(slot_id) == booked_time:
+                        del self._live[slot_id]
+                        due.append((slot_id, plate, booked_time))
+                if due:
+                    return due
+            return []
+
+    def _run(self):
+        while not self._stopped:
+            for slot_id, plate, booked_time in self._pop_due():
+                try:
+                    if crud.expire_booking(slot_id, plate, booked_time):
+                        logger.info("Released expired booking of slot %s by %s", slot_id, plate)
+                except Exception as e:
+                    logger.error("Failed to expire booking of slot %s: %s", slot_id, e)
@@ -0,0 +1,362 @@
+# coordination.py
+
+"""
+Cross-worker coordination: named locks and a cache-invalidation bus.
+
+The backend is chosen by COORDINATION_URL, the same way db.py picks its
+client:
+
+    local://                 in-process only (default; one worker)
+    mongodb://               leases in the coordination_locks collection of
+                             the shared database, messages polled from
+                             coordination_messages
+    redis://host:port/db     SET NX PX locks and Redis pub/sub
+    fakeredis://             in-memory Redis stand-in for local runs and tests
+
+Locks are leases: they expire after `ttl` seconds even if the holder dies.
+Published messages reach local subscribers at once and other workers via a
+background sender, so publishing never blocks a request on the network.
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import socket
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, ReturnDocument, errors
+
+logger = logging.getLogger(__name__)
+
+COORDINATION_URL = os.getenv("COORDINATION_URL", "local://")
+LOCK_TTL_SECONDS = float(os.getenv("LOCK_TTL_SECONDS", "10"))
+LOCK_WAIT_SECONDS = float(os.getenv("LOCK_WAIT_SECONDS", "5"))
+LOCK_RETRY_SECONDS = float(os.getenv("LOCK_RETRY_SECONDS", "0.02"))
+COORDINATION_POLL_SECONDS = float(os.getenv("COORDINATION_POLL_SECONDS", "0.5"))
+MESSAGE_TTL_SECONDS = int(os.getenv("COORDINATION_MESSAGE_TTL_SECONDS", "300"))
+# Senders reserve sequence numbers before inserting, so a message can land
+# after a later one; pollers re-read this many sequence numbers back.
+MESSAGE_REORDER_WINDOW = int(os.getenv("COORDINATION_MESSAGE_REORDER_WINDOW", "1000"))
+
+# Identifies this process so it can skip its own messages coming back
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Coordinator:
+    """Base class: lock bookkeeping and local dispatch shared by all backends."""
+
+    # Whether acquire/release do network I/O (then alock runs them in a thread)
+    blocking_io = True
+
+    def __init__(self):
+        self._subscribers = {}
+        self._outbox = queue.Queue()
+        self._sender = None
+
+    # ---------------------------------------------------------------
+    # Backend primitives
+    # ---------------------------------------------------------------
+    def acquire(self, name: str, token: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    def release(self, name: str, token: str):
+        raise NotImplementedError
+
+    def _send(self, messages: list):
+        """Deliver messages to other workers."""
+
+    def _listen(self):
+        """Start receiving other workers' messages."""
+
+    # ---------------------------------------------------------------
+    # Locks
+    # ---------------------------------------------------------------
+    def _busy(self, name: str):
+        raise ValueError(f"{name} is busy, please retry")
+
+    @contextmanager
+    def lock(self, name: str, ttl: float = LOCK_TTL_SECONDS, wait: float = LOCK_WAIT_SECONDS):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + wait
+        while not self.acquire(name, token, ttl):
+            if time.monotonic() >= deadline:
+                self._busy(name)
+            time.sleep(LOCK_RETRY_SECONDS)
+        try:
+            yield token
+        finally:
+            self.release(name, token)
+
+    @asynccontextmanager
+    async def alock(self, name: str, ttl: float = LOCK_TTL_SECONDS, wait: float = LOCK_WAIT_SECONDS):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + wait
+        run = asyncio.to_thread if self.blocking_io else _call
+        while not await run(self.acquire, name, token, ttl):
+            if time.monotonic() >= deadline:
+                self._busy(name)
+            await asyncio.sleep(LOCK_RETRY_SECONDS)
+        try:
+            yield token
+        finally:
+            await run(self.release, name, token)
+
+    # ---------------------------------------------------------------
+    # Invalidation bus
+    # ---------------------------------------------------------------
+    def subscribe(self, channel: str, fn):
+        """Call fn(message) for every message on channel, local or remote."""
+        if not self._subscribers:
+            self._listen()
+        self._subscribers.setdefault(channel, []).append(fn)
+        return fn
+
+    def publish(self, channel: str, message: dict):
+        self._dispatch(channel, message)
+        if self._sender is None:
+            self._sender = threading.Thread(target=self._run_sender, name="coordination-sender",
+                                            daemon=True)
+            self._sender.start()
+        self._outbox.put({"channel": channel, "origin": ORIGIN, "message": message})
+
+    def _dispatch(self, channel: str, message: dict):
+        for fn in list(self._subscribers.get(channel, ())):
+            try:
+                fn(message)
+            except Exception as e:
+                logger.error("Subscriber %r failed on %s: %s", fn, channel, e)
+
+    def _receive(self, envelope: dict):
+        if envelope.get("origin") != ORIGIN:
+            self._dispatch(envelope["channel"], envelope["message"])
+
+    def _run_sender(self):
+        while True:
+            batch = [self._outbox.get()]
+            while not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            try:
+                self._send(batch)
+            except Exception as e:
+                logger.error("Failed to publish %d coordination messages: %s", len(batch), e)
+
+
+async def _call(fn, *args):
+    return fn(*args)
+
+
+# -------------------------------------------------------------------
+# In-process
+# -------------------------------------------------------------------
+class LocalCoordinator(Coordinator):
+    """Single-process locks and bus; enough for one worker."""
+
+    blocking_io = False
+
+    def __init__(self):
+        super().__init__()
+        self._locks = {}
+        self._mutex = threading.Lock()
+
+    def acquire(self, name, token, ttl):
+        now = time.monotonic()
+        with self._mutex:
+            held = self._locks.get(name)
+            if held and held[1] > now and held[0] != token:
+                return False
+            self._locks[name] = (token, now + ttl)
+            return True
+
+    def release(self, name, token):
+        with self._mutex:
+            if self._locks.get(name, (None,))[0] == token:
+                del self._locks[name]
+
+    def publish(self, channel, message):
+        self._dispatch(channel, message)
+
+
+# -------------------------------------------------------------------
+# MongoDB leases
+# -------------------------------------------------------------------
+class MongoCoordinator(Coordinator):
+    """
+    Leases are documents {_id: name, token, expires_at}; taking one is a
+    single upsert that only matches an expired or own lease, so a live
+    lease held elsewhere surfaces as a duplicate key. Messages are appended
+    to coordination_messages (TTL-expired) with a sequence number reserved
+    from a $inc counter, and polled by sequence. ObjectIds are not ordered
+    across processes, so they cannot serve as the poll cursor.
+    """
+
+    SEQ_ID = "coordination_messages"
+
+    def __init__(self, database=None):
+        super().__init__()
+        if database is None:
+            from db import get_db
+            database = get_db()
+        self.locks = database.coordination_locks
+        self.messages = database.coordination_messages
+        self.sequences = database.coordination_sequences
+        self.locks.create_index("expires_at", expireAfterSeconds=0)
+        self.messages.create_index("created_at", expireAfterSeconds=MESSAGE_TTL_SECONDS)
+        self.messages.create_index([("seq", ASCENDING)])
+
+    def acquire(self, name, token, ttl):
+        now = datetime.utcnow()
+        try:
+            self.locks.update_one(
+                {"_id": name, "$or": [{"expires_at": {"$lte": now}}, {"token": token}]},
+                {"$set": {"token": token, "expires_at": now + timedelta(seconds=ttl)}},
+                upsert=True
+            )
+            return True
+        except errors.DuplicateKeyError:
+            return False
+
+    def release(self, name, token):
+        self.locks.delete_one({"_id": name, "token": token})
+
+    def _send(self, messages):
+        now = datetime.utcnow()
+        counter = self.sequences.find_one_and_update(
+            {"_id": self.SEQ_ID}, {"$inc": {"seq": len(messages)}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        first = counter["seq"] - len(messages) + 1
+        self.messages.insert_many([dict(m, created_at=now, seq=first + i) for i, m in enumerate(messages)],
+                                  ordered=False)
+
+    def _listen(self):
+        counter = self.sequences.find_one({"_id": self.SEQ_ID})
+        self._last_seq = counter["seq"] if counter else 0
+        # Messages already in the window predate this listener
+        self._seen = {m["seq"] for m in self.messages.find(
+            {"seq": {"$gt": self._last_seq - MESSAGE_REORDER_WINDOW}}, {"seq": 1})}
+
+        def _poll():
+            while True:
+                try:
+                    self._drain()
+                except Exception as e:
+                    logger.error("Coordination message poll failed: %s", e)
+                time.sleep(COORDINATION_POLL_SECONDS)
+
+        threading.Thread(target=_poll, name="coordination-poll", daemon=True).start()
+
+    def _drain(self):
+        """Deliver every unseen message; re-reads the reorder window for late inserts."""
+        floor = self._last_seq - MESSAGE_REORDER_WINDOW
+        for envelope in self.messages.find({"seq": {"$gt": floor}}).sort("seq", 1):
+            seq = envelope["seq"]
+            if seq in self._seen:
+                continue
+            self._seen.add(seq)
+            self._last_seq = max(self._last_seq, seq)
+            self._receive(envelope)
+        floor = self._last_seq - MESSAGE_REORDER_WINDOW
+        self._seen = {seq for seq in self._seen if seq > floor}
+
+
+# -------------------------------------------------------------------
+# Redis protocol
+# -------------------------------------------------------------------
+class RedisCoordinator(Coordinator):
+    """SET NX PX leases with compare-and-delete release, and Redis pub/sub."""
+
+    PREFIX = "parking:"
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def acquire(self, name, token, ttl):
+        key = self.PREFIX + "lock:" + name
+        if self.client.set(key, token, nx=True, px=int(ttl * 1000)):
+            return True
+        return self.client.get(key) == token.encode()
+
+    def release(self, name, token):
+        from redis.exceptions import WatchError
+        key = self.PREFIX + "lock:" + name
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) == token.encode():
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.execute()
+                else:
+                    pipe.unwatch()
+            except WatchError:
+                pass   # lease expired and was taken over meanwhile
+
+    def _send(self, messages):
+        with self.client.pipeline(transaction=False) as pipe:
+            for m in messages:
+                pipe.publish(self.PREFIX + m["channel"], json.dumps(m, default=str))
+            pipe.execute()
+
+    def _listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.PREFIX + "*")
+
+        def _loop():
+            while True:
+                try:
+                    for msg in pubsub.listen():
+                        if msg["type"] == "pmessage":
+                            self._receive(json.loads(msg["data"]))
+                except Exception as e:
+                    logger.error("Redis subscription failed, resubscribing: %s", e)
+                    time.sleep(COORDINATION_POLL_SECONDS)
+
+        threading.Thread(target=_loop, name="coordination-redis", daemon=True).start()
+
+
+# -------------------------------------------------------------------
+# Process-wide instance
+# -------------------------------------------------------------------
+_coordinator = None
+_lock = threading.Lock()
+
+
+def create_coordinator(url: str = COORDINATION_URL) -> Coordinator:
+    scheme = url.split("://", 1)[0]
+    if scheme == "local":
+        return LocalCoordinator()
+    if scheme in ("mongodb", "mongodb+srv", "mongo"):
+        return MongoCoordinator()
+    if scheme in ("redis", "rediss"):
+        import redis
+        return RedisCoordinator(redis.Redis.from_url(url))
+    if scheme == "fakeredis":
+        import fakeredis
+        return RedisCoordinator(fakeredis.FakeRedis())
+    raise RuntimeError(f"Unsupported COORDINATION_URL scheme '{scheme}'")
+
+
+def get_coordinator() -> Coordinator:
+    global _coordinator
+    if _coordinator is None:
+        with _lock:
+            if _coordinator is None:
+                _coordinator = create_coordinator()
+    return _coordinator
+
+
+def invalidate(cache: str, **key):
+    """Tell every worker to drop `cache` entries matching key (all of it if empty)."""
+    get_coordinator().publish("invalidate:" + cache, key)
+
+
+def on_invalidate(cache: str, fn):
+    """Register fn(key) to run when any worker invalidates `cache`."""
+    return get_coordinator().subscribe("invalidate:" + cache, fn)
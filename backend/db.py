@@ -0,0 +1,192 @@
+# db.py
+
+"""
+Single MongoDB connection pool shared by every data module.
+
+All modules get their database from get_db() (blocking pymongo) or
+get_async_db() (Motor, for async endpoints); both clients are created once
+per process with the pool settings below, on first use. get_db() hands out
+lazy handles, so modules can keep `slots = db.parking_slots` at import time
+without connecting: serve.py imports the app and then forks, and a client
+created before a fork must not be used in the child. A forked child drops
+any client it inherited and the handles re-resolve against its own. Setting
+MONGO_URI=mongomock://localhost/<db_name> swaps in an in-memory mongomock
+database (sync and async views share the same data) for local runs and
+tests; any mongodb:// URI, including a local mongod, works unchanged.
+"""
+
+import os
+import logging
+import threading
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.database import Database
+
+from metrics import mongo_listener
+from tracing import mongo_trace_listener
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+MONGO_URI = os.getenv("MONGO_URI")
+if not MONGO_URI:
+    raise RuntimeError("MONGO_URI not set in .env")
+
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")   # defaults to the database in the URI
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+
+MOCK_SCHEME = "mongomock://"
+
+_lock = threading.RLock()   # get_async_client() may create the sync client
+_client = None
+_async_client = None
+_generation = 0             # bumped whenever the clients are dropped (fork, close)
+
+
+def is_mock() -> bool:
+    return MONGO_URI.startswith(MOCK_SCHEME)
+
+
+def client_options() -> dict:
+    """Pool, timeout, read-preference and monitoring options shared by both clients."""
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": MONGO_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+        "event_listeners": [mongo_listener, mongo_trace_listener],
+    }
+
+
+def _mock_uri() -> str:
+    return "mongodb://" + MONGO_URI[len(MOCK_SCHEME):]
+
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                if is_mock():
+                    import mongomock
+                    _client = mongomock.MongoClient(_mock_uri())
+                else:
+                    _client = MongoClient(MONGO_URI, **client_options())
+    return _client
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                if is_mock():
+                    from mongomock_motor import AsyncMongoMockClient
+                    _async_client = AsyncMongoMockClient(mock_mongo_client=get_client())
+                else:
+                    from motor.motor_asyncio import AsyncIOMotorClient
+                    _async_client = AsyncIOMotorClient(MONGO_URI, **client_options())
+    return _async_client
+
+
+def _database(client):
+    # Resolve the name once from the sync client so both handles agree
+    name = MONGO_DB_NAME or get_client().get_default_database().name
+    return client[name]
+
+
+# -------------------------------------------------------------------
+# Lazy handles
+# -------------------------------------------------------------------
+class LazyCollection:
+    """A collection of the current sync client, re-resolved after the clients are dropped."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._handle = None
+        self._generation = -1
+
+    def resolve(self):
+        if self._generation != _generation or self._handle is None:
+            generation = _generation
+            self._handle = _database(get_client())[self.name]
+            self._generation = generation
+        return self._handle
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __getitem__(self, name):
+        return self.resolve()[name]
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+
+class LazyDatabase:
+    """
+    Blocking database handle that connects on first use. Attribute access
+    gives a LazyCollection (cached per name); Database methods and
+    properties (command, list_collection_names, name, ...) go to the
+    current client's database.
+    """
+
+    def __init__(self):
+        self._collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_") or hasattr(Database, name):
+            return getattr(_database(get_client()), name)
+        return self[name]
+
+    def __getitem__(self, name):
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections.setdefault(name, LazyCollection(name))
+        return collection
+
+
+_lazy_db = LazyDatabase()
+
+
+def get_db():
+    """Blocking database handle (pymongo); connects on first use."""
+    return _lazy_db
+
+
+def get_async_db():
+    """Non-blocking database handle (Motor)."""
+    return _database(get_async_client())
+
+
+def close_clients():
+    """Close both pools at application shutdown."""
+    global _client, _async_client, _generation
+    with _lock:
+        if _async_client is not None:
+            _async_client.close()
+        if _client is not None:
+            _client.close()
+        _client = _async_client = None
+        _generation += 1
+
+
+def _after_fork():
+    """
+    Forget the parent's clients in a forked child. They are not closed:
+    their sockets are shared with the parent, which may still be using them.
+    """
+    global _lock, _client, _async_client, _generation
+    _lock = threading.RLock()
+    _client = _async_client = None
+    _generation += 1
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
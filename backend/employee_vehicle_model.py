@@ -1,25 +1,160 @@
 # employee_vehicle_model.py
 
 import os
-from pymongo import MongoClient, errors
-from dotenv import load_dotenv
+import time
+import logging
+import threading
+from pymongo import errors
+
+from db import get_db
+from coordination import invalidate, on_invalidate
+
+logger = logging.getLogger(__name__)
 
 # -------------------------------------------------------------------
-# Load environment and connect to MongoDB
+# Collections (shared connection pool from db.py)
 # -------------------------------------------------------------------
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-if not MONGO_URI:
-    raise RuntimeError("MONGO_URI not set in .env")
-
-client = MongoClient(MONGO_URI)
-db = client.get_default_database()  # or client["your_db_name"]
+db = get_db()
 employees = db.employee_vehicle_plates
+# Single document {_id: "employee_plates", version: n} bumped on every change
+plate_versions = db.employee_plate_versions
+VERSION_ID = "employee_plates"
+# parking_slot_crud imports this module, so its handles are not imported here
+slots = db.parking_slots
+ACTIVE_STATUSES = ["booked", "parked"]
+# How often a worker without a change stream re-reads the version counter
+EMPLOYEE_PLATES_CHECK_SECONDS = float(os.getenv("EMPLOYEE_PLATES_CHECK_SECONDS", "5"))
+
+
+def normalize_plate(plate_number: str) -> str:
+    return str(plate_number).strip().upper()
+
 
 # -------------------------------------------------------------------
-# Ensure unique index on plate_number
+# In-memory plate set
 # -------------------------------------------------------------------
-employees.create_index("plate_number", unique=True)
+class EmployeePlateCache:
+    """
+    Hash map of employee plate -> employee id, loaded once and reloaded only when the
+    whitelist changes. Changes are detected through a change stream on the
+    collection when the deployment supports it (replica set / Atlas), and
+    otherwise by re-reading the version counter every `check_seconds`.
+    Writes through this module reload the local set at once.
+
+    Once start()ed, all of that happens on a daemon thread and lookups only
+    read memory, so the async request path never waits on the database.
+    Without start() (scripts), lookups check the version themselves.
+    """
+
+    def __init__(self, check_seconds: float = EMPLOYEE_PLATES_CHECK_SECONDS):
+        self.check_seconds = check_seconds
+        self._plates = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._watching = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _current_version(self) -> int:
+        doc = plate_versions.find_one({"_id": VERSION_ID})
+        return doc["version"] if doc else 0
+
+    def reload(self):
+        with self._lock:
+            version = self._current_version()
+            plates = {
+                normalize_plate(d["plate_number"]): str(d["_id"])
+                for d in employees.find({}, {"plate_number": 1})
+            }
+            self._plates, self._version = plates, version
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        self._checked_at = 0.0
+        self._version = None
+        self._wake.set()
+
+    def start(self):
+        """Load the set now and keep it fresh from a daemon thread."""
+        self.reload()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="employee-plate-refresh", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.check_seconds)
+            self._wake.clear()
+            try:
+                if self._version is None or (not self._watching and self._current_version() != self._version):
+                    self.reload()
+            except Exception as e:
+                logger.error("Employee plate refresh failed: %s", e)
+
+    def _refresh(self):
+        if self._thread is not None:
+            return   # kept fresh by _run
+        if self._watching and self._version is not None:
+            return
+        if time.monotonic() - self._checked_at < self.check_seconds:
+            return
+        if self._version is None or self._current_version() != self._version:
+            self.reload()
+        else:
+            self._checked_at = time.monotonic()
+
+    def plates(self):
+        self._refresh()
+        return self._plates.keys()
+
+    def employee_id(self, plate_number: str):
+        """Employee id for a plate, or None if it is not whitelisted."""
+        self._refresh()
+        return self._plates.get(normalize_plate(plate_number))
+
+    def __contains__(self, plate_number: str) -> bool:
+        return normalize_plate(plate_number) in self.plates()
+
+    def watch(self) -> bool:
+        """Invalidate on change-stream events; returns False if streams are unsupported."""
+        try:
+            stream = employees.watch()
+        except Exception as e:
+            logger.info("Employee plate change stream unavailable, polling version: %s", e)
+            return False
+
+        def _loop():
+            try:
+                with stream:
+                    for _ in stream:
+                        self.invalidate()
+            except Exception as e:
+                logger.error("Employee plate change stream stopped: %s", e)
+            finally:
+                self._watching = False
+                self.invalidate()
+
+        self._watching = True
+        threading.Thread(target=_loop, name="employee-plate-watch", daemon=True).start()
+        return True
+
+
+employee_plates = EmployeePlateCache()
+
+
+def _bump_version():
+    plate_versions.update_one({"_id": VERSION_ID}, {"$inc": {"version": 1}}, upsert=True)
+    employee_plates.reload()
+    invalidate("employee_plates")
+
+
+def _flag_active_slots(plate_number: str, employee_id):
+    """Update is_employee/employee_id on slots currently booked or parked by the plate."""
+    slots.update_many(
+        {"parked_vehicle_plate": plate_number, "status": {"$in": ACTIVE_STATUSES}},
+        {"$set": {"is_employee": employee_id is not None, "employee_id": employee_id}}
+    )
 
 
 # -------------------------------------------------------------------
@@ -30,8 +165,12 @@ def init_employee_table():
     Ensures the 'employee_vehicle_plates' collection exists
     and has a unique index on 'plate_number'.
     """
-    # Collection is implicitly created on first write;
-    # index already created above.
+    # Collection is implicitly created on first write.
+    employees.create_index("plate_number", unique=True)
+    # Load the plate set and follow changes.
+    employee_plates.watch()
+    on_invalidate("employee_plates", lambda key: employee_plates.invalidate())
+    employee_plates.start()
     return True
 
 
@@ -44,12 +183,15 @@ def add_employee_plate(plate_number: str) -> dict:
     Raises ValueError if the plate already exists.
     Returns the inserted document.
     """
+    plate_number = normalize_plate(plate_number)
     try:
         doc = {"plate_number": plate_number}
         employees.insert_one(doc)
-        return doc
     except errors.DuplicateKeyError:
         raise ValueError(f"Plate '{plate_number}' is already registered")
+    _bump_version()
+    _flag_active_slots(plate_number, str(doc["_id"]))
+    return doc
 
 
 # -------------------------------------------------------------------
@@ -60,7 +202,11 @@ def remove_employee_plate(plate_number: str) -> bool:
     Deletes the given plate_number from the whitelist.
     Returns True if deleted, False if not found.
     """
+    plate_number = normalize_plate(plate_number)
     result = employees.delete_one({"plate_number": plate_number})
+    if result.deleted_count:
+        _bump_version()
+        _flag_active_slots(plate_number, None)
     return result.deleted_count == 1
 
 
@@ -69,9 +215,20 @@ def remove_employee_plate(plate_number: str) -> bool:
 # -------------------------------------------------------------------
 def get_all_employee_plates() -> list:
     """
-    Returns a list of all registered employee plate numbers.
+    Returns a list of all registered employee plate numbers (from the cached set).
+    """
+    return sorted(employee_plates.plates())
+
+
+# -------------------------------------------------------------------
+# 5) Check whether a plate is on the whitelist
+# -------------------------------------------------------------------
+def is_employee_plate(plate_number: str) -> bool:
+    """
+    Returns True if plate_number is a registered employee plate
+    (hash lookup in the cached set).
     """
-    return [d["plate_number"] for d in employees.find({}, {"_id": 0, "plate_number": 1})]
+    return plate_number in employee_plates
 
 
 # -------------------------------------------------------------------
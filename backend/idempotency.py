@@ -0,0 +1,177 @@
+# idempotency.py
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pymongo import errors
+from starlette.responses import Response
+
+from coordination import on_invalidate
+from db import get_async_db
+from responses import APIResponse
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+REPLAY_HEADER = "Idempotent-Replay"
+
+
+def fingerprint(payload) -> str:
+    """Stable hash of a request body, to reject a key reused with different data."""
+    data = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Records the response of each (scope, Idempotency-Key) pair so that
+    retries are answered from the record without touching slot documents.
+
+    Lookups hit a bounded in-process LRU first and the idempotency_keys
+    collection (expired by a TTL index) second, which lets other workers
+    replay responses too. A "pending" record claims the key while the first
+    request runs: concurrent duplicates in this worker wait for its result,
+    duplicates in other workers get 409 until it finishes.
+
+    Successful responses are kept as their content and replayed through
+    APIResponse, so a retry is encoded for its own Accept header (JSON or
+    MessagePack); error responses are kept as the JSON body FastAPI sent.
+    """
+
+    def __init__(self, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS,
+                 cache_size: int = IDEMPOTENCY_CACHE_SIZE, database=None):
+        self.ttl_seconds = ttl_seconds
+        self._cache = TTLCache(maxsize=cache_size, ttl=ttl_seconds)
+        self._inflight = {}   # record id -> asyncio.Future of the stored record
+        self._database = database
+
+    @property
+    def collection(self):
+        if self._database is None:
+            self._database = get_async_db()
+        return self._database.idempotency_keys
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+
+    # ---------------------------------------------------------------
+    # Records
+    # ---------------------------------------------------------------
+    @staticmethod
+    def _replay(record: dict) -> Response:
+        headers = {REPLAY_HEADER: "true"}
+        if "content" in record:
+            return APIResponse(record["content"], status_code=record["status_code"], headers=headers)
+        return Response(content=record["body"], status_code=record["status_code"],
+                        media_type="application/json", headers=headers)
+
+    def _check(self, record: dict, request_hash: str) -> dict:
+        if record.get("request_hash") != request_hash:
+            raise HTTPException(status_code=422,
+                                detail="Idempotency-Key was already used with a different request")
+        return record
+
+    async def _store(self, record_id: str, request_hash: str, response: Response) -> dict:
+        record = {"_id": record_id, "request_hash": request_hash, "state": "done",
+                  "status_code": response.status_code, "created_at": datetime.utcnow()}
+        if isinstance(response, APIResponse):
+            record["content"] = response.content
+        else:
+            record["body"] = bytes(response.body)
+        self._cache.set(record_id, record)
+        try:
+            await self.collection.replace_one({"_id": record_id}, record, upsert=True)
+        except Exception as e:
+            logger.error("Failed to persist idempotency record %s: %s", record_id, e)
+        return record
+
+    async def _release(self, record_id: str):
+        try:
+            await self.collection.delete_one({"_id": record_id, "state": "pending"})
+        except Exception as e:
+            logger.error("Failed to release idempotency key %s: %s", record_id, e)
+
+    # ---------------------------------------------------------------
+    # Entry point
+    # ---------------------------------------------------------------
+    async def run(self, scope: str, key: Optional[str], payload,
+                  handler: Callable[[], Awaitable[Response]]) -> Response:
+        """Run handler() once per (scope, key); later calls replay its response."""
+        if not key:
+            return await handler()
+        record_id, request_hash = f"{scope}:{key}", fingerprint(payload)
+
+        record = self._cache.get(record_id)
+        if record is not None:
+            return self._replay(self._check(record, request_hash))
+        if record_id in self._inflight:
+            record = await asyncio.shield(self._inflight[record_id])
+            return self._replay(self._check(record, request_hash))
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[record_id] = future
+        claimed = False
+        try:
+            try:
+                await self.collection.insert_one({"_id": record_id, "request_hash": request_hash,
+                                                  "state": "pending", "created_at": datetime.utcnow()})
+                claimed = True
+            except errors.DuplicateKeyError:
+                record = await self.collection.find_one({"_id": record_id})
+                if record is None or record.get("state") != "done":
+                    raise HTTPException(status_code=409,
+                                        detail="A request with this Idempotency-Key is in progress")
+                self._check(record, request_hash)
+                self._cache.set(record_id, record)
+                future.set_result(record)
+                return self._replay(record)
+
+            try:
+                response = await handler()
+            except HTTPException as e:
+                if e.status_code >= 500:
+                    raise
+                body = json.dumps({"detail": jsonable_encoder(e.detail)}, separators=(",", ":")).encode()
+                error = Response(body, status_code=e.status_code, media_type="application/json")
+                future.set_result(await self._store(record_id, request_hash, error))
+                raise
+            future.set_result(await self._store(record_id, request_hash, response))
+            return response
+        finally:
+            if not future.done():
+                # Unexpected failure: let the client retry with the same key
+                future.set_exception(HTTPException(status_code=409, detail="Original request failed; retry"))
+                future.exception()
+                # Only our own claim; another worker's pending record stays in place
+                if claimed:
+                    await self._release(record_id)
+            self._inflight.pop(record_id, None)
+
+
+idempotency_store = IdempotencyStore()
+
+# -------------------------------------------------------------------
+# Camera auto-park de-duplication
+# -------------------------------------------------------------------
+AUTO_PARK_DEDUP_SECONDS = float(os.getenv("AUTO_PARK_DEDUP_SECONDS", "60"))
+
+# plate -> (suggested_slot, auto_parked, message) of the first park attempt,
+# so consecutive frames of the same vehicle skip the slot lookup and update
+auto_park_results = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=AUTO_PARK_DEDUP_SECONDS)
+
+
+def follow_slot_invalidations():
+    """Forget a plate's auto-park outcome when any worker changes its slot; called at startup."""
+    def _forget(key):
+        if key.get("plate"):
+            auto_park_results.pop(key["plate"])
+    on_invalidate("slots", _forget)
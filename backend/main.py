@@ -1,45 +1,88 @@
+import os
+import hmac
+import asyncio
 import logging
 import base64
+import time
 import cv2
-import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Union
 import torch
 from torch.autograd import Variable
-from PIL import Image
-import pytesseract
-import re
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Path
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Path, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from fastapi.exceptions import RequestValidationError
 from starlette.responses import PlainTextResponse
 
 import uvicorn
-from ultralytics import YOLO
 
 from model import Model
 
 from app.slot_service import SlotDetectionService
+from app.plate_service import PlateRecognitionService
+from db import close_clients
+from metrics import REQUEST_SECONDS, in_flight, profiler, render as render_metrics, stage, timed_load
+from tracing import KIND_SERVER, span
+from idempotency import idempotency_store, auto_park_results, follow_slot_invalidations
+from plate_index import plate_index
+from responses import (
+    APIResponse, Slot, ClearedSlot, SlotSummary, ZoneForecast, OccupancyPoint, RevenueDay, DwellByType,
+    PlateRecognition, SlotDetection, PlateMatch,
+)
 from parking_slot_crud import (
+    ensure_slot_indexes,
     init_slots,
-    book_slot,
-    park_slot,
-    get_all_slots,
-    clear_slot,
-    slots as slots_collection
+    start_counter_reconciler,
+    ALLOWED_RANGES
 )
-from employee_vehicle_model import init_employee_table, get_all_employee_plates
-from user_auth_mongo import register_user, login_user, users
+from services.booking_service import BookingService, get_booking_service
+from services.database_service import DatabaseService, get_database_service
+from booking_expiry import BookingExpiryScheduler
+from occupancy_forecast import OccupancyForecaster
+from slot_events import ensure_event_log, SlotEventLog, slot_history
+from parking_sessions import ensure_session_indexes, SessionWriter, occupancy_over_time, revenue_per_day, average_dwell
+from employee_vehicle_model import init_employee_table
+from user_auth_mongo import register_user, login_user, ensure_user_indexes, follow_user_invalidations
 
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Background jobs (started in the lifespan handler)
+booking_expiry = BookingExpiryScheduler()
+session_writer = SessionWriter()
+forecaster = OccupancyForecaster()
+slot_log = SlotEventLog()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Indexes and seed data are set up once per worker, not at import
+    ensure_slot_indexes()
+    ensure_session_indexes()
+    ensure_event_log()
+    ensure_user_indexes()
+    follow_user_invalidations()
+    follow_slot_invalidations()
+    init_employee_table()
+    await idempotency_store.ensure_indexes()
+    init_slots(count=100)
+    start_counter_reconciler()
+    booking_expiry.start()
+    session_writer.start()
+    forecaster.start()
+    slot_log.start()
+    plate_index.start()
+    yield
+    booking_expiry.stop()
+    session_writer.flush()
+    slot_log.flush()
+    close_clients()
+
 # FastAPI setup
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=APIResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -49,36 +92,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    with span(f"{request.method} {request.url.path}", KIND_SERVER, root=True,
+              traceparent=request.headers.get("traceparent"),
+              **{"http.method": request.method, "http.target": request.url.path}) as server_span:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            if server_span.sampled:
+                response.headers["traceparent"] = server_span.traceparent
+            return response
+        finally:
+            # Label by route template (/users/{username}), not the raw path
+            route = request.scope.get("route")
+            route_path = route.path if route else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                                    route=route_path, status=status)
+            if server_span.sampled:
+                server_span.name = f"{request.method} {route_path}"
+                server_span.set_attribute("http.route", route_path)
+                server_span.set_attribute("http.status_code", status)
+
 # Load ML models
 logger.info("Loading YOLO model…")
-model = YOLO("best5.pt")
-
-class_names = {
-    0: 'Lorry', 1: 'bike', 2: 'bus', 3: 'car',
-    4: 'number plate', 5: 'three wheeler',
-    6: 'three wheeler', 7: 'van'
-}
-slot_service = SlotDetectionService(model_path="parking.pt")
-
-# Initialize DB on startup
-init_employee_table()
-init_slots(count=100)
+plate_service = timed_load("best5.pt", PlateRecognitionService, model_path="best5.pt")
+slot_service = timed_load("parking.pt", SlotDetectionService, model_path="parking.pt")
 
 # Pydantic schemas
 class UserAuth(BaseModel):
     username: str
     vehicle_plate: str
 
-# Add allowed ranges mapping
-ALLOWED_RANGES = {
-    "Bikes": (1, 40),
-    "Cars": (41, 70),
-    "ThreeWheelers": (71, 80),
-    "Vans": (81, 90),
-    "Trucks": (91, 95),
-    "Lorries": (96, 100)
-}
-
 # Update the SlotAction schema to include vehicle_type
 class SlotAction(BaseModel):
     slot_id: int
@@ -89,14 +136,13 @@ class SlotAction(BaseModel):
 class ClearAction(BaseModel):
     slot_id: int
     username: str           # provided by client
-    rate_per_hour: float = 10.0
 
 # Auth endpoints
 @app.post("/register")
 def api_register(u: UserAuth):
     try:
         doc = register_user(u.username, u.vehicle_plate)
-        return {"success": True, "user": {"username": doc["username"], "vehicle_plate": doc["vehicle_plate"]}}
+        return APIResponse({"success": True, "user": {"username": doc["username"], "vehicle_plate": doc["vehicle_plate"]}})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -104,19 +150,21 @@ def api_register(u: UserAuth):
 def api_login(u: UserAuth):
     try:
         doc = login_user(u.username, u.vehicle_plate)
-        return {"success": True, "user": {"username": doc["username"], "vehicle_plate": doc["vehicle_plate"]}}
+        return APIResponse({"success": True, "user": {"username": doc["username"], "vehicle_plate": doc["vehicle_plate"]}})
     except ValueError as e:
         raise HTTPException(status_code=401, detail=str(e))
 
 # Slot-init endpoint
 @app.post("/slots/init")
 def api_init_slots(count: int = Query(100, ge=1, le=1000)):
+    # Only adds missing slots; booked and parked slots are never reset
     init_slots(count)
-    return {"message": f"Initialized {count} slots"}
+    return APIResponse({"message": f"Initialized {count} slots"})
 
 # Slot CRUD endpoints
-@app.post("/slots/book")
-def api_book_slot(action: SlotAction):
+@app.post("/slots/book", response_model=Slot)
+async def api_book_slot(action: SlotAction, booking: BookingService = Depends(get_booking_service),
+                        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     # Check allowed range based on vehicle_type
     if action.vehicle_type not in ALLOWED_RANGES:
         raise HTTPException(status_code=400,
@@ -125,160 +173,206 @@ def api_book_slot(action: SlotAction):
     if not (low <= action.slot_id <= high):
         raise HTTPException(status_code=400,
             detail=f"Slot {action.slot_id} is not available for {action.vehicle_type}. Allowed slots are {low}-{high}.")
-    try:
-        updated = book_slot(action.slot_id, action.vehicle_plate)
-        updated.pop("_id", None)
-        return JSONResponse(jsonable_encoder(updated))
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-@app.post("/slots/park")
-def api_park_slot(action: SlotAction):
-    try:
-        updated = park_slot(action.slot_id, action.vehicle_plate)
-        updated.pop("_id", None)
-        return JSONResponse(jsonable_encoder(updated))
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-@app.get("/slots")
-def api_list_slots():
-    slots = get_all_slots()
-    return JSONResponse(jsonable_encoder(slots))
-
-@app.post("/slots/clear")
-def api_clear_slot(action: ClearAction):
-    try:
-        # Retrieve user data from the users collection
-        user = users.find_one({"username": action.username})
-        if not user:
-            raise ValueError("User not found")
-        # Get user's vehicle plate from DB
-        user_plate = str(user["vehicle_plate"]).strip().upper()
-        info = clear_slot(action.slot_id, user_plate, action.rate_per_hour)
-        return JSONResponse(jsonable_encoder(info))
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/slots/parked-employees")
-def api_parked_employees():
-    plates = get_all_employee_plates()
-    docs = list(slots_collection.find(
-        {"status": "parked", "parked_vehicle_plate": {"$in": plates}},
-        {"_id": 0}
-    ))
-    return JSONResponse(jsonable_encoder(docs))
+    async def book():
+        try:
+            updated = await booking.book_slot(action.slot_id, action.vehicle_plate, action.username)
+            updated.pop("_id", None)
+            return APIResponse(updated)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return await idempotency_store.run("book", idempotency_key, action, book)
+
+@app.post("/slots/park", response_model=Slot)
+async def api_park_slot(action: SlotAction, booking: BookingService = Depends(get_booking_service),
+                        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    async def park():
+        try:
+            updated = await booking.park_slot(action.slot_id, action.vehicle_plate)
+            updated.pop("_id", None)
+            return APIResponse(updated)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return await idempotency_store.run("park", idempotency_key, action, park)
+
+@app.get("/slots", response_model=List[Slot])
+async def api_list_slots(dbs: DatabaseService = Depends(get_database_service)):
+    slots = await dbs.get_all_slots()
+    return APIResponse(slots)
+
+@app.get("/slots/summary", response_model=SlotSummary)
+async def api_slot_summary(dbs: DatabaseService = Depends(get_database_service)):
+    return APIResponse(await dbs.get_slot_summary())
+
+@app.get("/slots/forecast", response_model=Union[ZoneForecast, Dict[str, ZoneForecast]])
+def api_slot_forecast(zone: Optional[str] = None):
+    forecast = forecaster.get(zone)
+    if forecast is None:
+        raise HTTPException(status_code=404, detail=f"No forecast for zone {zone}")
+    return APIResponse(forecast)
+
+@app.get("/slots/history")
+def api_slot_history(at: Optional[datetime] = None):
+    """State of every slot at a past moment (now if omitted), from the event log."""
+    if at is None:
+        return APIResponse(slot_log.get_state())
+    return APIResponse(slot_log.state_at(at))
+
+@app.get("/slots/{slot_id}/events")
+def api_slot_events(slot_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    return APIResponse(slot_history(slot_id, start, end))
+
+@app.post("/slots/clear", response_model=ClearedSlot)
+async def api_clear_slot(action: ClearAction, booking: BookingService = Depends(get_booking_service),
+                         idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    async def clear():
+        try:
+            # The plate comes from the user's record, not from the client
+            info = await booking.clear_user_slot(action.slot_id, action.username)
+            return APIResponse(info)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return await idempotency_store.run("clear", idempotency_key, action, clear)
+
+@app.get("/slots/parked-employees", response_model=List[Slot])
+async def api_parked_employees(dbs: DatabaseService = Depends(get_database_service)):
+    return APIResponse(await dbs.get_parked_employees())
+
+# Session analytics endpoints
+def _report_window(start: Optional[datetime], end: Optional[datetime]):
+    end = end or datetime.utcnow()
+    return start or end - timedelta(days=7), end
+
+@app.get("/sessions/occupancy", response_model=List[OccupancyPoint])
+def api_session_occupancy(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          bucket_minutes: int = Query(60, ge=5, le=1440),
+                          vehicle_type: Optional[str] = None):
+    start, end = _report_window(start, end)
+    return APIResponse(occupancy_over_time(start, end, bucket_minutes, vehicle_type))
+
+@app.get("/sessions/revenue", response_model=List[RevenueDay])
+def api_session_revenue(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        vehicle_type: Optional[str] = None):
+    start, end = _report_window(start, end)
+    return APIResponse(revenue_per_day(start, end, vehicle_type))
+
+@app.get("/sessions/dwell", response_model=List[DwellByType])
+def api_session_dwell(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    start, end = _report_window(start, end)
+    return APIResponse(average_dwell(start, end))
 
 # ML OCR endpoint
-@app.post("/predict_ocr")
-async def predict_ocr(file: UploadFile = File(...)):
+@app.post("/predict_ocr", response_model=PlateRecognition)
+async def predict_ocr(file: UploadFile = File(...),
+                      booking: BookingService = Depends(get_booking_service)):
     try:
-        img_bytes = await file.read()
-        img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
-        if img is None:
-            raise HTTPException(400, "Bad image")
-
-        det = model.predict(img, conf=0.65, verbose=False)[0]
-        annotated = det.plot()
-
-        vehicles, plates = [], []
-        for box in det.boxes:
-            cls_id = int(box.cls[0])
-            label = class_names.get(cls_id, "unknown")
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-
-            if label == "number plate":
-                crop = img[y1:y2, x1:x2]
-                gray    = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
-                resized = cv2.resize(gray, None, fx=3, fy=3, interpolation=cv2.INTER_CUBIC)
-                blur    = cv2.bilateralFilter(resized, 11, 30, 30)
-                _, thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-                kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3,3))
-                morphed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-
-                num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(morphed, connectivity=8)
-                heights = stats[1:, cv2.CC_STAT_HEIGHT] if num_labels>1 else np.array([])
-                max_h   = heights.max() if heights.size else 0
-                min_h   = max_h * 0.5
-
-                mask = np.zeros_like(morphed)
-                for i, stat in enumerate(stats[1:], start=1):
-                    if stat[cv2.CC_STAT_HEIGHT] >= min_h:
-                        mask[labels == i] = 255
-                mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_RECT, (2,2)), iterations=1)
-
-                crop_pil = Image.fromarray(mask)
-                plate_text = pytesseract.image_to_string(
-                    crop_pil,
-                    config='--psm 8 --oem 1 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-                ).strip()
-                if not plate_text:
-                    plate_text = pytesseract.image_to_string(
-                        crop_pil,
-                        config='--psm 7 --oem 1 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-                    ).strip()
-                plate_text = re.sub(r'[^A-Z0-9]', '', plate_text)
-                plates.append(plate_text)
-
-                cv2.putText(annotated, plate_text, (x1, max(y1-10, 0)),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,255), 2)
-            else:
-                vehicles.append(label)
-                cv2.putText(annotated, label, (x1, max(y1-10, 0)),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,0), 2)
-
-        suggested_slot = None
-        auto_parked   = False
-        message       = None
-        if plates:
-            plate0 = plates[0]
-            slot_doc = slots_collection.find_one(
-                {"parked_vehicle_plate": plate0, "status": "booked"},
-                {"slot_id": 1, "_id": 0}
-            )
-            if slot_doc:
-                suggested_slot = slot_doc["slot_id"]
-                try:
-                    park_slot(suggested_slot, plate0)
-                    auto_parked = True
-                    message = f"Vehicle parked in slot {suggested_slot}"
-                except ValueError as e:
-                    logger.error(f"Park error: {e}")
-                    message = str(e)
-
-        ok, png = cv2.imencode(".png", annotated)
-        if not ok:
-            raise RuntimeError("encode-fail")
-
-        return {
-            "vehicle_types":     vehicles,
-            "recognized_plates": plates,
-            "annotated_image":   base64.b64encode(png).decode(),
-            "suggested_slot":    suggested_slot,
-            "auto_parked":       auto_parked,
-            "message":           message
-        }
-
+        with in_flight("predict_ocr"):
+            img_bytes = await file.read()
+            try:
+                # Off the event loop, so other requests are served meanwhile
+                annotated, vehicles, plates = await asyncio.to_thread(plate_service.recognize, img_bytes)
+            except ValueError:
+                raise HTTPException(400, "Bad image")
+
+            suggested_slot = None
+            auto_parked   = False
+            message       = None
+            match         = None
+            if plates:
+                # Resolve OCR confusions (O/0, B/8, ...) against the booked plates
+                match = plate_index.best_booking(plates[0]["text"])
+                plate0 = match["plate"] if match else plates[0]["text"]
+                # Repeated frames of the same vehicle replay the first auto-park outcome
+                outcome = auto_park_results.get(plate0)
+                if outcome is None:
+                    with stage("auto_park"):
+                        try:
+                            parked = await booking.auto_park(plate0)
+                        except ValueError as e:
+                            logger.error(f"Park error: {e}")
+                            parked, message = None, str(e)
+                        if parked:
+                            suggested_slot, auto_parked = parked["slot_id"], True
+                            message = f"Vehicle parked in slot {suggested_slot}"
+                        if parked or message:
+                            auto_park_results.set(plate0, (suggested_slot, auto_parked, message))
+                else:
+                    suggested_slot, auto_parked, message = outcome
+
+            with stage("png_encode"):
+                ok, png = cv2.imencode(".png", annotated)
+                if not ok:
+                    raise RuntimeError("encode-fail")
+                annotated_image = base64.b64encode(png).decode()
+
+            return APIResponse({
+                "vehicle_types":     vehicles,
+                "recognized_plates": [p["text"] for p in plates],
+                "plate_confidences": [p["confidence"] for p in plates],
+                "annotated_image":   annotated_image,
+                "suggested_slot":    suggested_slot,
+                "auto_parked":       auto_parked,
+                "message":           message,
+                "matched_plate":     match["plate"] if match else None,
+                "match_confidence":  match["confidence"] if match else None
+            })
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("/predict_ocr")
         raise HTTPException(status_code=500, detail=str(e))
 
 # ML slot-detection endpoint
-@app.post("/detect_slots")
+@app.post("/detect_slots", response_model=SlotDetection)
 async def detect_slots(file: UploadFile = File(...)):
     try:
         data = await file.read()
-        return slot_service.detect_slots(data)
+        with in_flight("detect_slots"):
+            return APIResponse(await asyncio.to_thread(slot_service.detect_slots, data))
     except Exception as e:
         logger.error(f"/detect_slots error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/plates/match", response_model=PlateMatch)
+def api_plate_match(text: str = Query(..., min_length=1), limit: int = Query(5, ge=1, le=50)):
+    return APIResponse({"text": text, "candidates": plate_index.candidates(text, limit=limit)})
+
 @app.get("/users/{username}")
-def get_user(username: str = Path(..., description="The username to lookup")):
-    user = users.find_one({"username": username}, {"_id": 0})
+async def get_user(username: str = Path(..., description="The username to lookup"),
+                   dbs: DatabaseService = Depends(get_database_service)):
+    user = await dbs.get_user(username)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return APIResponse(user)
+
+# Observability endpoints
+@app.get("/metrics")
+def api_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# The profiler exposes code paths and costs CPU while on: off unless
+# PROFILER_TOKEN is set, and then only for requests carrying it
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")
+
+def require_profiler_token(token: Optional[str] = Header(None, alias="X-Debug-Token")):
+    if not PROFILER_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode(), PROFILER_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+@app.post("/debug/profiler", dependencies=[Depends(require_profiler_token)])
+def api_profiler_toggle(enabled: bool, interval_ms: float = Query(10, ge=1, le=1000)):
+    if enabled:
+        profiler.start(interval_ms / 1000)
+    else:
+        profiler.stop()
+    return APIResponse({"running": profiler.running, "samples": profiler.samples})
+
+@app.get("/debug/profiler", dependencies=[Depends(require_profiler_token)])
+def api_profiler_stacks(limit: Optional[int] = None):
+    """Collapsed stacks collected so far (flamegraph.pl / speedscope input)."""
+    return PlainTextResponse(profiler.collapsed(limit))
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,276 @@
+# metrics.py
+
+"""
+In-process metrics with Prometheus text exposition, and a sampling profiler.
+
+Histograms, counters and gauges are plain Python objects guarded by one
+lock each; recording a value is a bisect and two additions, so they can sit
+on every request and pipeline stage. Values are per worker process: scrape
+each worker (or run one per container).
+
+    with stage("yolo_predict"):
+        det = model.predict(img)
+
+The profiler samples every thread's stack with sys._current_frames() from a
+daemon thread and aggregates collapsed stacks ("a;b;c count"), the input
+format of flamegraph.pl / speedscope. It is off until started at runtime.
+"""
+
+import sys
+import time
+import bisect
+import threading
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+from tracing import span
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for key, value in items:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key, value) -> list:
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, key, value) -> list:
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            bucket_labels = _labels(self.label_names, key, 'le="%s"' % le)
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        label_text = _labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{label_text} {_number(total)}")
+        lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------------------------------------------------
+# Application metrics
+# -------------------------------------------------------------------
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency by route.",
+                            ["method", "route", "status"])
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Latency of instrumented pipeline stages.",
+                          ["stage"])
+MONGO_SECONDS = Histogram("mongo_command_duration_seconds", "MongoDB command latency.",
+                          ["command", "outcome"])
+INFERENCE_IN_FLIGHT = Gauge("inference_in_flight", "Inference requests queued or running.",
+                            ["endpoint"])
+MODEL_LOAD_SECONDS = Gauge("model_load_seconds", "Time taken to load each model.", ["model"])
+
+
+# Callbacks fn(stage, seconds) for tools that want raw stage timings
+_stage_observers = []
+
+
+def add_stage_observer(fn):
+    """Register fn(stage, seconds) to be called after every stage() block."""
+    _stage_observers.append(fn)
+    return fn
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time the enclosed block into stage_duration_seconds{stage=name}, and
+    record it as a child span when the current request is traced.
+    """
+    started = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        for fn in _stage_observers:
+            fn(name, elapsed)
+
+
+@contextmanager
+def in_flight(endpoint: str):
+    INFERENCE_IN_FLIGHT.inc(endpoint=endpoint)
+    try:
+        yield
+    finally:
+        INFERENCE_IN_FLIGHT.dec(endpoint=endpoint)
+
+
+def timed_load(model: str, loader, *args, **kwargs):
+    """Call loader(*args, **kwargs) and record how long it took as model_load_seconds."""
+    started = time.perf_counter()
+    result = loader(*args, **kwargs)
+    MODEL_LOAD_SECONDS.set(time.perf_counter() - started, model=model)
+    return result
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Feeds pymongo command monitoring events into mongo_command_duration_seconds."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, outcome="ok")
+
+    def failed(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name, outcome="error")
+
+
+mongo_listener = MongoCommandListener()
+
+
+# -------------------------------------------------------------------
+# Sampling profiler
+# -------------------------------------------------------------------
+class SamplingProfiler:
+    """Periodic stack sampler over all threads, switched on and off at runtime."""
+
+    MAX_DEPTH = 64
+
+    def __init__(self):
+        self._stacks = _Tally()
+        self._lock = threading.Lock()   # the sampler thread writes _stacks while requests read it
+        self._stop = threading.Event()
+        self._thread = None
+        self.interval = 0.01
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01, reset: bool = True):
+        if self.running:
+            return
+        if reset:
+            with self._lock:
+                self._stacks = _Tally()
+            self.samples = 0
+        self.interval = interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                names = []
+                while frame is not None and len(names) < self.MAX_DEPTH:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks.append(";".join(reversed(names)))
+            with self._lock:
+                self._stacks.update(stacks)
+            self.samples += 1
+
+    def collapsed(self, limit: int = None) -> str:
+        """Collapsed stacks, most frequent first ("frame;frame;frame count" per line)."""
+        with self._lock:
+            stacks = self._stacks.copy()
+        return "\n".join(f"{stack} {n}" for stack, n in stacks.most_common(limit)) + "\n"
+
+
+profiler = SamplingProfiler()
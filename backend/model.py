@@ -14,10 +14,11 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import torch
 import torch.nn as nn
 
 from modules.transformation import TPS_SpatialTransformerNetwork
-from modules.feature_extraction import VGG_FeatureExtractor, RCNN_FeatureExtractor, ResNet_FeatureExtractor
+from modules.feature_extraction import VGG_FeatureExtractor, RCNN_FeatureExtractor, ResNet_FeatureExtractor, fuse_sequential
 from modules.sequence_modeling import BidirectionalLSTM
 from modules.prediction import Attention
 
@@ -67,6 +68,39 @@ class Model(nn.Module):
         else:
             raise Exception('Prediction is neither CTC or Attn')
 
+    def optimize_for_inference(self, channels_last=True, compile=False, freeze=False,
+                               threads=None, interop_threads=None, batch_size=1):
+        """ Turn the model into an inference-only one and return the module to call, which takes
+        the same (input, text, is_train=False) arguments:
+            - every BatchNorm is folded into the conv before it (GRCL units merge theirs into
+              per-channel multiply-adds), so the model can no longer be trained
+            - conv weights in channels_last, the layout the oneDNN CPU kernels prefer
+            - threads / interop_threads: torch intra- and inter-op pool sizes for this process
+              (the inter-op size can only be set before the first parallel work, else it is kept)
+            - compile: torch.compile (torch >= 2.0); compiles lazily on the first calls
+            - freeze: torch.jit.trace + torch.jit.freeze for batches of batch_size; the Attn
+              decoder loop is unrolled to batch_max_length + 1 steps
+        """
+        if threads:
+            torch.set_num_threads(threads)
+        if interop_threads:
+            try:
+                torch.set_num_interop_threads(interop_threads)
+            except RuntimeError:
+                pass
+        self.eval()
+        self.requires_grad_(False)
+        if self.stages['Trans'] == 'TPS':
+            fuse_sequential(self.Transformation.LocalizationNetwork.conv)
+        self.FeatureExtraction.fuse()
+        if channels_last:
+            self.to(memory_format=torch.channels_last)
+        if freeze:
+            return FrozenModel(self, batch_size)
+        if compile:
+            return torch.compile(self)
+        return self
+
     def forward(self, input, text, is_train=True):
         """ Transformation stage """
         if not self.stages['Trans'] == "None":
@@ -90,3 +124,31 @@ class Model(nn.Module):
             prediction = self.Prediction(contextual_feature.contiguous(), text, is_train, batch_max_length=self.opt.batch_max_length)
 
         return prediction
+
+
+class FrozenModel(nn.Module):
+    """ Model traced for inference at a fixed batch size and frozen with torch.jit.freeze """
+
+    def __init__(self, model, batch_size=1):
+        super(FrozenModel, self).__init__()
+        opt = model.opt
+        input = torch.zeros(batch_size, opt.input_channel, opt.imgH, opt.imgW)
+        text = torch.zeros(batch_size, opt.batch_max_length + 1, dtype=torch.long)
+        with torch.no_grad():
+            traced = torch.jit.trace(_InferenceForward(model).eval(), (input, text), check_trace=False)
+        self.module = torch.jit.freeze(traced)
+
+    def forward(self, input, text, is_train=False):
+        if is_train:
+            raise ValueError('FrozenModel is for inference only')
+        return self.module(input, text)
+
+
+class _InferenceForward(nn.Module):
+
+    def __init__(self, model):
+        super(_InferenceForward, self).__init__()
+        self.model = model
+
+    def forward(self, input, text):
+        return self.model(input, text, is_train=False)
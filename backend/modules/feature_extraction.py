@@ -1,5 +1,28 @@
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+
+def fuse_sequential(seq):
+    """ Fold every Conv2d directly followed by a BatchNorm2d into the conv (eval mode only),
+    and fuse the children that know how to. The BatchNorm2d is replaced by nn.Identity
+    so module indices do not shift.
+    """
+    for i in range(len(seq)):
+        if isinstance(seq[i], nn.Conv2d) and i + 1 < len(seq) and isinstance(seq[i + 1], nn.BatchNorm2d):
+            seq[i] = fuse_conv_bn_eval(seq[i], seq[i + 1])
+            seq[i + 1] = nn.Identity()
+        elif hasattr(seq[i], 'fuse'):
+            seq[i].fuse()
+
+
+def _fuse_pairs(module, pairs):
+    """ fuse_sequential for (conv, bn) attribute names applied one after the other in forward """
+    for conv, bn in pairs:
+        if isinstance(getattr(module, bn), nn.BatchNorm2d):
+            setattr(module, conv, fuse_conv_bn_eval(getattr(module, conv), getattr(module, bn)))
+            setattr(module, bn, nn.Identity())
 
 
 class VGG_FeatureExtractor(nn.Module):
@@ -24,6 +47,9 @@ class VGG_FeatureExtractor(nn.Module):
             nn.MaxPool2d((2, 1), (2, 1)),  # 512x2x25
             nn.Conv2d(self.output_channel[3], self.output_channel[3], 2, 1, 0), nn.ReLU(True))  # 512x1x24
 
+    def fuse(self):
+        fuse_sequential(self.ConvNet)
+
     def forward(self, input):
         return self.ConvNet(input)
 
@@ -47,6 +73,9 @@ class RCNN_FeatureExtractor(nn.Module):
             nn.Conv2d(self.output_channel[2], self.output_channel[3], 2, 1, 0, bias=False),
             nn.BatchNorm2d(self.output_channel[3]), nn.ReLU(True))  # 512 x 1 x 26
 
+    def fuse(self):
+        fuse_sequential(self.ConvNet)
+
     def forward(self, input):
         return self.ConvNet(input)
 
@@ -58,6 +87,9 @@ class ResNet_FeatureExtractor(nn.Module):
         super(ResNet_FeatureExtractor, self).__init__()
         self.ConvNet = ResNet(input_channel, output_channel, BasicBlock, [1, 2, 5, 3])
 
+    def fuse(self):
+        self.ConvNet.fuse()
+
     def forward(self, input):
         return self.ConvNet(input)
 
@@ -78,6 +110,11 @@ class GRCL(nn.Module):
         self.GRCL = [GRCL_unit(output_channel) for _ in range(num_iteration)]
         self.GRCL = nn.Sequential(*self.GRCL)
 
+    def fuse(self):
+        """ BN_x_init cannot be folded into wf_u, whose raw output the units also use """
+        for unit in self.GRCL:
+            unit.fuse()
+
     def forward(self, input):
         """ The input of GRCL is consistant over time t, which is denoted by u(0)
         thus wgf_u / wf_u is also consistant over time t.
@@ -101,11 +138,42 @@ class GRCL_unit(nn.Module):
         self.BN_fu = nn.BatchNorm2d(output_channel)
         self.BN_rx = nn.BatchNorm2d(output_channel)
         self.BN_Gx = nn.BatchNorm2d(output_channel)
+        self.fused = False
+
+    def fuse(self):
+        """ The convs feeding the BNs are shared by every unit of a GRCL, so instead of folding
+        them into conv weights, the five inference-mode BNs (x * scale + shift per channel) are
+        merged into three multiply-adds: with G = sigmoid(g_u * wgf_u + g_x * wgr_x + g_b),
+            x = relu(f_u * wf_u + f_b + (r_s * wr_x + r_b) * G)
+        """
+        if self.fused:
+            return
+
+        def affine(bn):
+            scale = bn.running_var.add(bn.eps).rsqrt() * bn.weight
+            return scale.view(1, -1, 1, 1), (bn.bias - bn.running_mean * scale).view(1, -1, 1, 1)
+
+        with torch.no_grad():
+            s_gfu, t_gfu = affine(self.BN_gfu)
+            s_grx, t_grx = affine(self.BN_grx)
+            s_fu, t_fu = affine(self.BN_fu)
+            s_rx, t_rx = affine(self.BN_rx)
+            s_Gx, t_Gx = affine(self.BN_Gx)
+            for name, value in (('g_u', s_gfu), ('g_x', s_grx), ('g_b', t_gfu + t_grx),
+                                ('f_u', s_fu), ('f_b', t_fu + t_Gx),
+                                ('r_s', s_Gx * s_rx), ('r_b', s_Gx * t_rx)):
+                self.register_buffer(name, value.contiguous(), persistent=False)
+        self.fused = True
 
     def forward(self, wgf_u, wgr_x, wf_u, wr_x):
+        if self.fused:
+            G = torch.sigmoid(torch.addcmul(torch.addcmul(self.g_b, wgf_u, self.g_u), wgr_x, self.g_x))
+            x = torch.addcmul(torch.addcmul(self.f_b, wf_u, self.f_u), torch.addcmul(self.r_b, wr_x, self.r_s), G)
+            return F.relu(x)
+
         G_first_term = self.BN_gfu(wgf_u)
         G_second_term = self.BN_grx(wgr_x)
-        G = F.sigmoid(G_first_term + G_second_term)
+        G = torch.sigmoid(G_first_term + G_second_term)
 
         x_first_term = self.BN_fu(wf_u)
         x_second_term = self.BN_Gx(self.BN_rx(wr_x) * G)
@@ -127,6 +195,11 @@ class BasicBlock(nn.Module):
         self.downsample = downsample
         self.stride = stride
 
+    def fuse(self):
+        _fuse_pairs(self, [('conv1', 'bn1'), ('conv2', 'bn2')])
+        if self.downsample is not None:
+            fuse_sequential(self.downsample)
+
     def _conv3x3(self, in_planes, out_planes, stride=1):
         "3x3 convolution with padding"
         return nn.Conv2d(in_planes, out_planes, kernel_size=3, stride=stride,
@@ -192,6 +265,12 @@ class ResNet(nn.Module):
                                  3], kernel_size=2, stride=1, padding=0, bias=False)
         self.bn4_2 = nn.BatchNorm2d(self.output_channel_block[3])
 
+    def fuse(self):
+        _fuse_pairs(self, [('conv0_1', 'bn0_1'), ('conv0_2', 'bn0_2'), ('conv1', 'bn1'), ('conv2', 'bn2'),
+                           ('conv3', 'bn3'), ('conv4_1', 'bn4_1'), ('conv4_2', 'bn4_2')])
+        for layer in (self.layer1, self.layer2, self.layer3, self.layer4):
+            fuse_sequential(layer)
+
     def _make_layer(self, block, planes, blocks, stride=1):
         downsample = None
         if stride != 1 or self.inplanes != planes * block.expansion:
@@ -7,13 +7,22 @@ class BidirectionalLSTM(nn.Module):
         super(BidirectionalLSTM, self).__init__()
         self.rnn = nn.LSTM(input_size, hidden_size, bidirectional=True, batch_first=True)
         self.linear = nn.Linear(hidden_size * 2, output_size)
+        self.flattened = False
+
+    def _apply(self, fn, *args, **kwargs):
+        # .to() / .cuda() / .half() replace the weight tensors; flatten them again on the next forward
+        self.flattened = False
+        return super(BidirectionalLSTM, self)._apply(fn, *args, **kwargs)
 
     def forward(self, input):
         """
         input : visual feature [batch_size x T x input_size]
         output : contextual feature [batch_size x T x output_size]
         """
-        self.rnn.flatten_parameters()
+        if not self.flattened:
+            self.rnn.flatten_parameters()
+            # DataParallel training replicates the weights on every forward; at inference once is enough
+            self.flattened = not self.training
         recurrent, _ = self.rnn(input)  # batch_size x T x input_size -> batch_size x T x (2*hidden_size)
         output = self.linear(recurrent)  # batch_size x T x output_size
         return output
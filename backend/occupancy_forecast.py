@@ -0,0 +1,157 @@
+# occupancy_forecast.py
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import parking_slot_crud as crud
+from parking_sessions import sessions, bucket_occupancy
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 7 * 24
+FORECAST_HISTORY_WEEKS = int(os.getenv("FORECAST_HISTORY_WEEKS", "4"))
+FORECAST_HORIZON_HOURS = int(os.getenv("FORECAST_HORIZON_HOURS", "4"))
+FORECAST_REFRESH_SECONDS = float(os.getenv("FORECAST_REFRESH_SECONDS", "60"))
+# Weight of each newly observed hour in the hour-of-week profile
+FORECAST_LEARNING_RATE = float(os.getenv("FORECAST_LEARNING_RATE", "0.25"))
+
+
+def _hour_floor(t: datetime) -> datetime:
+    return t.replace(minute=0, second=0, microsecond=0)
+
+
+def _hour_of_week(t: datetime) -> int:
+    return t.weekday() * 24 + t.hour
+
+
+class OccupancyForecaster:
+    """
+    Predicts free slots per zone and vehicle type for the next few hours.
+
+    The baseline is a seasonal hour-of-week profile of occupied slots (booked
+    or parked), fitted from parking_sessions with NumPy. On top of it a small
+    AR(1) model on the residuals pulls the forecast from the current
+    occupancy back towards the profile. Each refresh folds the observed
+    occupancy into the profile, so the model retrains incrementally; the
+    forecasts are cached per zone and /slots/forecast only reads the cache.
+    """
+
+    def __init__(self, horizon_hours: int = FORECAST_HORIZON_HOURS,
+                 history_weeks: int = FORECAST_HISTORY_WEEKS,
+                 learning_rate: float = FORECAST_LEARNING_RATE):
+        self.horizon_hours = horizon_hours
+        self.history_weeks = history_weeks
+        self.learning_rate = learning_rate
+        self.profiles = {}   # (zone, vehicle_type) -> np.ndarray[168]
+        self.rho = {}        # (zone, vehicle_type) -> residual autocorrelation
+        self._last_observed = {}   # (zone, vehicle_type) -> hour last folded in
+        self._cache = {}     # zone -> forecast document
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------------
+    # Fitting
+    # ---------------------------------------------------------------
+    def fit(self, now: datetime = None) -> int:
+        """Fit profiles and AR(1) coefficients from the session history."""
+        now = _hour_floor(now or datetime.utcnow())
+        start = now - timedelta(weeks=self.history_weeks)
+        n_hours = int((now - start) / timedelta(hours=1))
+        how = (_hour_of_week(start) + np.arange(n_hours)) % HOURS_PER_WEEK
+        hour_counts = np.bincount(how, minlength=HOURS_PER_WEEK)
+
+        grouped = {}
+        cursor = sessions.find(
+            {"cleared_time": {"$gt": start}},
+            {"_id": 0, "zone": 1, "vehicle_type": 1,
+             "booked_time": 1, "parked_time": 1, "cleared_time": 1}
+        )
+        for s in cursor:
+            ins, outs = grouped.setdefault((s["zone"], s["vehicle_type"]), ([], []))
+            ins.append(s.get("booked_time") or s["parked_time"])
+            outs.append(s["cleared_time"])
+
+        profiles, rho = {}, {}
+        for key, (ins, outs) in grouped.items():
+            series = bucket_occupancy(ins, outs, start, timedelta(hours=1), n_hours)
+            profile = np.bincount(how, weights=series, minlength=HOURS_PER_WEEK) / np.maximum(hour_counts, 1)
+            resid = series - profile[how]
+            denom = float(np.dot(resid[:-1], resid[:-1]))
+            profiles[key] = profile
+            rho[key] = float(np.clip(np.dot(resid[1:], resid[:-1]) / denom, 0.0, 0.99)) if denom else 0.0
+
+        with self._lock:
+            self.profiles, self.rho = profiles, rho
+            self._last_observed = {}
+        logger.info("Fitted occupancy profiles for %d zone/type pairs", len(profiles))
+        return len(profiles)
+
+    def observe(self, zone: str, vehicle_type: str, occupied: float, now: datetime):
+        """Fold the occupancy seen in the current hour into the profile (once per hour)."""
+        key, hour = (zone, vehicle_type), _hour_floor(now)
+        with self._lock:
+            profile = self.profiles.setdefault(key, np.full(HOURS_PER_WEEK, float(occupied)))
+            self.rho.setdefault(key, 0.5)
+            if self._last_observed.get(key) == hour:
+                return
+            self._last_observed[key] = hour
+            h = _hour_of_week(hour)
+            profile[h] += self.learning_rate * (occupied - profile[h])
+
+    # ---------------------------------------------------------------
+    # Prediction
+    # ---------------------------------------------------------------
+    def refresh(self, now: datetime = None) -> dict:
+        """Recompute the cached forecasts from the current slot counters."""
+        now = now or datetime.utcnow()
+        steps = np.arange(1, self.horizon_hours + 1)
+        hours = [_hour_floor(now) + timedelta(hours=int(k)) for k in steps]
+        future_how = np.array([_hour_of_week(t) for t in hours])
+        cache = {}
+        for zone, types in crud.get_slot_summary()["zones"].items():
+            forecast = {}
+            for vehicle_type, counts in types.items():
+                capacity = sum(counts.values())
+                occupied = counts["booked"] + counts["parked"]
+                self.observe(zone, vehicle_type, occupied, now)
+                with self._lock:
+                    profile = self.profiles[(zone, vehicle_type)]
+                    rho = self.rho[(zone, vehicle_type)]
+                resid = occupied - profile[_hour_of_week(now)]
+                predicted = np.clip(profile[future_how] + resid * rho ** steps, 0, capacity)
+                forecast[vehicle_type] = {
+                    "capacity": capacity,
+                    "free_now": counts["free"],
+                    "forecast": [{"time": t, "free": int(round(capacity - p))}
+                                 for t, p in zip(hours, predicted)]
+                }
+            cache[zone] = {"zone": zone, "generated_at": now, "vehicle_types": forecast}
+        self._cache = cache
+        return cache
+
+    def get(self, zone: str = None) -> dict:
+        cache = self._cache
+        if zone is not None:
+            return cache.get(zone)
+        return cache
+
+    def start(self, interval: float = FORECAST_REFRESH_SECONDS) -> "OccupancyForecaster":
+        """Fit once, then refresh the cache every `interval` seconds in a daemon thread."""
+        def _loop():
+            try:
+                self.fit()
+            except Exception as e:
+                logger.error("Occupancy forecast fit failed: %s", e)
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error("Occupancy forecast refresh failed: %s", e)
+                time.sleep(interval)
+
+        threading.Thread(target=_loop, name="occupancy-forecast", daemon=True).start()
+        return self
@@ -0,0 +1,246 @@
+# parking_sessions.py
+
+import os
+import math
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import parking_slot_crud as crud
+from employee_vehicle_model import get_all_employee_plates
+from services.fee_calculator import ParkingFeeCalculator
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------------------------
+# Collection and indexes
+# -------------------------------------------------------------------
+sessions = crud.db.parking_sessions
+
+
+def ensure_session_indexes():
+    """Create the parking_sessions indexes; called once at application startup."""
+    try:
+        sessions.create_index([("cleared_time", 1)])
+        sessions.create_index([("vehicle_type", 1), ("cleared_time", 1)])
+        sessions.create_index([("vehicle_plate", 1), ("cleared_time", -1)])
+        sessions.create_index([("day", 1), ("zone", 1)])
+    except Exception as e:
+        logger.error("Failed to create indexes for parking_sessions: %s", e)
+
+SESSION_BATCH_SIZE = int(os.getenv("SESSION_BATCH_SIZE", "200"))
+SESSION_FLUSH_SECONDS = float(os.getenv("SESSION_FLUSH_SECONDS", "2"))
+
+
+def session_from_event(event: dict) -> dict:
+    """Build a parking_sessions document from a "cleared" slot event."""
+    cleared = event["cleared_time"]
+    return {
+        "slot_id": event["slot_id"],
+        "vehicle_type": event["vehicle_type"],
+        "zone": event["zone"],
+        "vehicle_plate": event["plate"],
+        "booked_time": event.get("booked_time"),
+        "parked_time": event["parked_time"],
+        "cleared_time": cleared,
+        "duration_hours": event["duration_hours"],
+        "fee": event["fee"],
+        "is_employee": event.get("is_employee", False),
+        "day": cleared.strftime("%Y-%m-%d"),
+    }
+
+
+# -------------------------------------------------------------------
+# Asynchronous batch writer
+# -------------------------------------------------------------------
+class SessionWriter:
+    """
+    Buffers completed sessions and appends them with insert_many from a
+    background thread, so clear_slot never waits on the history write.
+    """
+
+    def __init__(self, batch_size: int = SESSION_BATCH_SIZE,
+                 flush_seconds: float = SESSION_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def on_slot_event(self, event: dict):
+        if event["event"] == "cleared":
+            self._queue.put(session_from_event(event))
+
+    def start(self) -> "SessionWriter":
+        crud.add_slot_listener(self.on_slot_event)
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+        return self
+
+    def _drain(self, block: bool) -> list:
+        batch = []
+        try:
+            batch.append(self._queue.get(block=block, timeout=self.flush_seconds if block else None))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch: list):
+        if not batch:
+            return
+        try:
+            sessions.insert_many(batch, ordered=False)
+        except Exception as e:
+            logger.error("Failed to write %d parking sessions: %s", len(batch), e)
+
+    def flush(self):
+        """Write everything still buffered (called at interpreter exit)."""
+        while not self._queue.empty():
+            self._write(self._drain(block=False))
+
+    def _run(self):
+        while True:
+            self._write(self._drain(block=True))
+
+
+# -------------------------------------------------------------------
+# Analytics
+# -------------------------------------------------------------------
+def _range_match(start: datetime, end: datetime, vehicle_type: str = None) -> dict:
+    match = {"cleared_time": {"$gte": start, "$lt": end}}
+    if vehicle_type:
+        match["vehicle_type"] = vehicle_type
+    return match
+
+
+def occupancy_over_time(start: datetime, end: datetime, bucket_minutes: int = 60,
+                        vehicle_type: str = None) -> list:
+    """
+    Mean number of occupied slots in each bucket between start and end.
+    Completed sessions come from parking_sessions, vehicles still parked
+    from the slots collection.
+    """
+    query = {"parked_time": {"$lt": end}, "cleared_time": {"$gt": start}}
+    live = {"status": "parked", "parked_time": {"$lt": end}}
+    if vehicle_type:
+        query["vehicle_type"] = live["vehicle_type"] = vehicle_type
+    projection = {"_id": 0, "parked_time": 1, "cleared_time": 1}
+    rows = list(sessions.find(query, projection))
+    now = datetime.utcnow()
+    rows += [{"parked_time": d["parked_time"], "cleared_time": now}
+             for d in crud.slots.find(live, projection)]
+
+    step = timedelta(minutes=bucket_minutes)
+    n_buckets = max(math.ceil((end - start) / step), 1)
+    mean = bucket_occupancy([r["parked_time"] for r in rows],
+                            [r["cleared_time"] for r in rows],
+                            start, step, n_buckets)
+    return [{"time": start + i * step, "occupied": round(float(m), 3)}
+            for i, m in enumerate(mean)]
+
+
+def bucket_occupancy(ins: list, outs: list, start: datetime, step: timedelta,
+                     n_buckets: int) -> np.ndarray:
+    """
+    Mean number of concurrent [in, out) intervals in each of `n_buckets`
+    buckets of width `step` starting at `start`.
+    """
+    if not len(ins):
+        return np.zeros(n_buckets)
+    # Work in milliseconds; clip every interval to the requested window
+    step_ms = step / timedelta(milliseconds=1)
+    t0 = np.datetime64(start, "ms").astype(np.int64)
+    t1 = t0 + int(step_ms * n_buckets)
+    ins = np.clip(np.array(ins, dtype="datetime64[ms]").astype(np.int64), t0, t1)
+    outs = np.clip(np.array(outs, dtype="datetime64[ms]").astype(np.int64), t0, t1)
+
+    # Occupancy is a step function; integrate it at every arrival/departure
+    times = np.concatenate([ins, outs])
+    deltas = np.concatenate([np.ones(len(ins)), -np.ones(len(outs))])
+    order = np.argsort(times, kind="stable")
+    times, occupied = times[order], np.cumsum(deltas[order])
+    area = np.concatenate([[0.0], np.cumsum(np.diff(times) * occupied[:-1])])
+
+    edges = t0 + step_ms * np.arange(n_buckets + 1)
+    return np.diff(np.interp(edges, times, area)) / step_ms
+
+
+def revenue_per_day(start: datetime, end: datetime, vehicle_type: str = None) -> list:
+    pipeline = [
+        {"$match": _range_match(start, end, vehicle_type)},
+        {"$group": {"_id": "$day", "revenue": {"$sum": "$fee"}, "sessions": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]
+    return [{"day": r["_id"], "revenue": round(r["revenue"], 2), "sessions": r["sessions"]}
+            for r in sessions.aggregate(pipeline)]
+
+
+def average_dwell(start: datetime, end: datetime) -> list:
+    pipeline = [
+        {"$match": _range_match(start, end)},
+        {"$group": {"_id": "$vehicle_type",
+                    "avg_hours": {"$avg": "$duration_hours"},
+                    "sessions": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]
+    return [{"vehicle_type": r["_id"], "avg_hours": round(r["avg_hours"], 3),
+             "sessions": r["sessions"]}
+            for r in sessions.aggregate(pipeline)]
+
+
+def reprice_sessions(calculator: ParkingFeeCalculator, start: datetime, end: datetime,
+                     batch_size: int = 100_000) -> dict:
+    """
+    Recompute the fee of every session cleared between start and end with
+    `calculator` and compare it with what was charged. Sessions are priced
+    in batches with ParkingFeeCalculator.fee_batch().
+    """
+    employee_plates = np.array(get_all_employee_plates())
+    totals = {"sessions": 0, "charged": 0.0, "repriced": 0.0}
+    per_type = {}
+
+    def _price(batch):
+        plates = np.array([s["vehicle_plate"] or "" for s in batch])
+        types = [s.get("vehicle_type") for s in batch]
+        fees = calculator.fee_batch([s["parked_time"] for s in batch],
+                                    [s["cleared_time"] for s in batch],
+                                    types, np.isin(plates, employee_plates))
+        charged = np.array([s.get("fee") or 0.0 for s in batch])
+        totals["sessions"] += len(batch)
+        totals["charged"] += float(charged.sum())
+        totals["repriced"] += float(fees.sum())
+        type_arr = np.array([t or "" for t in types])
+        for vehicle_type in np.unique(type_arr):
+            mask = type_arr == vehicle_type
+            vehicle_type = str(vehicle_type)
+            row = per_type.setdefault(vehicle_type, {"sessions": 0, "charged": 0.0, "repriced": 0.0})
+            row["sessions"] += int(mask.sum())
+            row["charged"] += float(charged[mask].sum())
+            row["repriced"] += float(fees[mask].sum())
+
+    cursor = sessions.find(
+        _range_match(start, end),
+        {"_id": 0, "vehicle_plate": 1, "vehicle_type": 1, "parked_time": 1,
+         "cleared_time": 1, "fee": 1},
+        batch_size=10_000
+    )
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            _price(batch)
+            batch = []
+    if batch:
+        _price(batch)
+
+    for row in [totals, *per_type.values()]:
+        row["charged"] = round(row["charged"], 2)
+        row["repriced"] = round(row["repriced"], 2)
+        row["delta"] = round(row["repriced"] - row["charged"], 2)
+    return {**totals, "vehicle_types": per_type}
@@ -1,82 +1,344 @@
 import os
+import time
+import threading
 from datetime import datetime
-from pymongo import MongoClient
-from dotenv import load_dotenv
 import logging
 
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-if not MONGO_URI:
-    raise RuntimeError("MONGO_URI not set in .env")
+from pymongo import errors
 
-try:
-    client = MongoClient(MONGO_URI)
-except Exception as e:
-    logging.error("Failed to connect to MongoDB with MONGO_URI=%s: %s", MONGO_URI, e)
-    raise
+from db import get_db
+from coordination import get_coordinator, invalidate
+from employee_vehicle_model import employee_plates, is_employee_plate
+from services.fee_calculator import fee_calculator
 
-db = client.get_default_database()
+db = get_db()
 slots = db.parking_slots
+counters = db.slot_counters
 
-try:
-    slots.create_index("slot_id", unique=True)
-except Exception as e:
-    logging.error("Failed to create index for slots: %s", e)
+def ensure_slot_indexes():
+    """Create the parking_slots indexes; called once at application startup."""
+    try:
+        slots.create_index("slot_id", unique=True)
+        slots.create_index([("status", 1), ("booked_time", 1)])
+    except Exception as e:
+        logging.error("Failed to create index for slots: %s", e)
+    try:
+        # A plate can hold at most one booked slot, whatever the worker; it
+        # also serves the {parked_vehicle_plate, status: "booked"} lookups.
+        # Drop the plain plate index and the earlier booked-or-parked variant.
+        plate_filter = {"parked_vehicle_plate": {"$type": "string"}, "status": "booked"}
+        existing = slots.index_information()
+        if "parked_vehicle_plate_1" in existing:
+            slots.drop_index("parked_vehicle_plate_1")
+        if existing.get("one_slot_per_plate", {}).get("partialFilterExpression", plate_filter) != plate_filter:
+            slots.drop_index("one_slot_per_plate")
+        slots.create_index(
+            "parked_vehicle_plate",
+            name="one_slot_per_plate",
+            unique=True,
+            partialFilterExpression=plate_filter
+        )
+    except Exception as e:
+        logging.error("Cannot create unique one_slot_per_plate index (%s); relying on plate locks", e)
+    try:
+        slots.create_index(
+            [("status", 1), ("is_employee", 1)],
+            name="parked_employees",
+            partialFilterExpression={"status": "parked", "is_employee": True}
+        )
+    except Exception as e:
+        logging.error("Failed to create index for slots: %s", e)
+
+# Slot ranges reserved for each vehicle type
+ALLOWED_RANGES = {
+    "Bikes": (1, 40),
+    "Cars": (41, 70),
+    "ThreeWheelers": (71, 80),
+    "Vans": (81, 90),
+    "Trucks": (91, 95),
+    "Lorries": (96, 100)
+}
+DEFAULT_ZONE = os.getenv("PARKING_ZONE", "A")
+SLOT_STATUSES = ("free", "booked", "parked")
+UNASSIGNED_TYPE = "Unassigned"
+COUNTER_RECONCILE_SECONDS = float(os.getenv("SLOT_COUNTER_RECONCILE_SECONDS", "300"))
+
+# Callbacks invoked with an event dict after every slot transition
+_listeners = []
+
+def add_slot_listener(fn):
+    """Register fn(event) to be called on booked/parked/cleared/expired transitions."""
+    _listeners.append(fn)
+    return fn
+
+def emit_slot_event(event: str, doc: dict, **extra):
+    payload = {
+        "event": event,
+        "time": datetime.utcnow(),
+        "slot_id": doc["slot_id"],
+        "vehicle_type": doc.get("vehicle_type") or slot_vehicle_type(doc["slot_id"]),
+        "zone": doc.get("zone") or DEFAULT_ZONE,
+        "plate": doc.get("parked_vehicle_plate"),
+        "booked_time": doc.get("booked_time"),
+        "parked_time": doc.get("parked_time"),
+        **extra
+    }
+    for fn in list(_listeners):
+        try:
+            fn(payload)
+        except Exception as e:
+            logging.error("Slot listener %r failed on %s: %s", fn, event, e)
+    # Other workers drop anything they cached about this slot or plate
+    invalidate("slots", slot_id=payload["slot_id"], plate=payload["plate"], event=event)
+
+def plate_lock(plate: str) -> str:
+    return f"plate:{plate}"
+
+def slot_vehicle_type(slot_id: int) -> str:
+    for vehicle_type, (low, high) in ALLOWED_RANGES.items():
+        if low <= slot_id <= high:
+            return vehicle_type
+    return UNASSIGNED_TYPE
+
+def new_slot_doc(slot_id: int, vehicle_type: str = None, zone: str = None) -> dict:
+    return {"slot_id": slot_id, "status": "free",
+            "vehicle_type": vehicle_type or slot_vehicle_type(slot_id), "zone": zone or DEFAULT_ZONE,
+            "parked_vehicle_plate": None, "parked_time": None,
+            "booked_time": None, "booked_by": None,
+            "is_employee": False, "employee_id": None}
 
 def init_slots(count: int = 100):
-    """Seed slots 1-count as free (only if collection empty)."""
-    if slots.count_documents({}) == 0:
-        docs = [
-            {"slot_id": i, "status": "free",
-             "parked_vehicle_plate": None, "parked_time": None}
-            for i in range(1, count + 1)
-        ]
-        slots.insert_many(docs)
-
-def book_slot(slot_id: int, plate: str) -> dict:
-    plate = plate.strip().upper()
-    if slots.find_one({"parked_vehicle_plate": plate, "status": "booked"}):
-        _err(f"User with plate {plate} already has a booked slot")
-    return slots.find_one_and_update(
-        {"slot_id": slot_id, "status": "free"},
-        {"$set": {"status": "booked", "parked_vehicle_plate": plate}},
-        return_document=True
-    ) or _err(f"Slot {slot_id} not free")
+    """Add any of slots 1-count that are missing, as free; existing slots are left alone."""
+    existing = set(slots.distinct("slot_id", {"slot_id": {"$lte": count}}))
+    docs = [new_slot_doc(i) for i in range(1, count + 1) if i not in existing]
+    if docs:
+        try:
+            slots.insert_many(docs, ordered=False)
+        except errors.BulkWriteError:
+            pass   # another worker seeded the same slots concurrently
+        reconcile_counters()
+
+# -------------------------------------------------------------------
+# Transition specs, shared with the async services.booking_service
+# -------------------------------------------------------------------
+def normalize_plate(plate: str) -> str:
+    return str(plate).strip().upper()
+
+def _freed_fields() -> dict:
+    return {"status": "free", "parked_vehicle_plate": None, "parked_time": None,
+            "booked_time": None, "booked_by": None, **_employee_fields(None)}
+
+def book_spec(slot_id: int, plate: str, now: datetime, username: str = None):
+    """Filter/update that books a free slot; the booking user lives on the slot itself."""
+    return ({"slot_id": slot_id, "status": "free"},
+            {"$set": {"status": "booked", "parked_vehicle_plate": plate,
+                      "booked_time": now, "booked_by": username,
+                      **_employee_fields(plate)}})
+
+def park_spec(slot_id: int, plate: str, now: datetime):
+    return ({"slot_id": slot_id, "status": "booked", "parked_vehicle_plate": plate},
+            {"$set": {"status": "parked", "parked_time": now, **_employee_fields(plate)}})
+
+def clear_spec(slot_id: int, plate: str):
+    return ({"slot_id": slot_id, "status": "parked", "parked_vehicle_plate": plate},
+            {"$set": _freed_fields()})
+
+def clear_error(slot_id: int, doc: dict):
+    """Raise the reason a clear_spec() update matched nothing, given the current doc."""
+    if not doc or doc["status"] != "parked" or not doc.get("parked_time"):
+        _err(f"Slot {slot_id} not parked")
+    _err(f"Unauthorized: Slot {slot_id} is parked by {normalize_plate(doc['parked_vehicle_plate'])}")
+
+def clear_result(doc: dict, end: datetime):
+    """Fee summary for a cleared slot (`doc` is the slot before clearing)."""
+    start = doc["parked_time"]
+    hours = (end - start).total_seconds() / 3600
+    is_employee = is_employee_plate(doc["parked_vehicle_plate"])
+    fee = fee_calculator.fee(start, end, doc.get("vehicle_type") or slot_vehicle_type(doc["slot_id"]),
+                             is_employee)
+    info = {"slot_id": doc["slot_id"], "parked_time": start,
+            "cleared_time": end, "duration_hours": hours, "fee": fee}
+    return info, {"cleared_time": end, "duration_hours": hours, "fee": fee,
+                  "is_employee": is_employee}
+
+# -------------------------------------------------------------------
+# Blocking API (background jobs, scripts)
+# -------------------------------------------------------------------
+def book_slot(slot_id: int, plate: str, username: str = None) -> dict:
+    plate = normalize_plate(plate)
+    # The lock makes check-then-book atomic per plate across workers
+    with get_coordinator().lock(plate_lock(plate)):
+        if slots.find_one({"parked_vehicle_plate": plate, "status": "booked"}):
+            _err(f"User with plate {plate} already has a booked slot")
+        query, update = book_spec(slot_id, plate, datetime.utcnow(), username)
+        try:
+            doc = slots.find_one_and_update(query, update, return_document=True)
+        except errors.DuplicateKeyError:
+            _err(f"User with plate {plate} already has a booked slot")
+        if not doc:
+            _err(f"Slot {slot_id} not free")
+    _bump_counters(doc, "free", "booked")
+    emit_slot_event("booked", doc)
+    return doc
 
 def park_slot(slot_id: int, plate: str) -> dict:
-    plate = plate.strip().upper()
-    now = datetime.utcnow()
-    return slots.find_one_and_update(
-        {"slot_id": slot_id, "status": "booked",
-         "parked_vehicle_plate": plate},
-        {"$set": {"status": "parked", "parked_time": now}},
-        return_document=True
+    plate = normalize_plate(plate)
+    query, update = park_spec(slot_id, plate, datetime.utcnow())
+    doc = slots.find_one_and_update(
+        query, update, return_document=True
     ) or _err(f"Slot {slot_id} not booked for {plate}")
+    _bump_counters(doc, "booked", "parked")
+    emit_slot_event("parked", doc)
+    return doc
 
 def get_all_slots() -> list:
     return list(slots.find({}, {"_id": 0}))
 
-def clear_slot(slot_id: int, vehicle_plate: str, rate: float = 10.0) -> dict:
-    # Normalize input vehicle_plate
-    vehicle_plate = str(vehicle_plate).strip().upper()
-    doc = slots.find_one({"slot_id": slot_id})
-    if not doc or doc["status"] != "parked" or not doc["parked_time"]:
-        _err(f"Slot {slot_id} not parked")
-    stored_plate = str(doc["parked_vehicle_plate"]).strip().upper()
-    # Ensure the provided plate matches the parked plate
-    if stored_plate != vehicle_plate:
-        _err(f"Unauthorized: Slot {slot_id} is parked by {stored_plate}")
-    start, end = doc["parked_time"], datetime.utcnow()
-    hours = (end - start).total_seconds() / 3600
-    fee = round(hours * rate, 2)
-    slots.update_one(
-        {"slot_id": slot_id},
-        {"$set": {"status": "free",
-                  "parked_vehicle_plate": None,
-                  "parked_time": None}}
+def clear_slot(slot_id: int, vehicle_plate: str) -> dict:
+    # Only frees the slot if it is parked by this plate; the pre-image gives the fee inputs
+    query, update = clear_spec(slot_id, normalize_plate(vehicle_plate))
+    doc = slots.find_one_and_update(query, update)
+    if not doc:
+        clear_error(slot_id, slots.find_one({"slot_id": slot_id}))
+    info, extra = clear_result(doc, datetime.utcnow())
+    _bump_counters(doc, "parked", "free")
+    emit_slot_event("cleared", doc, **extra)
+    return info
+
+def expire_booking(slot_id: int, plate: str, booked_time: datetime):
+    """
+    Free a slot that is still booked by `plate` since `booked_time`.
+    Returns the released document, or None if it was parked, cleared or rebooked meanwhile.
+    """
+    doc = slots.find_one_and_update(
+        {"slot_id": slot_id, "status": "booked",
+         "parked_vehicle_plate": plate, "booked_time": booked_time},
+        {"$set": _freed_fields()}
     )
-    return {"slot_id": slot_id, "parked_time": start,
-            "cleared_time": end, "duration_hours": hours, "fee": fee}
+    if doc:
+        _bump_counters(doc, "booked", "free")
+        emit_slot_event("expired", doc)
+    return doc
+
+def get_parked_employee_slots() -> list:
+    """Parked slots occupied by whitelisted employees (partial index lookup)."""
+    return list(slots.find({"status": "parked", "is_employee": True}, {"_id": 0}))
+
+def _employee_fields(plate) -> dict:
+    employee_id = employee_plates.employee_id(plate) if plate else None
+    return {"is_employee": employee_id is not None, "employee_id": employee_id}
+
+def get_booked_slots() -> list:
+    """All currently booked slots (uses the status/booked_time index)."""
+    return list(slots.find({"status": "booked"},
+                           {"_id": 0, "slot_id": 1, "parked_vehicle_plate": 1, "booked_time": 1}))
+
+# -------------------------------------------------------------------
+# Availability counters (one document per vehicle type and zone)
+# -------------------------------------------------------------------
+def _counter_key(doc: dict):
+    vehicle_type = doc.get("vehicle_type") or slot_vehicle_type(doc["slot_id"])
+    zone = doc.get("zone") or DEFAULT_ZONE
+    return f"{vehicle_type}:{zone}", vehicle_type, zone
+
+def counter_spec(doc: dict, src: str, dst: str):
+    """Filter/update moving one slot of doc's type and zone from src to dst."""
+    key, vehicle_type, zone = _counter_key(doc)
+    return ({"_id": key},
+            {"$inc": {src: -1, dst: 1},
+             "$setOnInsert": {"vehicle_type": vehicle_type, "zone": zone}})
+
+def _bump_counters(doc: dict, src: str, dst: str):
+    """Move one slot between status counters; drift is fixed by reconcile_counters()."""
+    query, update = counter_spec(doc, src, dst)
+    try:
+        counters.update_one(query, update, upsert=True)
+    except Exception as e:
+        logging.error("Failed to update slot counters for %s: %s", query["_id"], e)
+
+def _vehicle_type_expr() -> dict:
+    """Aggregation expression mapping slot_id to its ALLOWED_RANGES type."""
+    return {"$switch": {
+        "branches": [
+            {"case": {"$and": [{"$gte": ["$slot_id", low]},
+                               {"$lte": ["$slot_id", high]}]},
+             "then": vehicle_type}
+            for vehicle_type, (low, high) in ALLOWED_RANGES.items()
+        ],
+        "default": UNASSIGNED_TYPE
+    }}
+
+def reconcile_counters() -> list:
+    """
+    Recount slot statuses with one aggregation and correct the counters by
+    the difference from a snapshot taken just before it. The corrections
+    are $inc'd, so transitions counted while the aggregation runs are kept.
+    """
+    before = {c["_id"]: c for c in counters.find({})}
+    pipeline = [
+        {"$group": {
+            "_id": {
+                "vehicle_type": {"$ifNull": ["$vehicle_type", _vehicle_type_expr()]},
+                "zone": {"$ifNull": ["$zone", DEFAULT_ZONE]}
+            },
+            **{status: {"$sum": {"$cond": [{"$eq": ["$status", status]}, 1, 0]}}
+               for status in SLOT_STATUSES}
+        }}
+    ]
+    rows = []
+    for row in slots.aggregate(pipeline):
+        vehicle_type, zone = row["_id"]["vehicle_type"], row["_id"]["zone"]
+        rows.append({"_id": f"{vehicle_type}:{zone}",
+                     "vehicle_type": vehicle_type, "zone": zone,
+                     **{status: row[status] for status in SLOT_STATUSES}})
+    # One document per vehicle type and zone, so a handful of updates
+    for row in rows:
+        current = before.pop(row["_id"], None) or {}
+        delta = {status: row[status] - int(current.get(status, 0)) for status in SLOT_STATUSES}
+        if current and not any(delta.values()):
+            continue
+        counters.update_one({"_id": row["_id"]},
+                            {"$inc": delta,
+                             "$setOnInsert": {"vehicle_type": row["vehicle_type"], "zone": row["zone"]}},
+                            upsert=True)
+    # Types and zones no slot has any more: zero them, then drop them unless one came back
+    for key, current in before.items():
+        delta = {status: -int(current.get(status, 0)) for status in SLOT_STATUSES}
+        if any(delta.values()):
+            counters.update_one({"_id": key}, {"$inc": delta})
+    if before:
+        counters.delete_many({"_id": {"$in": list(before)}, **dict.fromkeys(SLOT_STATUSES, 0)})
+    return rows
+
+def start_counter_reconciler(interval: float = COUNTER_RECONCILE_SECONDS) -> threading.Thread:
+    """Run reconcile_counters() now and then every `interval` seconds in a daemon thread."""
+    def _loop():
+        while True:
+            try:
+                reconcile_counters()
+            except Exception as e:
+                logging.error("Slot counter reconciliation failed: %s", e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=_loop, name="slot-counter-reconciler", daemon=True)
+    thread.start()
+    return thread
+
+def get_slot_summary() -> dict:
+    """Free/booked/parked counts per vehicle type and per zone, read from the counters."""
+    return summarize_counters(counters.find({}))
+
+def summarize_counters(rows) -> dict:
+    by_type, by_zone = {}, {}
+    total = dict.fromkeys(SLOT_STATUSES, 0)
+    for row in rows:
+        counts = {status: max(int(row.get(status, 0)), 0) for status in SLOT_STATUSES}
+        type_counts = by_type.setdefault(row["vehicle_type"], dict.fromkeys(SLOT_STATUSES, 0))
+        for status, n in counts.items():
+            type_counts[status] += n
+            total[status] += n
+        by_zone.setdefault(row["zone"], {})[row["vehicle_type"]] = counts
+    return {"vehicle_types": by_type, "zones": by_zone, "total": total}
 
 def _err(msg):
-    raise ValueError(msg)
\ No newline at end of file
+    raise ValueError(msg)
@@ -0,0 +1,213 @@
+# plate_index.py
+
+"""
+In-memory fuzzy index of known plates (active bookings and registered users)
+for reconciling OCR output with bookings.
+
+Plates are folded to OCR confusion classes (O/0/D/Q, I/1/L, B/8, S/5, Z/2,
+G/6, A/4) and indexed by every variant with up to PLATE_MATCH_MAX_EDITS
+characters deleted (symmetric-delete lookup). A query generates its own
+deletion variants, so candidates within k edits come from a handful of dict
+lookups; unlike a BK-tree, entries can be removed when a booking ends.
+Candidates are ranked by an edit distance in which a confusable substitution
+costs CONFUSION_COST instead of 1, and
+    confidence = 1 - distance / max(len(query), len(plate)).
+
+Bookings follow the slot invalidations every worker publishes on
+book/park/clear; a periodic reload from MongoDB repairs anything missed.
+"""
+
+import os
+import time
+import logging
+import threading
+from itertools import combinations
+
+from db import get_db
+from coordination import on_invalidate
+
+logger = logging.getLogger(__name__)
+
+PLATE_MATCH_MAX_EDITS = int(os.getenv("PLATE_MATCH_MAX_EDITS", "2"))
+PLATE_MATCH_MIN_CONFIDENCE = float(os.getenv("PLATE_MATCH_MIN_CONFIDENCE", "0.9"))
+PLATE_MATCH_MIN_MARGIN = float(os.getenv("PLATE_MATCH_MIN_MARGIN", "0.05"))
+PLATE_INDEX_REFRESH_SECONDS = float(os.getenv("PLATE_INDEX_REFRESH_SECONDS", "300"))
+CONFUSION_COST = 0.3
+
+CONFUSION_GROUPS = ("0ODQ", "1IL", "8B", "5S", "2Z", "6G", "4A")
+_CANONICAL = {c: group[0] for group in CONFUSION_GROUPS for c in group}
+
+BOOKING, USER = "booking", "user"
+
+
+def canonical(plate: str) -> str:
+    return "".join(_CANONICAL.get(c, c) for c in plate)
+
+
+def _deletions(text: str, k: int) -> set:
+    variants = {text}
+    for n in range(1, min(k, len(text)) + 1):
+        for drop in combinations(range(len(text)), n):
+            variants.add("".join(c for i, c in enumerate(text) if i not in drop))
+    return variants
+
+
+def _substitution(a: str, b: str) -> float:
+    if a == b:
+        return 0.0
+    return CONFUSION_COST if _CANONICAL.get(a, a) == _CANONICAL.get(b, b) else 1.0
+
+
+def plate_distance(a: str, b: str) -> float:
+    """Optimal-string-alignment distance with cheap substitutions between confusable characters."""
+    prev2, prev = None, [float(j) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        row = [float(i)] + [0.0] * len(b)
+        for j in range(1, len(b) + 1):
+            row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + _substitution(a[i - 1], b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], prev2[j - 2] + 1)
+        prev2, prev = prev, row
+    return prev[-1]
+
+
+class PlateIndex:
+    """Plates by kind (booking/user) with symmetric-delete candidate lookup."""
+
+    def __init__(self, max_edits: int = PLATE_MATCH_MAX_EDITS):
+        self.max_edits = max_edits
+        self._kinds = {}      # plate -> set of kinds
+        self._variants = {}   # deletion variant of canonical(plate) -> set of plates
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._kinds)
+
+    def _insert(self, plate: str):
+        for variant in _deletions(canonical(plate), self.max_edits):
+            self._variants.setdefault(variant, set()).add(plate)
+
+    def _delete(self, plate: str):
+        for variant in _deletions(canonical(plate), self.max_edits):
+            bucket = self._variants.get(variant)
+            if bucket is not None:
+                bucket.discard(plate)
+                if not bucket:
+                    del self._variants[variant]
+
+    def add(self, plate: str, kind: str):
+        if not plate:
+            return
+        plate = str(plate).strip().upper()
+        with self._lock:
+            kinds = self._kinds.get(plate)
+            if kinds is None:
+                kinds = self._kinds[plate] = set()
+                self._insert(plate)
+            kinds.add(kind)
+
+    def remove(self, plate: str, kind: str):
+        if not plate:
+            return
+        plate = str(plate).strip().upper()
+        with self._lock:
+            kinds = self._kinds.get(plate)
+            if kinds is None:
+                return
+            kinds.discard(kind)
+            if not kinds:
+                del self._kinds[plate]
+                self._delete(plate)
+
+    def replace(self, kind: str, plates):
+        """Make `plates` the complete set of plates of this kind."""
+        wanted = {str(p).strip().upper() for p in plates if p}
+        with self._lock:
+            current = {p for p, kinds in self._kinds.items() if kind in kinds}
+        for plate in current - wanted:
+            self.remove(plate, kind)
+        for plate in wanted - current:
+            self.add(plate, kind)
+
+    # ---------------------------------------------------------------
+    # Lookup
+    # ---------------------------------------------------------------
+    def candidates(self, text: str, limit: int = 5, kind: str = None) -> list:
+        """Known plates within max_edits of text, best first."""
+        text = str(text or "").strip().upper()
+        if not text:
+            return []
+        with self._lock:
+            found = set()
+            for variant in _deletions(canonical(text), self.max_edits):
+                found.update(self._variants.get(variant, ()))
+            found = [(p, set(self._kinds[p])) for p in found if kind is None or kind in self._kinds[p]]
+        matches = []
+        for plate, kinds in found:
+            distance = plate_distance(text, plate)
+            if distance > self.max_edits:
+                continue
+            matches.append({
+                "plate": plate,
+                "distance": round(distance, 2),
+                "confidence": round(1 - distance / max(len(text), len(plate)), 3),
+                "booked": BOOKING in kinds,
+                "registered": USER in kinds,
+            })
+        matches.sort(key=lambda m: (-m["confidence"], m["plate"]))
+        return matches[:limit]
+
+    def best_booking(self, text: str, min_confidence: float = PLATE_MATCH_MIN_CONFIDENCE,
+                     min_margin: float = PLATE_MATCH_MIN_MARGIN) -> dict:
+        """
+        The booked plate text most likely reads as, or None when the best
+        candidate is below min_confidence or not clearly ahead of the next.
+        """
+        matches = self.candidates(text, limit=2, kind=BOOKING)
+        if not matches or matches[0]["confidence"] < min_confidence:
+            return None
+        if len(matches) > 1 and matches[0]["confidence"] - matches[1]["confidence"] < min_margin:
+            return None
+        return matches[0]
+
+    # ---------------------------------------------------------------
+    # Keeping it current
+    # ---------------------------------------------------------------
+    def load(self):
+        """Reload every booked plate and registered user's plate from MongoDB."""
+        db = get_db()
+        booked = db.parking_slots.distinct("parked_vehicle_plate", {"status": "booked"})
+        registered = db.users.distinct("vehicle_plate")
+        self.replace(BOOKING, booked)
+        self.replace(USER, registered)
+        logger.info("Plate index loaded: %d bookings, %d users", len(booked), len(registered))
+
+    def _on_slot_change(self, key: dict):
+        plate = key.get("plate")
+        if key.get("event") == "booked":
+            self.add(plate, BOOKING)
+        elif plate:
+            # parked, cleared, expired or an admin status change: no longer awaiting arrival
+            self.remove(plate, BOOKING)
+
+    def start(self, interval: float = PLATE_INDEX_REFRESH_SECONDS) -> threading.Thread:
+        """Load now, follow slot changes from every worker, and reload every `interval` seconds."""
+        if self._thread is not None:
+            return self._thread
+        on_invalidate("slots", self._on_slot_change)
+
+        def _loop():
+            while True:
+                try:
+                    self.load()
+                except Exception as e:
+                    logger.error("Plate index reload failed: %s", e)
+                time.sleep(interval)
+
+        self._thread = threading.Thread(target=_loop, name="plate-index-reload", daemon=True)
+        self._thread.start()
+        return self._thread
+
+
+plate_index = PlateIndex()
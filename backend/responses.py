@@ -0,0 +1,227 @@
+# responses.py
+
+"""
+API response encoding: orjson for JSON, MessagePack on request.
+
+FastAPI runs every returned dict through jsonable_encoder, which walks it
+reflectively and converts each datetime by hand, then json.dumps the copy.
+Endpoints return APIResponse(content) instead: the dicts coming out of
+Mongo and the inference pipeline are encoded as they are, in one orjson
+call, with datetimes (naive values are UTC, as stored), numpy arrays and
+scalars handled natively. The typed models below describe those dicts for
+the OpenAPI schema (response_model=...) at no cost per request; they are
+TypedDicts, so nothing is validated or copied.
+
+Clients that send "Accept: application/msgpack" (the lane controllers) get
+the same content as MessagePack when msgpack is installed, with datetimes as
+MessagePack timestamps. Idempotent replays are re-rendered from the stored
+content, so they follow the retry's Accept header too.
+"""
+
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+
+import orjson
+from starlette.responses import JSONResponse
+from typing_extensions import NotRequired, TypedDict
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+# -------------------------------------------------------------------
+# Encoding
+# -------------------------------------------------------------------
+def _default(value):
+    """Types neither encoder handles itself (ObjectId, pydantic models, sets, bytes)."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode()
+    if hasattr(value, "tolist"):   # numpy, for msgpack
+        return value.tolist()
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _msgpack_default(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    return _default(value)
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+def packb(content) -> bytes:
+    return msgpack.packb(content, default=_msgpack_default, datetime=False)
+
+
+def wants_msgpack(scope) -> bool:
+    """True if the request's Accept header asks for MessagePack and it can be produced."""
+    if msgpack is None:
+        return False
+    for name, value in scope.get("headers", ()):
+        if name == b"accept":
+            accept = value.decode("latin-1").lower()
+            return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+    return False
+
+
+# -------------------------------------------------------------------
+# Response class
+# -------------------------------------------------------------------
+class APIResponse(JSONResponse):
+    """
+    orjson-encoded JSON, or MessagePack when the request asks for it.
+
+    The JSON body is rendered up front, the MessagePack one only when the
+    response is sent, from the same content (kept on .content).
+    """
+
+    media_type = JSON_MEDIA_TYPE
+
+    def __init__(self, content, status_code: int = 200, headers: dict = None, background=None):
+        self.content = content
+        headers = dict(headers or {})
+        if msgpack is not None:
+            headers.setdefault("vary", "accept")
+        super().__init__(content, status_code, headers, background=background)
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+    async def __call__(self, scope, receive, send):
+        if wants_msgpack(scope):
+            extra = [(k, v) for k, v in self.raw_headers if k not in (b"content-length", b"content-type")]
+            self.body = packb(self.content)
+            self.media_type = MSGPACK_MEDIA_TYPES[0]
+            self.init_headers()
+            self.raw_headers += extra
+        await super().__call__(scope, receive, send)
+
+
+# -------------------------------------------------------------------
+# Response models (OpenAPI only; endpoints return plain dicts)
+# -------------------------------------------------------------------
+class Slot(TypedDict):
+    slot_id: int
+    status: str
+    vehicle_type: str
+    zone: str
+    parked_vehicle_plate: Optional[str]
+    parked_time: Optional[datetime]
+    booked_time: Optional[datetime]
+    booked_by: Optional[str]
+    is_employee: bool
+    employee_id: Optional[str]
+    last_updated: NotRequired[datetime]
+
+
+class ClearedSlot(TypedDict):
+    slot_id: int
+    parked_time: datetime
+    cleared_time: datetime
+    duration_hours: float
+    fee: float
+
+
+class SlotSummary(TypedDict):
+    vehicle_types: Dict[str, Dict[str, int]]
+    zones: Dict[str, Dict[str, Dict[str, int]]]
+    total: Dict[str, int]
+
+
+class ForecastPoint(TypedDict):
+    time: datetime
+    free: int
+
+
+class VehicleTypeForecast(TypedDict):
+    capacity: int
+    free_now: int
+    forecast: List[ForecastPoint]
+
+
+class ZoneForecast(TypedDict):
+    zone: str
+    generated_at: datetime
+    vehicle_types: Dict[str, VehicleTypeForecast]
+
+
+class OccupancyPoint(TypedDict):
+    time: datetime
+    occupied: float
+
+
+class RevenueDay(TypedDict):
+    day: str
+    revenue: float
+    sessions: int
+
+
+class DwellByType(TypedDict):
+    vehicle_type: str
+    avg_hours: float
+    sessions: int
+
+
+class PlateRecognition(TypedDict):
+    vehicle_types: List[str]
+    recognized_plates: List[str]
+    plate_confidences: List[float]
+    annotated_image: str            # base64 PNG
+    suggested_slot: Optional[int]
+    auto_parked: bool
+    message: Optional[str]
+    matched_plate: Optional[str]
+    match_confidence: Optional[float]
+
+
+class SlotBox(TypedDict):
+    x1: int
+    y1: int
+    x2: int
+    y2: int
+
+
+class DetectedSlot(TypedDict):
+    status: str
+    confidence: float
+    coordinates: SlotBox
+
+
+class SlotDetection(TypedDict):
+    slots: List[DetectedSlot]
+    total_slots: int
+    occupied_slots: int
+    empty_slots: int
+    annotated_image: str            # base64 PNG
+
+
+class PlateCandidate(TypedDict):
+    plate: str
+    distance: float
+    confidence: float
+    booked: bool
+    registered: bool
+
+
+class PlateMatch(TypedDict):
+    text: str
+    candidates: List[PlateCandidate]
@@ -0,0 +1,37 @@
+import os
+import sys
+import argparse
+
+from pymongo import UpdateOne
+
+# Allow running as `python scripts/backfill_employee_flags.py` from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from employee_vehicle_model import employee_plates
+from parking_slot_crud import slots
+
+def backfill_employee_flags(batch_size: int = 1000) -> int:
+    """Set is_employee/employee_id on every slot from the current whitelist."""
+    employee_plates.reload()
+    updated, ops = 0, []
+    cursor = slots.find({}, {"_id": 1, "status": 1, "parked_vehicle_plate": 1,
+                             "is_employee": 1, "employee_id": 1})
+    for doc in cursor:
+        plate = doc.get("parked_vehicle_plate")
+        active = doc.get("status") in ("booked", "parked") and plate
+        employee_id = employee_plates.employee_id(plate) if active else None
+        fields = {"is_employee": employee_id is not None, "employee_id": employee_id}
+        if any(doc.get(k, "missing") != v for k, v in fields.items()):
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if len(ops) >= batch_size:
+            updated += slots.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += slots.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill is_employee flags on parking slots")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    print(f"Updated {backfill_employee_flags(args.batch_size)} slots")
@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import argparse
+
+# Allow running as `python scripts/migrate_slots.py` from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_client
+from slot_layout import (
+    BATCH_SIZE,
+    build_layout,
+    load_layout_file,
+    migrate_legacy,
+    parse_ranges,
+    reconcile_layout,
+    summarize,
+)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Seed and migrate parking slots to a target layout without touching live bookings. "
+                    "Prints the diff; nothing is written without --apply.")
+    parser.add_argument("--count", type=int, default=100, help="Number of slots (1..count)")
+    parser.add_argument("--zones", default="", help='Zone ranges, e.g. "A:1-50,B:51-100"')
+    parser.add_argument("--types", default="", help='Vehicle type ranges, e.g. "Bikes:1-40,Cars:41-70" '
+                                                    "(default: the API's allowed ranges)")
+    parser.add_argument("--layout", help="JSON layout file with count, zones and vehicle_types")
+    parser.add_argument("--prune", action="store_true", help="Delete free slots outside the layout")
+    parser.add_argument("--legacy-db", help="Also import legacy parking_slots/slot_allocations "
+                                            "from this database (e.g. parkvision_db)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--apply", action="store_true", help="Write the changes")
+    parser.add_argument("--json", action="store_true", help="Print the full diff as JSON")
+    args = parser.parse_args()
+
+    if args.layout:
+        spec = load_layout_file(args.layout)
+    else:
+        spec = {"count": args.count, "zones": parse_ranges(args.zones),
+                "vehicle_types": parse_ranges(args.types)}
+
+    report = {"legacy_in_place": migrate_legacy(apply=args.apply, batch_size=args.batch_size)}
+    if args.legacy_db:
+        legacy = get_client()[args.legacy_db]
+        for name in ("parking_slots", "slot_allocations"):
+            report[f"legacy_{name}"] = migrate_legacy(legacy[name], apply=args.apply,
+                                                       batch_size=args.batch_size)
+    report["layout"] = reconcile_layout(build_layout(**spec), apply=args.apply, prune=args.prune,
+                                        batch_size=args.batch_size)
+
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        for section, diff in report.items():
+            print(f"[{section}]")
+            print(summarize(diff))
+        if not args.apply:
+            print("\nDry run: re-run with --apply to write these changes.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Stand-in OTLP/HTTP collector for local tracing without an OpenTelemetry
+Collector: accepts JSON POSTs on /v1/traces, appends each payload to a file
+and prints one line per span.
+
+    python scripts/otlp_collector.py --port 4318 --output traces.jsonl
+    TRACE_EXPORTER=otlp TRACE_SAMPLE_RATIO=1 uvicorn main:app
+"""
+
+import json
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def span_lines(payload: dict):
+    for resource in payload.get("resourceSpans", []):
+        for scope in resource.get("scopeSpans", []):
+            for s in scope.get("spans", []):
+                ms = (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6
+                parent = s.get("parentSpanId", "-" * 16)
+                yield f"{s['traceId']} {parent} {s['spanId']} {ms:9.2f} ms  {s['name']}"
+
+
+def make_handler(output: str, quiet: bool):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_error(404)
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                self.send_error(400, "expected OTLP/JSON")
+                return
+            with open(output, "a") as f:
+                f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+            if not quiet:
+                for line in span_lines(payload):
+                    print(line)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minimal OTLP/HTTP (JSON) trace collector")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", default="traces.jsonl")
+    parser.add_argument("--quiet", action="store_true", help="Do not print received spans")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.output, args.quiet))
+    print(f"Collecting OTLP traces on http://{args.host}:{args.port}/v1/traces -> {args.output}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+
+# Allow running as `python scripts/reprice_sessions.py` from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parking_sessions import reprice_sessions
+from services.fee_calculator import ParkingFeeCalculator, load_tariff
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprice parking session history with a tariff file")
+    parser.add_argument("--tariff", help="Tariff JSON file (defaults to TARIFF_FILE / built-in tariff)")
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        default=datetime.utcnow() - timedelta(days=30))
+    parser.add_argument("--end", type=datetime.fromisoformat, default=datetime.utcnow())
+    args = parser.parse_args()
+
+    calculator = ParkingFeeCalculator(load_tariff(args.tariff or os.getenv("TARIFF_FILE")))
+    report = reprice_sessions(calculator, args.start, args.end)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
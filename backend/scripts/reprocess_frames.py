@@ -0,0 +1,278 @@
+"""
+Re-run plate extraction over archived gate images, without the HTTP API.
+
+Frames come from a directory (searched recursively) or a tar archive and go
+through the same PlateRecognitionService as /predict_ocr, in a process pool
+where every worker loads the model once. Workers read frames themselves
+through mmap (tar members are sliced out of one mapping of the archive), and
+the producer asks the kernel to read --prefetch frames ahead of the few
+chunks the pool has in flight. Results are written
+in batches to NDJSON or Parquet (one part file per batch, needs pyarrow);
+after each batch a checkpoint records how far the sorted input got, so an
+interrupted run continues where it stopped when started again.
+
+    python scripts/reprocess_frames.py /archive/gate-2025-05 --output gate.ndjson --workers 8
+    python scripts/reprocess_frames.py frames.tar --output gate-parquet/ --format parquet
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import tarfile
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+
+# Allow running as `python scripts/reprocess_frames.py` from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+CHUNKSIZE = 8
+
+
+# -------------------------------------------------------------------
+# Input
+# -------------------------------------------------------------------
+def list_frames(source: str) -> list:
+    """Sorted (name, offset, size) per frame; offset/size locate tar members, else None."""
+    if os.path.isdir(source):
+        names = []
+        for root, _, files in os.walk(source):
+            names.extend(os.path.relpath(os.path.join(root, f), source)
+                         for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+        return [(name, None, None) for name in sorted(names)]
+    with tarfile.open(source) as tar:
+        members = [(m.name, m.offset_data, m.size) for m in tar
+                   if m.isfile() and m.name.lower().endswith(IMAGE_EXTENSIONS)]
+    return sorted(members)
+
+
+def prefetch(source: str, frames, depth: int):
+    """Yield frames while advising the kernel to read `depth` frames ahead."""
+    is_dir = os.path.isdir(source)
+    archive = None if is_dir else os.open(source, os.O_RDONLY)
+    ahead = deque()
+    try:
+        for frame in frames:
+            name, offset, size = frame
+            if hasattr(os, "posix_fadvise"):
+                if is_dir:
+                    try:
+                        fd = os.open(os.path.join(source, name), os.O_RDONLY)
+                        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                        os.close(fd)
+                    except OSError:
+                        pass
+                else:
+                    os.posix_fadvise(archive, offset, size, os.POSIX_FADV_WILLNEED)
+            ahead.append(frame)
+            if len(ahead) > depth:
+                yield ahead.popleft()
+        while ahead:
+            yield ahead.popleft()
+    finally:
+        if archive is not None:
+            os.close(archive)
+
+
+def bounded(frames, slots: threading.Semaphore):
+    """
+    Yield frames only while a slot is free; the consumer releases one per
+    result. Pool.imap's task feeder drains its input as fast as it can, so
+    without this the whole archive (and every fadvise) would be queued at once.
+    """
+    for frame in frames:
+        slots.acquire()
+        yield frame
+
+
+# -------------------------------------------------------------------
+# Workers
+# -------------------------------------------------------------------
+_service = None
+_source = None
+_archive = None
+
+
+def init_worker(source: str, model_path: str, pipeline: str, imgsz: int, reduction: int, threads: int):
+    """Pool initializer: one model per worker process, and one mapping of a tar archive."""
+    global _service, _source, _archive
+    import cv2
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from app.plate_service import PlateRecognitionService
+
+    _service = PlateRecognitionService(model_path, pipeline=pipeline, imgsz=imgsz, reduction=reduction)
+    _source = source
+    if not os.path.isdir(source):
+        with open(source, "rb") as f:
+            _archive = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def process_frame(frame) -> dict:
+    name, offset, size = frame
+    started = time.perf_counter()
+    row = {"source": name, "vehicle_types": [], "plates": [], "confidences": [],
+           "engines": [], "valid": [], "error": None}
+    try:
+        if _archive is not None:
+            data = memoryview(_archive)[offset:offset + size]
+            _, vehicles, plates = _service.recognize(data, annotate=False)
+        else:
+            with open(os.path.join(_source, name), "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                _, vehicles, plates = _service.recognize(data, annotate=False)
+        row.update(vehicle_types=vehicles,
+                   plates=[p["text"] for p in plates],
+                   confidences=[p["confidence"] for p in plates],
+                   engines=[p["engine"] for p in plates],
+                   valid=[p["valid"] for p in plates])
+    except Exception as e:
+        row["error"] = str(e) or type(e).__name__
+    row["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return row
+
+
+# -------------------------------------------------------------------
+# Output and checkpoints
+# -------------------------------------------------------------------
+class NDJSONWriter:
+    def __init__(self, path: str, checkpoint: dict):
+        self.path = path
+        mode = "r+b" if os.path.exists(path) else "wb"
+        self._file = open(path, mode)
+        # Drop rows written after the last checkpoint; they are redone
+        self._file.truncate(checkpoint.get("bytes", 0))
+        self._file.seek(0, os.SEEK_END)
+
+    def write(self, rows: list) -> dict:
+        self._file.write(b"".join(json.dumps(r, separators=(",", ":")).encode() + b"\n" for r in rows))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {"bytes": self._file.tell()}
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path: str, checkpoint: dict):
+        import pyarrow
+        import pyarrow.parquet
+        self._pa, self._pq = pyarrow, pyarrow.parquet
+        # Explicit so that a batch of only failed frames has the same column types
+        self.schema = pyarrow.schema([
+            ("source", pyarrow.string()),
+            ("vehicle_types", pyarrow.list_(pyarrow.string())),
+            ("plates", pyarrow.list_(pyarrow.string())),
+            ("confidences", pyarrow.list_(pyarrow.float64())),
+            ("engines", pyarrow.list_(pyarrow.string())),
+            ("valid", pyarrow.list_(pyarrow.bool_())),
+            ("error", pyarrow.string()),
+            ("elapsed_ms", pyarrow.float64()),
+        ])
+        self.path = path
+        self.parts = checkpoint.get("parts", 0)
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.startswith("part-") and int(name[5:10]) >= self.parts:
+                os.remove(os.path.join(path, name))
+
+    def write(self, rows: list) -> dict:
+        table = self._pa.Table.from_pylist(rows, schema=self.schema)
+        tmp = os.path.join(self.path, f".part-{self.parts:05d}.parquet")
+        self._pq.write_table(table, tmp)
+        os.replace(tmp, os.path.join(self.path, f"part-{self.parts:05d}.parquet"))
+        self.parts += 1
+        return {"parts": self.parts}
+
+    def close(self):
+        pass
+
+
+def checkpoint_path(output: str) -> str:
+    return output.rstrip("/") + ".checkpoint.json"
+
+
+def load_checkpoint(output: str, source: str, total: int) -> dict:
+    path = checkpoint_path(output)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("source") != os.path.abspath(source) or checkpoint.get("total") != total:
+        raise SystemExit(f"{path} belongs to a different input; remove it or choose another --output")
+    return checkpoint
+
+
+def save_checkpoint(output: str, checkpoint: dict):
+    path = checkpoint_path(output)
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocess archived gate frames through the plate pipeline")
+    parser.add_argument("source", help="Directory of images or a tar archive")
+    parser.add_argument("--output", required=True, help="NDJSON file, or a directory for --format parquet")
+    parser.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson")
+    parser.add_argument("--model", default="best5.pt")
+    parser.add_argument("--pipeline", choices=["full", "two_stage"], default=os.getenv("PLATE_PIPELINE", "full"))
+    parser.add_argument("--imgsz", type=int, default=int(os.getenv("DETECT_IMGSZ", "640")))
+    parser.add_argument("--reduction", type=int, choices=[1, 2, 4, 8], default=1,
+                        help="Decode at 1/N resolution (cv2.IMREAD_REDUCED_COLOR_N)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per write and checkpoint")
+    parser.add_argument("--prefetch", type=int, default=64, help="Frames to read ahead of the pool")
+    parser.add_argument("--limit", type=int, help="Stop after this many frames (for trial runs)")
+    args = parser.parse_args()
+
+    frames = list_frames(args.source)
+    if args.limit:
+        frames = frames[:args.limit]
+    checkpoint = load_checkpoint(args.output, args.source, len(frames))
+    done = checkpoint.get("done", 0)
+    checkpoint.update(source=os.path.abspath(args.source), total=len(frames))
+    print(f"{len(frames)} frames, {done} already done")
+
+    writer = (ParquetWriter if args.format == "parquet" else NDJSONWriter)(args.output, checkpoint)
+    init_args = (args.source, args.model, args.pipeline, args.imgsz, args.reduction, args.threads_per_worker)
+    started, batch, errors, resumed_at = time.perf_counter(), [], 0, done
+    try:
+        with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=init_args) as pool:
+            # Two chunks per worker in flight; prefetch reads ahead of those
+            in_flight = threading.Semaphore(2 * args.workers * CHUNKSIZE)
+            queued = bounded(prefetch(args.source, frames[done:], args.prefetch), in_flight)
+            # imap keeps input order, so the checkpoint is simply a count of frames written
+            rows = pool.imap(process_frame, queued, chunksize=CHUNKSIZE)
+            for row in rows:
+                in_flight.release()
+                batch.append(row)
+                errors += row["error"] is not None
+                if len(batch) >= args.batch_size:
+                    done += len(batch)
+                    checkpoint.update(writer.write(batch), done=done)
+                    save_checkpoint(args.output, checkpoint)
+                    batch = []
+                    rate = (done - resumed_at) / (time.perf_counter() - started)
+                    print(f"{done}/{len(frames)} frames, {rate:.1f}/s, {errors} errors", flush=True)
+            if batch:
+                done += len(batch)
+                checkpoint.update(writer.write(batch), done=done)
+                save_checkpoint(args.output, checkpoint)
+    finally:
+        writer.close()
+    print(f"Finished {done}/{len(frames)} frames in {time.perf_counter() - started:.1f}s, {errors} errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# serve.py
+
+"""
+Pre-fork server: load the models once, then fork the workers.
+
+`uvicorn main:app --workers N` starts N interpreters that each import
+main.py and load their own copy of every model. Here the parent imports
+main.py (YOLO plate and slot models, plus the CRNN when it is in
+OCR_CASCADE), runs a full collection and gc.freeze()s the heap, and only
+then forks. Workers share the weight pages copy-on-write: tensor storage
+is never written during inference, and frozen objects are not visited by
+the collector, so their pages stay clean too. Each worker runs its own
+event loop, lifespan (database indexes, background jobs) and connection
+pools on the listening socket opened by the parent.
+
+No inference runs in the parent, so the torch/OpenMP thread pools are first
+started inside the workers. A dead worker is replaced; SIGTERM or SIGINT
+stops them all.
+
+    python serve.py --workers 4 --port 8000
+    python benchmarks/worker_memory.py      # memory per worker vs uvicorn --workers
+"""
+
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+
+import uvicorn
+
+logger = logging.getLogger("serve")
+
+
+def listen(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def load_models(threads_per_worker: int):
+    """Import the app (which loads its models) and preload the OCR cascade; returns the ASGI app."""
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+        # Requests are already spread over the workers; no inter-op pool per worker
+        torch.set_num_interop_threads(1)
+    except ImportError:
+        pass
+    import main
+    from app.plate_service import OCR_CASCADE, get_recognizer
+
+    for name in OCR_CASCADE:
+        get_recognizer(name)
+    return main.app
+
+
+def run_worker(app, sock: socket.socket, log_level: str):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve main:app from workers forked after loading the models")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    parser.add_argument("--threads-per-worker", type=int,
+                        help="torch intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // args.workers)
+    sock = listen(args.host, args.port)
+    app = load_models(threads)
+    gc.collect()
+    gc.freeze()
+    logger.info("Models loaded in parent %d; forking %d workers", os.getpid(), args.workers)
+
+    workers, stopping = set(), False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app, sock, args.log_level)
+            finally:
+                os._exit(0)
+        workers.add(pid)
+        logger.info("Started worker %d", pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(args.workers):
+        spawn()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            logger.warning("Worker %d exited (status %d); restarting", pid, status)
+            time.sleep(1)   # do not spin when workers die at startup
+            spawn()
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
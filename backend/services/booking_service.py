@@ -1,119 +1,112 @@
 from datetime import datetime
 from typing import Dict, Optional
-from pymongo.collection import Collection
 import logging
 
-logger = logging.getLogger(__name__)
+from pymongo import errors
 
-class BookingService:
-    def __init__(self, users_collection: Collection, slots_collection: Collection):
-        self.users = users_collection
-        self.slots = slots_collection
+from coordination import get_coordinator
+from parking_slot_crud import (
+    book_spec,
+    park_spec,
+    clear_spec,
+    clear_error,
+    clear_result,
+    emit_slot_event,
+    normalize_plate,
+    plate_lock,
+)
+from services.database_service import DatabaseService, get_database_service
+from tracing import mongo_span
 
-    async def book_slot(self, slot_id: str, vehicle_plate: str) -> Dict:
-        """Book a parking slot for a vehicle."""
-        try:
-            # Input validation
-            if not slot_id or not vehicle_plate:
-                return {"error": "Slot ID and vehicle plate are required"}
+logger = logging.getLogger(__name__)
 
-            # Normalize vehicle plate
-            vehicle_plate = vehicle_plate.strip().upper()
-            logger.info(f"Booking slot {slot_id} for vehicle {vehicle_plate}")
+class BookingService:
+    """
+    Slot state transitions on the non-blocking driver.
 
-            # 1. Check if user exists
-            user = self.users.find_one({"vehicle_plate": vehicle_plate})
-            if not user:
-                logger.error(f"User not found for vehicle plate: {vehicle_plate}")
-                return {"error": "User not found. Please register first."}
+    Each transition is a single find_one_and_update on the slot document,
+    which also records who booked it (booked_by), so the user's booking and
+    the slot can never disagree; the user's current slot is looked up via
+    the indexed parked_vehicle_plate field instead of a pointer on the user.
+    Filters and updates are shared with the blocking functions in
+    parking_slot_crud, and booking holds the same per-plate lock.
+    """
 
-            # 2. Check if user already has a booking
-            if user.get("booked_slot"):
-                current_slot = self.slots.find_one({"slot_id": user["booked_slot"]})
-                if current_slot and current_slot.get("is_booked"):
-                    logger.error(f"User already has booked slot: {user['booked_slot']}")
-                    return {"error": f"You already have booked slot {user['booked_slot']}"}
-                else:
-                    # Clear invalid booking
-                    self.users.update_one(
-                        {"vehicle_plate": vehicle_plate},
-                        {"$set": {"booked_slot": None}}
-                    )
+    def __init__(self, db_service: Optional[DatabaseService] = None):
+        self.db = db_service or get_database_service()
+        self.slots = self.db.parking_slots
 
-            # 3. Check if slot exists and is available
-            slot = self.slots.find_one({"slot_id": slot_id})
-            if not slot:
-                logger.error(f"Invalid slot ID: {slot_id}")
-                return {"error": "Invalid parking slot"}
+    async def book_slot(self, slot_id: int, vehicle_plate: str,
+                        username: Optional[str] = None) -> Dict:
+        """Book a parking slot for a vehicle."""
+        plate = normalize_plate(vehicle_plate)
+        # The lock makes check-then-book atomic per plate across workers
+        async with get_coordinator().alock(plate_lock(plate)):
+            with mongo_span("find", "parking_slots"):
+                holding = await self.slots.find_one({"parked_vehicle_plate": plate, "status": "booked"},
+                                                    {"_id": 1})
+            if holding:
+                raise ValueError(f"User with plate {plate} already has a booked slot")
 
-            if slot.get("is_occupied"):
-                logger.error(f"Slot {slot_id} is occupied")
-                return {"error": "This slot is currently occupied"}
+            query, update = book_spec(slot_id, plate, datetime.utcnow(), username)
+            try:
+                with mongo_span("findAndModify", "parking_slots"):
+                    doc = await self.slots.find_one_and_update(query, update, return_document=True)
+            except errors.DuplicateKeyError:
+                raise ValueError(f"User with plate {plate} already has a booked slot")
+            if not doc:
+                raise ValueError(f"Slot {slot_id} not free")
+        await self.db.bump_counters(doc, "free", "booked")
+        emit_slot_event("booked", doc)
+        logger.info(f"Booked slot {slot_id} for vehicle {plate}")
+        return doc
 
-            if slot.get("is_booked"):
-                if slot.get("booked_by") == vehicle_plate:
-                    logger.error(f"Slot {slot_id} already booked by same user")
-                    return {"error": "You have already booked this slot"}
-                logger.error(f"Slot {slot_id} already booked by another user")
-                return {"error": "This slot is already booked by another user"}
+    async def park_slot(self, slot_id: int, vehicle_plate: str) -> Dict:
+        """Mark a booked slot as parked by the booking vehicle."""
+        plate = normalize_plate(vehicle_plate)
+        query, update = park_spec(slot_id, plate, datetime.utcnow())
+        with mongo_span("findAndModify", "parking_slots"):
+            doc = await self.slots.find_one_and_update(query, update, return_document=True)
+        if not doc:
+            raise ValueError(f"Slot {slot_id} not booked for {plate}")
+        await self.db.bump_counters(doc, "booked", "parked")
+        emit_slot_event("parked", doc)
+        return doc
 
-            # 4. Book the slot
-            booking_time = datetime.utcnow()
-            slot_update = self.slots.update_one(
-                {
-                    "slot_id": slot_id,
-                    "is_booked": False,
-                    "is_occupied": False
-                },
-                {
-                    "$set": {
-                        "is_booked": True,
-                        "booked_by": vehicle_plate,
-                        "booked_at": booking_time
-                    }
-                }
-            )
+    async def clear_slot(self, slot_id: int, vehicle_plate: str) -> Dict:
+        """Free a parked slot and return the fee summary."""
+        query, update = clear_spec(slot_id, normalize_plate(vehicle_plate))
+        with mongo_span("findAndModify", "parking_slots"):
+            doc = await self.slots.find_one_and_update(query, update)
+        if not doc:
+            with mongo_span("find", "parking_slots"):
+                current = await self.slots.find_one({"slot_id": slot_id})
+            clear_error(slot_id, current)
+        info, extra = clear_result(doc, datetime.utcnow())
+        await self.db.bump_counters(doc, "parked", "free")
+        emit_slot_event("cleared", doc, **extra)
+        return info
 
-            if slot_update.modified_count == 0:
-                logger.error(f"Failed to update slot {slot_id}")
-                return {"error": "Failed to book slot. It may have been taken by another user."}
+    async def clear_user_slot(self, slot_id: int, username: str) -> Dict:
+        """Clear a slot on behalf of a registered user (plate taken from their record)."""
+        user = await self.db.get_user(username)
+        if not user:
+            raise ValueError("User not found")
+        return await self.clear_slot(slot_id, user["vehicle_plate"])
 
-            # 5. Update user's booking status
-            user_update = self.users.update_one(
-                {"vehicle_plate": vehicle_plate},
-                {"$set": {"booked_slot": slot_id}}
-            )
+    async def auto_park(self, vehicle_plate: str) -> Optional[Dict]:
+        """Park the vehicle in the slot it booked, if any (camera gate)."""
+        booked = await self.db.find_booked_slot(vehicle_plate)
+        if not booked:
+            return None
+        return await self.park_slot(booked["slot_id"], vehicle_plate)
 
-            if user_update.modified_count == 0:
-                # Rollback slot booking
-                self.slots.update_one(
-                    {"slot_id": slot_id},
-                    {
-                        "$set": {
-                            "is_booked": False,
-                            "booked_by": None,
-                            "booked_at": None
-                        }
-                    }
-                )
-                logger.error(f"Failed to update user booking for {vehicle_plate}")
-                return {"error": "Failed to update booking status"}
 
-            logger.info(f"Successfully booked slot {slot_id} for vehicle {vehicle_plate}")
-            return {
-                "success": True,
-                "message": f"Successfully booked slot {slot_id}",
-                "data": {
-                    "slot_id": slot_id,
-                    "vehicle_plate": vehicle_plate,
-                    "booked_at": booking_time,
-                    "user": {
-                        "name": user["name"],
-                        "vehicle_type": user["vehicle_type"]
-                    }
-                }
-            }
+_booking_service = None
 
-        except Exception as e:
-            logger.error(f"Error booking slot: {str(e)}")
-            return {"error": "An unexpected error occurred. Please try again."}
+def get_booking_service() -> BookingService:
+    """FastAPI dependency returning the process-wide BookingService."""
+    global _booking_service
+    if _booking_service is None:
+        _booking_service = BookingService()
+    return _booking_service
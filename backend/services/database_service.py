@@ -1,190 +1,74 @@
-from pymongo import MongoClient
-from datetime import datetime
 from typing import Dict, Any, Optional, List
 import logging
 
+from db import get_async_db
+from parking_slot_crud import (
+    counter_spec,
+    normalize_plate,
+    summarize_counters,
+)
+from tracing import mongo_span
+from user_auth_mongo import cached_user, remember_user
+
 logger = logging.getLogger(__name__)
 
 class DatabaseService:
-    def __init__(self, mongo_uri: str):
-        self.client = MongoClient(mongo_uri)
-        self.db = self.client.parkvision_db
+    """
+    Non-blocking reads of slots, counters and users, and counter updates, on the shared Motor client. State transitions (book, park, clear)
+    live in BookingService.
+    """
+
+    def __init__(self, database=None):
+        self.db = database if database is not None else get_async_db()
         self.users = self.db.users
         self.parking_slots = self.db.parking_slots
-        self.vehicles = self.db.vehicles
+        self.slot_counters = self.db.slot_counters
 
-    async def register_user(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def bump_counters(self, doc: Dict[str, Any], src: str, dst: str):
+        query, update = counter_spec(doc, src, dst)
         try:
-            # Check if user already exists
-            existing_user = self.users.find_one({
-                "vehicle_plate": user_data.vehicle_plate
-            })
-            
-            if existing_user:
-                return {"error": "Vehicle plate already registered"}
-
-            # Insert new user
-            user_doc = {
-                "name": user_data.name,
-                "vehicle_plate": user_data.vehicle_plate,
-                "created_at": datetime.utcnow()
-            }
-            
-            result = self.users.insert_one(user_doc)
-            
-            return {
-                "success": True,
-                "message": "User registered successfully",
-                "user_id": str(result.inserted_id)
-            }
-            
+            with mongo_span("update", "slot_counters"):
+                await self.slot_counters.update_one(query, update, upsert=True)
         except Exception as e:
-            logger.error(f"Error registering user: {str(e)}")
-            return {"error": "Failed to register user"}
-
-    async def login_user(self, login_data: Dict[str, Any]) -> Dict[str, Any]:
-        try:
-            # Find user by name and vehicle plate
-            user = self.users.find_one({
-                "name": login_data.name,
-                "vehicle_plate": login_data.vehicle_plate
-            })
+            logger.error(f"Failed to update slot counters for {query['_id']}: {e}")
 
-            if not user:
-                # If user doesn't exist, register them
-                registration_result = await self.register_user(login_data)
-                if "error" in registration_result:
-                    return registration_result
-                
-                user = self.users.find_one({
-                    "name": login_data.name,
-                    "vehicle_plate": login_data.vehicle_plate
-                })
+    async def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        user = cached_user(username=username)
+        if user is None:
+            with mongo_span("find", "users"):
+                user = await self.users.find_one({"username": username}, {"_id": 0})
+            if user:
+                remember_user(user)
+        return user
 
-            return {
-                "success": True,
-                "message": "Login successful",
-                "user": {
-                    "id": str(user["_id"]),
-                    "name": user["name"],
-                    "vehicle_plate": user["vehicle_plate"]
-                }
-            }
-
-        except Exception as e:
-            logger.error(f"Error during login: {str(e)}")
-            return {"error": "Failed to process login request"}
-
-    async def get_available_slots(self) -> list:
-        try:
-            return list(self.parking_slots.find({"status": "free"}))
-        except Exception as e:
-            logger.error(f"Error getting available slots: {str(e)}")
-            return []
-
-    async def park_vehicle(self, vehicle_plate: str) -> Dict[str, Any]:
-        try:
-            # Find the booked slot for this vehicle
-            slot = self.parking_slots.find_one({
-                "plate_number": vehicle_plate,
-                "status": "booked"
-            })
-
-            if not slot:
-                return {"error": "No booking found for this vehicle"}
-
-            # Update slot status to parked
-            self.parking_slots.update_one(
-                {"plate_number": vehicle_plate},
-                {
-                    "$set": {
-                        "status": "parked",
-                        "parking_time": datetime.utcnow()
-                    }
-                }
-            )
-
-            # Update vehicle status
-            self.vehicles.update_one(
-                {"license_plate": vehicle_plate},
-                {
-                    "$set": {
-                        "parking_state": "parked",
-                        "time_in": datetime.utcnow()
-                    }
-                }
-            )
-
-            return {"message": "Vehicle parked successfully"}
-
-        except Exception as e:
-            logger.error(f"Error parking vehicle: {str(e)}")
-            return {"error": "Failed to park vehicle"}
-
-    async def remove_vehicle(self, slot_id: str, vehicle_plate: str) -> Dict[str, Any]:
-        try:
-            # Reset slot status
-            self.parking_slots.update_one(
-                {"slot_id": slot_id},
-                {
-                    "$set": {
-                        "status": "free",
-                        "plate_number": None,
-                        "booking_time": None,
-                        "parking_time": None
-                    }
-                }
-            )
-
-            # Update vehicle status
-            self.vehicles.update_one(
-                {"license_plate": vehicle_plate},
-                {
-                    "$set": {
-                        "parking_state": None,
-                        "parking_slot": None,
-                        "in_parking": False,
-                        "time_out": datetime.utcnow()
-                    }
-                }
+    async def get_all_slots(self) -> List[Dict[str, Any]]:
+        with mongo_span("find", "parking_slots"):
+            return await self.parking_slots.find({}, {"_id": 0}).to_list(None)
+
+    async def get_slot_summary(self) -> Dict[str, Any]:
+        with mongo_span("find", "slot_counters"):
+            counters = await self.slot_counters.find({}).to_list(None)
+        return summarize_counters(counters)
+
+    async def get_parked_employees(self) -> List[Dict[str, Any]]:
+        with mongo_span("find", "parking_slots"):
+            return await self.parking_slots.find(
+                {"status": "parked", "is_employee": True}, {"_id": 0}
+            ).to_list(None)
+
+    async def find_booked_slot(self, vehicle_plate: str) -> Optional[Dict[str, Any]]:
+        with mongo_span("find", "parking_slots"):
+            return await self.parking_slots.find_one(
+                {"parked_vehicle_plate": normalize_plate(vehicle_plate), "status": "booked"},
+                {"slot_id": 1, "_id": 0}
             )
 
-            return {"message": "Vehicle removed successfully"}
 
-        except Exception as e:
-            logger.error(f"Error removing vehicle: {str(e)}")
-            return {"error": "Failed to remove vehicle"}
-
-    async def get_all_slots(self) -> List[Dict[str, Any]]:
-        try:
-            slots = list(self.parking_slots.find({}, {'_id': 0}))
-            return {
-                "success": True,
-                "slots": slots
-            }
-        except Exception as e:
-            logger.error(f"Error getting slots: {str(e)}")
-            return {
-                "success": False,
-                "error": "Failed to get parking slots"
-            }
+_database_service = None
 
-    async def update_slot_status(self, slot_id: str, status: str, plate_number: str = None) -> Dict[str, Any]:
-        try:
-            update_data = {
-                "status": status,
-                "last_updated": datetime.utcnow()
-            }
-            
-            if plate_number:
-                update_data["plate_number"] = plate_number
-            
-            self.parking_slots.update_one(
-                {"slot_id": slot_id},
-                {"$set": update_data}
-            )
-            
-            return {"success": True, "message": f"Slot {slot_id} updated to {status}"}
-        except Exception as e:
-            logger.error(f"Error updating slot status: {str(e)}")
-            return {"success": False, "error": "Failed to update slot status"}
+def get_database_service() -> DatabaseService:
+    """FastAPI dependency returning the process-wide DatabaseService."""
+    global _database_service
+    if _database_service is None:
+        _database_service = DatabaseService()
+    return _database_service
@@ -1,14 +1,118 @@
+import os
+import json
 from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Tariff used when no TARIFF_FILE is configured: a flat 10.00/hour for every
+# vehicle type, no grace period and no daily cap (the historic clear_slot rate).
+DEFAULT_TARIFF = {
+    "hourly_rates": {"default": 10.0},
+    "time_of_day": [],          # [{"start": 7, "end": 10, "multiplier": 1.5}, ...]
+    "grace_minutes": 0,
+    "daily_cap": None,
+    "utc_offset_hours": 0,      # tariff hours are local time at the car park
+}
+
+
+def load_tariff(path: Optional[str] = None) -> dict:
+    """Read a tariff JSON file, filling missing keys from DEFAULT_TARIFF."""
+    tariff = dict(DEFAULT_TARIFF)
+    if path:
+        with open(path) as f:
+            tariff.update(json.load(f))
+    return tariff
+
 
 class ParkingFeeCalculator:
-    def __init__(self):
-        self.hourly_rate = 2.50  # $2.50 per hour
+    """
+    Single tariff engine for every fee in the system.
+
+    The hourly rate for a vehicle type at a given local hour is
+    `hourly_rates[type] * multiplier(hour)`. Per type we precompute the
+    cumulative cost of a day hour by hour, so the cost of any interval is a
+    difference of two lookups; this is what lets fee_batch() price months
+    of sessions as NumPy array operations.
+    """
+
+    def __init__(self, tariff: Optional[dict] = None):
+        tariff = tariff or load_tariff(os.getenv("TARIFF_FILE"))
+        self.tariff = tariff
+        rates = tariff["hourly_rates"]
+        self.hourly_rate = float(rates.get("default", 0.0))
         self.employee_rate = 0.0  # Free for employees
+        self.grace_hours = float(tariff.get("grace_minutes") or 0) / 60
+        self.daily_cap = tariff.get("daily_cap")
+        self.utc_offset_hours = float(tariff.get("utc_offset_hours") or 0)
+
+        multipliers = np.ones(24)
+        for band in tariff.get("time_of_day") or []:
+            hours = np.arange(24)
+            start, end = band["start"], band["end"]
+            in_band = (hours >= start) & (hours < end) if start <= end else (hours >= start) | (hours < end)
+            multipliers[in_band] = band["multiplier"]
 
-    def calculate_fee(self, time_in: datetime, is_employee: bool) -> float:
+        # Row 0 is the default rate; the others follow self.vehicle_types
+        self.vehicle_types = [t for t in rates if t != "default"]
+        self._type_index = {t: i + 1 for i, t in enumerate(self.vehicle_types)}
+        base = np.array([self.hourly_rate] + [float(rates[t]) for t in self.vehicle_types])
+        self._rates = base[:, None] * multipliers[None, :]                       # [types, 24]
+        self._cum = np.hstack([np.zeros((len(base), 1)), np.cumsum(self._rates, axis=1)])  # [types, 25]
+
+    # ---------------------------------------------------------------
+    # Scalar API
+    # ---------------------------------------------------------------
+    def calculate_fee(self, time_in: datetime, is_employee: bool,
+                      vehicle_type: Optional[str] = None) -> float:
+        return self.fee(time_in, datetime.utcnow(), vehicle_type, is_employee)
+
+    def fee(self, start: datetime, end: datetime, vehicle_type: Optional[str] = None,
+            is_employee: bool = False) -> float:
         if is_employee:
-            return 0.0
-            
-        duration = datetime.utcnow() - time_in
-        hours = duration.total_seconds() / 3600
-        return round(hours * self.hourly_rate, 2)
+            return self.employee_rate
+        return float(self.fee_batch([start], [end], [vehicle_type])[0])
+
+    # ---------------------------------------------------------------
+    # Vectorized API
+    # ---------------------------------------------------------------
+    def _cost_from_epoch(self, hours: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Cumulative tariff cost from the epoch up to `hours` (local hours since epoch)."""
+        days = np.floor(hours / 24)
+        hour_of_day = hours - days * 24
+        h = np.minimum(hour_of_day.astype(np.int64), 23)
+        return (days * self._cum[rows, 24] + self._cum[rows, h]
+                + (hour_of_day - h) * self._rates[rows, h])
+
+    def fee_batch(self, starts, ends, vehicle_types: Optional[List[Optional[str]]] = None,
+                  is_employee=None) -> np.ndarray:
+        """
+        Fees for many sessions at once. `starts`/`ends` are UTC datetimes (or
+        datetime64 arrays); `is_employee` is an optional boolean array.
+        """
+        to_hours = lambda t: (np.asarray(t, dtype="datetime64[ms]").astype(np.int64)
+                              / 3_600_000.0 + self.utc_offset_hours)
+        start_h, end_h = to_hours(starts), to_hours(ends)
+        if vehicle_types is None:
+            rows = np.zeros(len(start_h), dtype=np.int64)
+        else:
+            rows = np.fromiter((self._type_index.get(t, 0) for t in vehicle_types),
+                               dtype=np.int64, count=len(start_h))
+
+        duration = np.maximum(end_h - start_h, 0)
+        full_days = np.floor(duration / 24)
+        day_cost = self._cum[rows, 24]
+        rest = self._cost_from_epoch(end_h, rows) - self._cost_from_epoch(start_h + full_days * 24, rows)
+        rest = np.maximum(rest, 0)
+        if self.daily_cap is not None:
+            day_cost = np.minimum(day_cost, self.daily_cap)
+            rest = np.minimum(rest, self.daily_cap)
+
+        fees = full_days * day_cost + rest
+        fees[duration <= self.grace_hours] = 0.0
+        if is_employee is not None:
+            fees[np.asarray(is_employee, dtype=bool)] = self.employee_rate
+        return np.round(fees, 2)
+
+
+fee_calculator = ParkingFeeCalculator()
@@ -0,0 +1,292 @@
+# slot_events.py
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+import parking_slot_crud as crud
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------------------------------------------
+# Collections
+# -------------------------------------------------------------------
+events = crud.db.slot_events          # append-only, capped
+snapshots = crud.db.slot_snapshots    # compact state of every slot at a sequence number
+log_meta = crud.db.slot_log_meta      # global sequence counter
+
+SLOT_EVENT_LOG_BYTES = int(os.getenv("SLOT_EVENT_LOG_BYTES", str(256 * 1024 * 1024)))
+SLOT_EVENT_BATCH_SIZE = int(os.getenv("SLOT_EVENT_BATCH_SIZE", "500"))
+SLOT_EVENT_FLUSH_SECONDS = float(os.getenv("SLOT_EVENT_FLUSH_SECONDS", "1"))
+SLOT_SNAPSHOT_EVERY = int(os.getenv("SLOT_SNAPSHOT_EVERY", "5000"))
+SLOT_SNAPSHOT_KEEP = int(os.getenv("SLOT_SNAPSHOT_KEEP", "48"))
+# Workers reserve sequence numbers before inserting, so a batch can land
+# after a later one; replays start this many events before the snapshot.
+SLOT_EVENT_REORDER_WINDOW = int(os.getenv("SLOT_EVENT_REORDER_WINDOW", "1000"))
+# Refreshes a missing sequence number is waited for (its writer may have died)
+SLOT_EVENT_GAP_RETRIES = int(os.getenv("SLOT_EVENT_GAP_RETRIES", "30"))
+
+# Status a slot is left in by each event ("status" events carry it explicitly)
+EVENT_STATUS = {"booked": "booked", "parked": "parked", "cleared": "free", "expired": "free"}
+
+
+def ensure_event_log():
+    """Create the capped event log and its indexes; called once at application startup."""
+    try:
+        if "slot_events" not in crud.db.list_collection_names():
+            try:
+                crud.db.create_collection("slot_events", capped=True, size=SLOT_EVENT_LOG_BYTES)
+            except Exception as e:
+                logger.warning("Capped slot_events unavailable (%s); using a plain collection", e)
+                crud.db.create_collection("slot_events")
+        events.create_index([("seq", ASCENDING)], unique=True)
+        events.create_index([("slot_id", ASCENDING), ("seq", ASCENDING)])
+        events.create_index([("time", ASCENDING)])
+        snapshots.create_index([("seq", DESCENDING)])
+        snapshots.create_index([("max_time", DESCENDING)])
+    except Exception as e:
+        logger.error("Failed to set up the slot event log: %s", e)
+
+
+# -------------------------------------------------------------------
+# State folding
+# -------------------------------------------------------------------
+def slot_state(event: dict) -> dict:
+    """State a slot is in right after `event`."""
+    status = event.get("status") or EVENT_STATUS[event["event"]]
+    occupied = status != "free"
+    return {
+        "slot_id": event["slot_id"],
+        "status": status,
+        "vehicle_type": event["vehicle_type"],
+        "zone": event["zone"],
+        "parked_vehicle_plate": event["plate"] if occupied else None,
+        "booked_time": event.get("booked_time") if occupied else None,
+        "parked_time": event.get("parked_time") if status == "parked" else None,
+        "time": event["time"],
+        "seq": event["seq"],
+    }
+
+
+def apply_event(state: dict, event: dict):
+    """
+    Fold one event into a slot_id -> state map. Later event time wins (then
+    higher seq), so applying an event twice or slightly out of order is harmless.
+    """
+    current = state.get(event["slot_id"])
+    if current is None or (event["time"], event["seq"]) >= (current["time"], current["seq"]):
+        state[event["slot_id"]] = slot_state(event)
+
+
+def replay(state: dict, query: dict, seen: set = None) -> int:
+    """Apply the events matching query in sequence order; returns the highest seq seen."""
+    last = 0
+    for event in events.find(query, {"_id": 0}).sort("seq", ASCENDING):
+        apply_event(state, event)
+        last = event["seq"]
+        if seen is not None:
+            seen.add(last)
+    return last
+
+
+def latest_snapshot(at: datetime = None):
+    query = {"max_time": {"$lte": at}} if at else {}
+    return snapshots.find_one(query, sort=[("seq", DESCENDING)])
+
+
+def load_state(at: datetime = None):
+    """
+    Slot state from the newest snapshot plus the tail of the log, optionally
+    as of time `at`. Returns (state, last_seq). Points in time older than the
+    oldest snapshot are only as complete as the capped log still is.
+    """
+    snap = latest_snapshot(at)
+    state, seq = {}, 0
+    if snap:
+        state = {s["slot_id"]: s for s in snap["slots"]}
+        seq = snap["seq"]
+    query = {"seq": {"$gt": seq - SLOT_EVENT_REORDER_WINDOW}} if snap else {}
+    if at:
+        query["time"] = {"$lte": at}
+    return state, max(seq, replay(state, query))
+
+
+def slot_history(slot_id: int, start: datetime = None, end: datetime = None) -> list:
+    """Audit trail of one slot's events, oldest first."""
+    query = {"slot_id": slot_id}
+    if start or end:
+        query["time"] = {k: v for k, v in (("$gte", start), ("$lt", end)) if v}
+    return list(events.find(query, {"_id": 0}).sort("seq", ASCENDING))
+
+
+# -------------------------------------------------------------------
+# Writer and in-memory state
+# -------------------------------------------------------------------
+class SlotEventLog:
+    """
+    Appends every slot transition to slot_events and keeps the state of all
+    slots in memory, rebuilt at start() from the newest snapshot plus the
+    tail of the log.
+
+    Listeners run inline in the request (and the event loop), so
+    on_slot_event only enqueues; a background thread numbers each batch with
+    a single $inc on the sequence counter and writes it with insert_many.
+    The in-memory state catches up with the log (this worker's events and
+    everyone else's) when it is read, and before each snapshot: every
+    SLOT_SNAPSHOT_EVERY events it is stored as a compact snapshot, so a new
+    worker starts from that and replays only the tail.
+    """
+
+    def __init__(self, batch_size: int = SLOT_EVENT_BATCH_SIZE,
+                 flush_seconds: float = SLOT_EVENT_FLUSH_SECONDS,
+                 snapshot_every: int = SLOT_SNAPSHOT_EVERY):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.snapshot_every = snapshot_every
+        self.state = {}
+        self.seq = 0            # highest event applied to state
+        self.written_seq = 0    # highest event this worker appended
+        self._snapshot_seq = 0
+        self._gaps = {}   # seq not yet readable -> refreshes waited
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def on_slot_event(self, event: dict):
+        self._queue.put(dict(event))
+
+    def rebuild(self) -> dict:
+        """Load the newest snapshot and replay the tail into the in-memory state."""
+        started = time.perf_counter()
+        state, seq = load_state()
+        snap = latest_snapshot()
+        with self._lock:
+            self.state, self.seq, self._gaps = state, seq, {}
+            self._snapshot_seq = snap["seq"] if snap else 0
+        logger.info("Rebuilt %d slots up to event %d in %.1f ms",
+                    len(state), seq, (time.perf_counter() - started) * 1000)
+        return state
+
+    def start(self) -> "SlotEventLog":
+        self.rebuild()
+        crud.add_slot_listener(self.on_slot_event)
+        self._thread = threading.Thread(target=self._run, name="slot-event-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+        return self
+
+    # ---------------------------------------------------------------
+    # Queries
+    # ---------------------------------------------------------------
+    def get_state(self, slot_id: int = None):
+        """Current state of one slot, or of every slot that has logged events."""
+        self.refresh()
+        with self._lock:
+            if slot_id is not None:
+                state = self.state.get(slot_id)
+                return dict(state) if state else None
+            return [dict(self.state[k]) for k in sorted(self.state)]
+
+    def state_at(self, at: datetime) -> list:
+        """
+        State as of `at` of every slot that has logged events (point-in-time
+        query). Served from memory when `at` is past every event applied
+        there; earlier points are rebuilt from the snapshot before `at`.
+        """
+        self.refresh()
+        with self._lock:
+            newest = max((s["time"] for s in self.state.values()), default=None)
+            if newest is None or at >= newest:
+                return [dict(self.state[k]) for k in sorted(self.state)]
+        state, _ = load_state(at)
+        return [state[k] for k in sorted(state)]
+
+    # ---------------------------------------------------------------
+    # Writing
+    # ---------------------------------------------------------------
+    def _drain(self, block: bool) -> list:
+        batch = []
+        try:
+            batch.append(self._queue.get(block=block, timeout=self.flush_seconds if block else None))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch: list):
+        if not batch:
+            return
+        try:
+            counter = log_meta.find_one_and_update(
+                {"_id": "seq"}, {"$inc": {"value": len(batch)}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+            first = counter["value"] - len(batch) + 1
+            for i, event in enumerate(batch):
+                event["seq"] = first + i
+            events.insert_many(batch, ordered=False)
+            self.written_seq = counter["value"]
+        except Exception as e:
+            logger.error("Failed to append %d slot events: %s", len(batch), e)
+
+    def refresh(self):
+        """Replay log entries written since the last refresh (by any worker)."""
+        with self._lock:
+            query = {"seq": {"$gt": self.seq}}
+            if self._gaps:
+                query = {"$or": [query, {"seq": {"$in": list(self._gaps)}}]}
+            seen = set()
+            last = replay(self.state, query, seen)
+            # Numbers skipped over belong to batches still in flight elsewhere
+            for missing in range(self.seq + 1, last):
+                if missing not in seen:
+                    self._gaps[missing] = 0
+            for s in list(self._gaps):
+                self._gaps[s] += 1
+                if s in seen or self._gaps[s] > SLOT_EVENT_GAP_RETRIES:
+                    del self._gaps[s]
+            self.seq = max(self.seq, last)
+
+    def snapshot(self):
+        """Bring the in-memory state up to date, store it as a snapshot and prune old ones."""
+        self.refresh()
+        with self._lock:
+            slots = [dict(s) for s in self.state.values()]
+            seq = self.seq
+        if not slots:
+            return
+        latest = latest_snapshot()
+        if latest and seq - latest["seq"] < self.snapshot_every:
+            # Another worker already took one recently enough
+            self._snapshot_seq = latest["seq"]
+            return
+        snapshots.insert_one({"seq": seq, "max_time": max(s["time"] for s in slots),
+                              "created_at": datetime.utcnow(), "slots": slots})
+        self._snapshot_seq = seq
+        stale = [d["_id"] for d in snapshots.find({}, {"_id": 1})
+                 .sort("seq", DESCENDING).skip(SLOT_SNAPSHOT_KEEP)]
+        if stale:
+            snapshots.delete_many({"_id": {"$in": stale}})
+
+    def flush(self):
+        """Write everything still buffered (called at shutdown)."""
+        while not self._queue.empty():
+            self._write(self._drain(block=False))
+
+    def _run(self):
+        while True:
+            batch = self._drain(block=True)
+            self._write(batch)
+            if self.written_seq - self._snapshot_seq < self.snapshot_every:
+                continue
+            try:
+                self.snapshot()
+            except Exception as e:
+                logger.error("Slot event snapshot failed: %s", e)
@@ -0,0 +1,265 @@
+# slot_layout.py
+
+"""
+Reconcile the parking_slots collection with a target layout, and fold
+legacy slot documents into the current schema.
+
+Both passes stream the collection in slot_id order with a projection and
+write through batched bulk_write calls. Neither ever frees or overwrites
+a booked or parked slot: layout changes only touch vehicle_type/zone,
+surplus slots are deleted only when free, and legacy occupancy is copied
+only onto free slots.
+"""
+
+import json
+import logging
+from datetime import datetime
+
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne, errors
+
+import parking_slot_crud as crud
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+# Legacy field -> current field
+LEGACY_FIELDS = {
+    "plate_number": "parked_vehicle_plate",
+    "vehicle_plate": "parked_vehicle_plate",
+    "booking_time": "booked_time",
+    "parking_time": "parked_time",
+    "occupied_since": "parked_time",
+}
+
+
+# -------------------------------------------------------------------
+# Target layout
+# -------------------------------------------------------------------
+def parse_ranges(spec: str) -> dict:
+    """"A:1-50,B:51-100" -> {"A": (1, 50), "B": (51, 100)}"""
+    ranges = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, span = part.rsplit(":", 1)
+        low, _, high = span.partition("-")
+        ranges[name] = (int(low), int(high or low))
+    return ranges
+
+
+def load_layout_file(path: str) -> dict:
+    """JSON {"count": n, "zones": {"A": [1, 50]}, "vehicle_types": {"Cars": [41, 70]}}"""
+    with open(path) as f:
+        data = json.load(f)
+    return {"count": data["count"],
+            "zones": {k: tuple(v) for k, v in data.get("zones", {}).items()},
+            "vehicle_types": {k: tuple(v) for k, v in data.get("vehicle_types", {}).items()}}
+
+
+def _lookup(ranges: dict, slot_id: int, default: str) -> str:
+    for name, (low, high) in ranges.items():
+        if low <= slot_id <= high:
+            return name
+    return default
+
+
+def build_layout(count: int, zones: dict = None, vehicle_types: dict = None) -> dict:
+    """slot_id -> (vehicle_type, zone) for slots 1..count."""
+    zones = zones or {}
+    vehicle_types = vehicle_types or crud.ALLOWED_RANGES
+    return {i: (_lookup(vehicle_types, i, crud.UNASSIGNED_TYPE), _lookup(zones, i, crud.DEFAULT_ZONE))
+            for i in range(1, count + 1)}
+
+
+# -------------------------------------------------------------------
+# Reconciliation
+# -------------------------------------------------------------------
+class _Batch:
+    """Collects bulk operations and writes them every `size` ops, or only on flush() if size is None."""
+
+    def __init__(self, collection, size: int, apply: bool):
+        self.collection, self.size, self.apply = collection, size, apply
+        self.ops = []
+
+    def add(self, op):
+        self.ops.append(op)
+        if self.size and len(self.ops) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.ops and self.apply:
+            try:
+                self.collection.bulk_write(self.ops, ordered=False)
+            except errors.BulkWriteError as e:
+                # Another worker inserted the same slot meanwhile
+                logger.warning("Bulk write partially failed: %s", e.details.get("writeErrors", [])[:3])
+        self.ops = []
+
+
+def _new_diff() -> dict:
+    return {"inserted": [], "retyped": [], "rezoned": [], "deleted": [],
+            "kept_occupied": [], "unchanged": 0}
+
+
+def reconcile_layout(layout: dict, apply: bool = False, prune: bool = False,
+                     batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Bring parking_slots in line with `layout` (from build_layout) and return
+    the diff. With apply=False nothing is written. Surplus slots are removed
+    only with prune=True and only while free.
+    """
+    diff = _new_diff()
+    batch = _Batch(crud.slots, batch_size, apply)
+    seen = set()
+    cursor = crud.slots.find({"slot_id": {"$type": "number"}},
+                             {"_id": 1, "slot_id": 1, "status": 1, "vehicle_type": 1, "zone": 1},
+                             batch_size=batch_size).sort("slot_id", 1)
+    for doc in cursor:
+        slot_id = doc["slot_id"]
+        seen.add(slot_id)
+        target = layout.get(slot_id)
+        if target is None:
+            if doc.get("status", "free") != "free":
+                diff["kept_occupied"].append(slot_id)
+            elif prune:
+                diff["deleted"].append(slot_id)
+                batch.add(DeleteOne({"_id": doc["_id"], "status": "free"}))
+            continue
+        changes = {}
+        if doc.get("vehicle_type") != target[0]:
+            changes["vehicle_type"] = target[0]
+            diff["retyped"].append(slot_id)
+        if doc.get("zone") != target[1]:
+            changes["zone"] = target[1]
+            diff["rezoned"].append(slot_id)
+        if changes:
+            batch.add(UpdateOne({"_id": doc["_id"]}, {"$set": changes}))
+        else:
+            diff["unchanged"] += 1
+
+    for slot_id, (vehicle_type, zone) in layout.items():
+        if slot_id not in seen:
+            diff["inserted"].append(slot_id)
+            batch.add(InsertOne(crud.new_slot_doc(slot_id, vehicle_type, zone)))
+    batch.flush()
+
+    if apply:
+        crud.reconcile_counters()
+    return diff
+
+
+# -------------------------------------------------------------------
+# Legacy documents
+# -------------------------------------------------------------------
+def _legacy_state(doc: dict) -> dict:
+    """Current-schema occupancy fields from a legacy slot or allocation document."""
+    fields = {new: doc[old] for old, new in LEGACY_FIELDS.items() if doc.get(old) is not None}
+    status = doc.get("status")
+    if status is None:
+        status = "parked" if doc.get("is_occupied") else "free"
+    if status not in crud.SLOT_STATUSES or status == "free" or not fields.get("parked_vehicle_plate"):
+        return {"status": "free"}
+    fields["parked_vehicle_plate"] = crud.normalize_plate(fields["parked_vehicle_plate"])
+    if status == "parked":
+        fields.setdefault("parked_time", doc.get("last_updated") or datetime.utcnow())
+    else:
+        fields.setdefault("booked_time", datetime.utcnow())
+    return {"status": status, **fields, **crud._employee_fields(fields["parked_vehicle_plate"])}
+
+
+def migrate_legacy(source=None, apply: bool = False, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Fold legacy documents into parking_slots. `source` is a collection in
+    the old layouts (string slot_id, plate_number/booking_time fields, or
+    slot_allocations' is_occupied/occupied_since); by default the string-id
+    documents of parking_slots itself, which are removed once merged.
+    Occupancy is copied only onto slots that are free in the current
+    collection; anything else is reported as a conflict. A legacy document
+    is removed only once its state is in parking_slots: conflicts and
+    failed writes stay for a later run.
+    """
+    in_place = source is None
+    source = crud.slots if in_place else source
+    report = {"scanned": 0, "converted": [], "occupancy_copied": [], "conflicts": [], "failed": [],
+              "skipped": []}
+    # Flushed per chunk: writes first, then deletes of the legacy docs whose state landed
+    batch = _Batch(crud.slots, None, apply)
+    deletes = _Batch(crud.slots, None, apply)
+
+    query = {"slot_id": {"$type": "string"}} if in_place else {}
+    chunk = []
+    for doc in source.find(query, batch_size=batch_size):
+        chunk.append(doc)
+        if len(chunk) >= batch_size:
+            _migrate_chunk(chunk, in_place, batch, deletes, report)
+            chunk = []
+    _migrate_chunk(chunk, in_place, batch, deletes, report)
+
+    if apply:
+        crud.reconcile_counters()
+    return report
+
+
+def _migrate_chunk(chunk: list, in_place: bool, batch: _Batch, deletes: _Batch, report: dict):
+    if not chunk:
+        return
+    ids = {}
+    for doc in chunk:
+        report["scanned"] += 1
+        try:
+            ids[int(str(doc["slot_id"]).strip())] = doc
+        except (KeyError, ValueError):
+            report["skipped"].append(str(doc.get("slot_id")))
+    # One query per chunk for the current status of the matching slots
+    current = {d["slot_id"]: d for d in crud.slots.find(
+        {"slot_id": {"$in": list(ids)}}, {"slot_id": 1, "status": 1, "parked_vehicle_plate": 1})}
+
+    writes = []     # (slot_id, report key, legacy doc, state) per queued write
+    merged = []     # legacy docs the current collection already covers
+    for slot_id, doc in ids.items():
+        state = _legacy_state(doc)
+        existing = current.get(slot_id)
+        if existing is None:
+            slot = {**crud.new_slot_doc(slot_id), **state}
+            # In place, the legacy document becomes the slot, so no plate is ever held twice
+            batch.add(ReplaceOne({"_id": doc["_id"]}, slot) if in_place else InsertOne(slot))
+            writes.append((slot_id, "converted", None, state))
+        elif state["status"] == "free" or existing.get("parked_vehicle_plate") == state["parked_vehicle_plate"]:
+            merged.append(doc)
+        elif existing["status"] == "free":
+            batch.add(UpdateOne({"_id": existing["_id"], "status": "free"}, {"$set": state}))
+            writes.append((slot_id, "occupancy_copied", doc, state))
+        else:
+            report["conflicts"].append(slot_id)
+    batch.flush()
+
+    # Writes can fail (unique indexes) or match nothing (the slot was taken
+    # meanwhile); read back which ones landed before deleting any legacy doc
+    landed = {}
+    if batch.apply and writes:
+        landed = {d["slot_id"]: d for d in crud.slots.find(
+            {"slot_id": {"$in": [w[0] for w in writes]}}, {"slot_id": 1, "status": 1, "parked_vehicle_plate": 1})}
+    for slot_id, key, doc, state in writes:
+        after = landed.get(slot_id)
+        if batch.apply and not (after and after.get("status") == state["status"]
+                                and after.get("parked_vehicle_plate") == state.get("parked_vehicle_plate")):
+            report["failed"].append(slot_id)
+            continue
+        report[key].append(slot_id)
+        if doc is not None:
+            merged.append(doc)
+    if in_place:
+        for doc in merged:
+            deletes.add(DeleteOne({"_id": doc["_id"]}))
+        deletes.flush()
+
+
+def summarize(diff: dict, sample: int = 10) -> str:
+    """Human-readable diff: counts plus the first few slot ids of each change."""
+    lines = []
+    for key, value in diff.items():
+        if isinstance(value, list):
+            head = ", ".join(map(str, value[:sample])) + (" …" if len(value) > sample else "")
+            lines.append(f"{key:>17}: {len(value)}" + (f"  [{head}]" if value else ""))
+        else:
+            lines.append(f"{key:>17}: {value}")
+    return "\n".join(lines)
@@ -0,0 +1,48 @@
+"""
+Test harness: every module runs against an in-memory mongomock database.
+
+MONGO_URI must be set before db.py is imported, so it is set here at import
+time; each test starts from empty collections and freshly seeded slots.
+
+    cd backend && python -m pytest -q
+"""
+
+import os
+import sys
+
+os.environ["MONGO_URI"] = "mongomock://localhost/parkvision_test"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inspect
+
+import mongomock.collection
+import pytest
+
+import db
+
+# pymongo >= 4.11 passes sort= to bulk ops, which mongomock's builder does not take yet
+for _name in ("add_update", "add_replace", "add_delete"):
+    _add = getattr(mongomock.collection.BulkOperationBuilder, _name)
+    if "sort" not in inspect.signature(_add).parameters:
+        def _without_sort(self, *args, _add=_add, **kwargs):
+            kwargs.pop("sort", None)
+            return _add(self, *args, **kwargs)
+        setattr(mongomock.collection.BulkOperationBuilder, _name, _without_sort)
+
+
+@pytest.fixture(autouse=True)
+def database():
+    import parking_slot_crud as crud
+    from employee_vehicle_model import employee_plates, init_employee_table
+    from user_auth_mongo import ensure_user_indexes
+
+    client = db.get_client()
+    name = db.get_db().name
+    client.drop_database(name)
+    crud.ensure_slot_indexes()
+    ensure_user_indexes()
+    init_employee_table()
+    crud.init_slots(count=100)
+    employee_plates.invalidate()
+    yield db.get_db()
+    client.drop_database(name)
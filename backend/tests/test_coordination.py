@@ -0,0 +1,41 @@
+import coordination
+from coordination import MongoCoordinator
+
+
+class _NoThread:
+    """Keeps the poll loop from starting; the tests drain by hand."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def start(self):
+        pass
+
+
+def _envelope(seq, message):
+    return {"seq": seq, "channel": "test", "origin": "elsewhere", "message": message}
+
+
+def test_late_insert_of_reserved_seq_is_delivered(database, monkeypatch):
+    monkeypatch.setattr(coordination.threading, "Thread", _NoThread)
+    coordinator = MongoCoordinator(database)
+    coordinator.messages.insert_one(_envelope(1, "old"))
+    coordinator.sequences.insert_one({"_id": coordinator.SEQ_ID, "seq": 3})
+    received = []
+    coordinator.subscribe("test", received.append)
+
+    # Two writers reserved 2 and 3; 3 lands first
+    coordinator.messages.insert_one(_envelope(3, "c"))
+    coordinator._drain()
+    coordinator.messages.insert_one(_envelope(2, "b"))
+    coordinator._drain()
+    coordinator._drain()
+    assert received == ["c", "b"]
+
+
+def test_send_reserves_consecutive_seqs(database):
+    coordinator = MongoCoordinator(database)
+    coordinator._send([_envelope(None, "a"), _envelope(None, "b")])
+    coordinator._send([_envelope(None, "c")])
+    seqs = [m["seq"] for m in coordinator.messages.find().sort("seq", 1)]
+    assert seqs == [1, 2, 3]
@@ -0,0 +1,43 @@
+import copy
+import argparse
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from model import Model
+
+
+def _model(config):
+    transformation, feature, sequence, prediction = config.split("-")
+    opt = argparse.Namespace(
+        Transformation=transformation, FeatureExtraction=feature,
+        SequenceModeling=sequence, Prediction=prediction,
+        num_fiducial=20, imgH=32, imgW=100, input_channel=1, output_channel=64,
+        hidden_size=32, num_class=38 if prediction == "Attn" else 37, batch_max_length=25)
+    torch.manual_seed(0)
+    model = Model(opt)
+    # Freshly initialised BNs are identities; give them something to fold
+    with torch.no_grad():
+        for module in model.modules():
+            if isinstance(module, torch.nn.BatchNorm2d):
+                module.running_mean.normal_(0, 0.1)
+                module.running_var.uniform_(0.5, 1.5)
+                module.weight.uniform_(0.5, 1.5)
+                module.bias.normal_(0, 0.1)
+    return model.eval(), opt
+
+
+@pytest.mark.parametrize("config", ["None-VGG-BiLSTM-CTC", "None-RCNN-None-CTC",
+                                    "TPS-ResNet-BiLSTM-Attn"])
+@pytest.mark.parametrize("channels_last", [False, True])
+def test_optimized_model_matches_the_plain_one(config, channels_last):
+    plain, opt = _model(config)
+    batch = torch.rand(2, opt.input_channel, opt.imgH, opt.imgW)
+    text = torch.zeros(2, opt.batch_max_length + 1, dtype=torch.long)
+    optimized = copy.deepcopy(plain).optimize_for_inference(channels_last=channels_last)
+    with torch.no_grad():
+        expected = plain(batch, text, is_train=False)
+        actual = optimized(batch, text, is_train=False)
+    assert actual.shape == expected.shape
+    assert (actual - expected).abs().max().item() <= 1e-4
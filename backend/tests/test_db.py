@@ -0,0 +1,22 @@
+import db
+import parking_slot_crud as crud
+
+
+def test_handles_follow_the_client_after_fork(monkeypatch):
+    for name in ("_lock", "_client", "_async_client", "_generation"):
+        monkeypatch.setattr(db, name, getattr(db, name))
+    parent = db.get_client()
+    assert crud.slots.resolve().database.client is parent
+
+    db._after_fork()
+    assert db._client is None
+    child = db.get_client()
+    assert child is not parent
+    assert crud.slots.resolve().database.client is child
+    assert db.get_db().client is child
+
+
+def test_import_does_not_connect(monkeypatch):
+    monkeypatch.setattr(db, "_client", None)
+    handle = db.get_db().some_collection
+    assert db._client is None and handle.name == "some_collection"
@@ -0,0 +1,31 @@
+import parking_slot_crud as crud
+from employee_vehicle_model import add_employee_plate, is_employee_plate, remove_employee_plate
+
+
+def test_add_and_remove_flag_active_slots(database):
+    crud.book_slot(1, "EMP001")
+    assert database.parking_slots.find_one({"slot_id": 1})["is_employee"] is False
+
+    doc = add_employee_plate("emp001")
+    assert is_employee_plate("EMP001")
+    slot = database.parking_slots.find_one({"slot_id": 1})
+    assert slot["is_employee"] is True and slot["employee_id"] == str(doc["_id"])
+
+    assert remove_employee_plate("EMP001")
+    assert not is_employee_plate("EMP001")
+    slot = database.parking_slots.find_one({"slot_id": 1})
+    assert slot["is_employee"] is False and slot["employee_id"] is None
+
+
+def test_employee_flag_set_at_booking(database):
+    add_employee_plate("EMP002")
+    assert crud.book_slot(2, "EMP002")["is_employee"] is True
+
+
+def test_old_module_path_goes_through_the_whitelist(database):
+    import parking_slot_model
+
+    crud.book_slot(3, "EMP003")
+    parking_slot_model.add_employee_plate("emp003")
+    assert is_employee_plate("EMP003")
+    assert database.parking_slots.find_one({"slot_id": 3})["is_employee"] is True
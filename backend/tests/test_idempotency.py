@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime
+
+import msgpack
+import pytest
+from fastapi import HTTPException
+
+from db import get_async_db
+from idempotency import IdempotencyStore, REPLAY_HEADER
+from responses import APIResponse
+
+BOOKED = {"slot_id": 1, "status": "booked", "booked_time": datetime(2024, 5, 1, 8, 30)}
+
+
+def _send(response, accept: str):
+    """Run the response as an ASGI app; (content-type, body)."""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept", accept.encode())]}
+    asyncio.run(response(scope, receive, send))
+    headers = dict(messages[0]["headers"])
+    return headers[b"content-type"].decode(), b"".join(m.get("body", b"") for m in messages[1:])
+
+
+def _book_twice(key, second_store):
+    calls = []
+
+    async def book():
+        calls.append(1)
+        return APIResponse(dict(BOOKED))
+
+    async def go():
+        first_store = IdempotencyStore(database=get_async_db())
+        await first_store.run("book", key, {"slot_id": 1}, book)
+        store = first_store if second_store is None else second_store
+        return await store.run("book", key, {"slot_id": 1}, book)
+
+    replay = asyncio.run(go())
+    assert calls == [1] and replay.headers[REPLAY_HEADER] == "true"
+    return replay
+
+
+def test_replay_follows_accept_header():
+    replay = _book_twice("k1", None)
+    media_type, body = _send(replay, "application/msgpack")
+    assert media_type == "application/msgpack"
+    decoded = msgpack.unpackb(body, timestamp=3)
+    assert decoded["slot_id"] == 1 and decoded["booked_time"].replace(tzinfo=None) == BOOKED["booked_time"]
+
+
+def test_replay_from_another_worker_is_json_by_default():
+    replay = _book_twice("k2", IdempotencyStore(database=get_async_db()))
+    media_type, body = _send(replay, "*/*")
+    assert media_type == "application/json"
+    assert b'"booked_time":"2024-05-01T08:30:00"' in body
+
+
+def test_conflict_keeps_the_other_workers_claim():
+    calls = []
+
+    async def book():
+        calls.append(1)
+        return APIResponse(dict(BOOKED))
+
+    async def go():
+        database = get_async_db()
+        # Another worker is still running the request
+        await database.idempotency_keys.insert_one({"_id": "book:k3", "request_hash": "x",
+                                                    "state": "pending", "created_at": datetime.utcnow()})
+        store = IdempotencyStore(database=database)
+        for _ in range(2):
+            with pytest.raises(HTTPException) as e:
+                await store.run("book", "k3", {"slot_id": 1}, book)
+            assert e.value.status_code == 409
+        return await database.idempotency_keys.find_one({"_id": "book:k3"})
+
+    assert asyncio.run(go())["state"] == "pending" and calls == []
@@ -0,0 +1,28 @@
+import re
+
+from app import plate_service
+
+
+def _cascade(monkeypatch, reads):
+    """Register fake recognizers returning (text, confidence); returns the call log."""
+    calls = []
+    for name, (text, confidence) in reads.items():
+        def recognize(mask, name=name, text=text, confidence=confidence):
+            calls.append(name)
+            return list(text), [confidence] * len(text)
+        monkeypatch.setitem(plate_service._recognizers, name, recognize)
+    return calls
+
+
+def test_confident_foreign_plate_stops_the_cascade(monkeypatch):
+    monkeypatch.setattr(plate_service, "PLATE_PATTERN", None)
+    calls = _cascade(monkeypatch, {"fake_a": ("AB12CDE", 0.95), "fake_b": ("AB12CDE", 0.99)})
+    best = plate_service.read_plate(None, cascade=["fake_a", "fake_b"], min_confidence=0.8)
+    assert calls == ["fake_a"] and best["text"] == "AB12CDE" and best["valid"]
+
+
+def test_pattern_when_set_still_gates_the_early_exit(monkeypatch):
+    monkeypatch.setattr(plate_service, "PLATE_PATTERN", re.compile(r"^[A-Z]{3}\d{4}$"))
+    calls = _cascade(monkeypatch, {"fake_a": ("AB12CDE", 0.95), "fake_b": ("CAB1234", 0.85)})
+    best = plate_service.read_plate(None, cascade=["fake_a", "fake_b"], min_confidence=0.8)
+    assert calls == ["fake_a", "fake_b"] and best["text"] == "CAB1234"
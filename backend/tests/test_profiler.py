@@ -0,0 +1,20 @@
+import threading
+
+from metrics import SamplingProfiler
+
+
+def test_collapsed_while_sampling():
+    profiler = SamplingProfiler()
+    stop = threading.Event()
+    # Threads coming and going give the sampler new stacks to add
+    workers = [threading.Thread(target=stop.wait, args=(0.001 * i,)) for i in range(200)]
+    profiler.start(interval=0.0005)
+    try:
+        for worker in workers:
+            worker.start()
+            profiler.collapsed(limit=3)
+    finally:
+        stop.set()
+        profiler.stop()
+    assert profiler.samples > 0
+    assert len(profiler.collapsed(limit=3).strip().splitlines()) <= 3
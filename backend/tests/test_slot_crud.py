@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+import parking_slot_crud as crud
+
+
+def test_init_slots_seeds_free_slots(database):
+    assert database.parking_slots.count_documents({"status": "free"}) == 100
+    assert crud.get_slot_summary()["total"] == {"free": 100, "booked": 0, "parked": 0}
+
+
+def test_book_park_clear(database):
+    booked = crud.book_slot(1, "cab 1234", username="alice")
+    assert booked["status"] == "booked" and booked["parked_vehicle_plate"] == "CAB 1234"
+    parked = crud.park_slot(1, "CAB 1234")
+    assert parked["status"] == "parked" and parked["parked_time"] is not None
+    info = crud.clear_slot(1, "CAB 1234")
+    assert info["slot_id"] == 1 and info["fee"] >= 0
+    assert database.parking_slots.find_one({"slot_id": 1})["status"] == "free"
+    assert crud.get_slot_summary()["total"] == {"free": 100, "booked": 0, "parked": 0}
+
+
+def test_second_booking_for_plate_is_rejected(database):
+    crud.book_slot(1, "CAB1234")
+    with pytest.raises(ValueError):
+        crud.book_slot(2, "CAB1234")
+
+
+def test_clear_by_other_plate_is_rejected(database):
+    crud.book_slot(1, "CAB1234")
+    crud.park_slot(1, "CAB1234")
+    with pytest.raises(ValueError, match="Unauthorized"):
+        crud.clear_slot(1, "XYZ9999")
+
+
+def test_booking_service_round_trip(database):
+    from services.booking_service import BookingService
+
+    async def run():
+        booking = BookingService()
+        await booking.book_slot(41, "CAR0001", "bob")
+        parked = await booking.auto_park("car0001")
+        cleared = await booking.clear_slot(41, "CAR0001")
+        return parked, cleared
+
+    parked, cleared = asyncio.run(run())
+    assert parked["slot_id"] == 41 and parked["status"] == "parked"
+    assert cleared["slot_id"] == 41
+    assert crud.get_slot_summary()["total"]["free"] == 100
+
+
+def test_parked_plate_can_book_again(database):
+    crud.book_slot(1, "CAB1234")
+    crud.park_slot(1, "CAB1234")
+    assert crud.book_slot(2, "CAB1234")["status"] == "booked"
+
+
+def test_reconcile_corrects_drift_by_delta(database):
+    crud.book_slot(1, "CAB1234")
+    key = "Bikes:" + crud.DEFAULT_ZONE
+    database.slot_counters.update_one({"_id": key}, {"$inc": {"free": 5, "booked": -1}})
+    database.slot_counters.insert_one({"_id": "Gone:" + crud.DEFAULT_ZONE, "vehicle_type": "Gone",
+                                       "zone": crud.DEFAULT_ZONE, "free": 2, "booked": 0, "parked": 0})
+    crud.reconcile_counters()
+    assert crud.get_slot_summary()["total"] == {"free": 99, "booked": 1, "parked": 0}
+    assert database.slot_counters.find_one({"_id": "Gone:" + crud.DEFAULT_ZONE}) is None
+
+
+def test_reconcile_keeps_increments_made_during_the_aggregation(database, monkeypatch):
+    key = "Bikes:" + crud.DEFAULT_ZONE
+    aggregate = crud.slots.aggregate
+
+    def racing_aggregate(pipeline):
+        rows = list(aggregate(pipeline))
+        # A booking lands after the recount but before the correction
+        crud.book_slot(1, "CAB1234")
+        return rows
+
+    monkeypatch.setattr(crud.slots, "aggregate", racing_aggregate, raising=False)
+    crud.reconcile_counters()
+    counts = database.slot_counters.find_one({"_id": key})
+    assert (counts["free"], counts["booked"]) == (39, 1)
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import parking_slot_crud as crud
+from slot_events import SlotEventLog, ensure_event_log, slot_history, snapshots
+
+
+def _log_transitions(log, transitions):
+    crud.add_slot_listener(log.on_slot_event)
+    try:
+        for fn, *args in transitions:
+            fn(*args)
+    finally:
+        crud._listeners.remove(log.on_slot_event)
+    log._write(log._drain(block=False))
+
+
+def test_snapshot_and_point_in_time_state(database):
+    ensure_event_log()
+    log = SlotEventLog(snapshot_every=3)
+    _log_transitions(log, [(crud.book_slot, 1, "CAB1234"), (crud.park_slot, 1, "CAB1234"),
+                           (crud.book_slot, 2, "CAB5678")])
+    assert log.written_seq == 3
+    log.snapshot()
+    assert snapshots.find_one({})["seq"] == 3
+
+    _log_transitions(log, [(crud.clear_slot, 1, "CAB1234")])
+    state = {s["slot_id"]: s["status"] for s in log.state_at(datetime.utcnow())}
+    assert state == {1: "free", 2: "booked"}
+    assert [e["event"] for e in slot_history(1)] == ["booked", "parked", "cleared"]
+
+
+def test_recent_snapshot_is_not_repeated(database):
+    ensure_event_log()
+    log = SlotEventLog(snapshot_every=3)
+    _log_transitions(log, [(crud.book_slot, 1, "CAB1234"), (crud.book_slot, 2, "CAB5678"),
+                           (crud.book_slot, 3, "CAB9012")])
+    log.snapshot()
+    _log_transitions(log, [(crud.park_slot, 1, "CAB1234")])
+    log.snapshot()
+    assert snapshots.count_documents({}) == 1
+
+
+def test_new_worker_rebuilds_from_snapshot_and_tail(database):
+    ensure_event_log()
+    log = SlotEventLog(snapshot_every=2)
+    _log_transitions(log, [(crud.book_slot, 1, "CAB1234"), (crud.book_slot, 2, "CAB5678")])
+    log.snapshot()
+    before_tail = datetime.utcnow()
+    _log_transitions(log, [(crud.park_slot, 1, "CAB1234")])
+
+    worker = SlotEventLog()
+    state = worker.rebuild()
+    assert worker.seq == 3
+    assert {k: s["status"] for k, s in state.items()} == {1: "parked", 2: "booked"}
+
+    # Events written after the rebuild reach memory on the next read
+    _log_transitions(log, [(crud.park_slot, 2, "CAB5678")])
+    assert worker.get_state(2)["status"] == "parked"
+    assert {s["slot_id"]: s["status"] for s in worker.state_at(before_tail)} == \
+        {1: "booked", 2: "booked"}
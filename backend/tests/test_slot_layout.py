@@ -0,0 +1,32 @@
+import parking_slot_crud as crud
+from slot_layout import migrate_legacy
+
+
+def _legacy(database, slot_id, status, plate):
+    database.parking_slots.insert_one({"slot_id": slot_id, "status": status, "plate_number": plate})
+
+
+def test_migrate_in_place_deletes_only_merged_legacy_docs(database):
+    crud.book_slot(6, "CAB1")
+    _legacy(database, "101", "booked", "LEG1")    # no current slot: converted
+    _legacy(database, "5", "parked", "LEG2")      # free slot: occupancy copied
+    _legacy(database, "6", "parked", "LEG3")      # slot held by another plate: conflict
+    _legacy(database, "7", "booked", "CAB1")      # plate already booked elsewhere: write fails
+
+    report = migrate_legacy(apply=True)
+
+    assert report["converted"] == [101] and report["occupancy_copied"] == [5]
+    assert report["conflicts"] == [6] and report["failed"] == [7]
+    remaining = sorted(d["slot_id"] for d in database.parking_slots.find({"slot_id": {"$type": "string"}}))
+    assert remaining == ["6", "7"]
+    assert database.parking_slots.find_one({"slot_id": 101})["parked_vehicle_plate"] == "LEG1"
+    assert database.parking_slots.find_one({"slot_id": 5})["status"] == "parked"
+    assert database.parking_slots.find_one({"slot_id": 7})["status"] == "free"
+
+
+def test_dry_run_writes_nothing(database):
+    _legacy(database, "5", "parked", "LEG2")
+    report = migrate_legacy(apply=False)
+    assert report["occupancy_copied"] == [5]
+    assert database.parking_slots.count_documents({"slot_id": "5"}) == 1
+    assert database.parking_slots.find_one({"slot_id": 5})["status"] == "free"
@@ -0,0 +1,29 @@
+import pytest
+
+from user_auth_mongo import ensure_user_indexes, get_user, login_user, register_user
+
+
+def test_login_checks_the_database_not_the_cache(database):
+    register_user("alice", "cab 1234")
+    assert login_user("alice", "CAB 1234")["username"] == "alice"
+    assert get_user("alice")["vehicle_plate"] == "CAB 1234"
+
+    # Changed outside this worker: the cached profile is stale, the login is not
+    database.users.update_one({"username": "alice"}, {"$set": {"vehicle_plate": "CAB 9999"}})
+    with pytest.raises(ValueError):
+        login_user("alice", "CAB 1234")
+    assert login_user("alice", "cab 9999")["vehicle_plate"] == "CAB 9999"
+
+
+def test_duplicate_registration_is_rejected(database):
+    register_user("alice", "CAB1234")
+    with pytest.raises(ValueError, match="already taken"):
+        register_user("alice", "CAB5678")
+    with pytest.raises(ValueError, match="already registered"):
+        register_user("bob", "cab1234")
+
+
+def test_unused_login_index_is_dropped(database):
+    database.users.create_index([("username", 1), ("vehicle_plate", 1)])
+    ensure_user_indexes()
+    assert "username_1_vehicle_plate_1" not in database.users.index_information()
@@ -0,0 +1,352 @@
+# tracing.py
+
+"""
+Request tracing with OpenTelemetry-compatible spans.
+
+Spans carry W3C trace/span ids and are exported as OTLP/JSON
+(resourceSpans -> scopeSpans -> spans), so any OpenTelemetry collector or
+backend can ingest them. Exporter selection by TRACE_EXPORTER:
+
+    none    tracing off (default)
+    file    OTLP/JSON lines appended to TRACE_FILE
+    otlp    POST to OTLP_ENDPOINT (an OTel collector's /v1/traces, or the
+            stand-in in scripts/otlp_collector.py)
+
+Sampling is decided once per trace at the root span (head-based): a root is
+kept with probability TRACE_SAMPLE_RATIO, or follows the sampled flag of an
+incoming traceparent header. Spans of unsampled traces are a shared no-op
+object, so unsampled requests pay one context-variable lookup per span.
+Finished spans are batched and exported from a background thread.
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+OTLP_ENDPOINT = os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "0.01"))
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", "512"))
+TRACE_FLUSH_SECONDS = float(os.getenv("TRACE_FLUSH_SECONDS", "5"))
+SERVICE_NAME = os.getenv("SERVICE_NAME", "parking-backend")
+
+# OTLP span kinds
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+def _attribute(key, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "events", "status", "status_message")
+
+    sampled = True
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, kind: int = KIND_INTERNAL,
+                 attributes: dict = None):
+        self.trace_id, self.parent_id = trace_id, parent_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.name, self.kind = name, kind
+        self.start_ns, self.end_ns = time.time_ns(), None
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status, self.status_message = 0, None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def record_exception(self, exc: BaseException):
+        self.status, self.status_message = STATUS_ERROR, str(exc)
+        self.add_event("exception", **{"exception.type": type(exc).__name__,
+                                       "exception.message": str(exc)})
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            exporter.export(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id, "spanId": self.span_id, "name": self.name, "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns), "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status, **({"message": self.status_message} if self.status_message else {})},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = [{"timeUnixNano": str(t), "name": n,
+                               "attributes": [_attribute(k, v) for k, v in a.items()]}
+                              for t, n, a in self.events]
+        return span
+
+
+class _NoopSpan:
+    """Stand-in for spans of unsampled traces; every operation is a no-op."""
+
+    sampled = False
+    traceparent = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current_span():
+    return _current.get() or NOOP_SPAN
+
+
+def parse_traceparent(header: str):
+    """(trace_id, parent_span_id, sampled) from a W3C traceparent header, or None."""
+    try:
+        version, trace_id, span_id, flags = header.strip().split("-")
+        if len(trace_id) == 32 and len(span_id) == 16 and int(trace_id, 16) and int(span_id, 16):
+            return trace_id, span_id, bool(int(flags, 16) & 1)
+    except (AttributeError, ValueError):
+        pass
+    return None
+
+
+def begin_span(name: str, kind: int = KIND_INTERNAL, traceparent: str = None, root: bool = False,
+               **attributes):
+    """
+    Start a span under the current one (or a new trace when there is none and
+    root=True; without root=True, spans outside a trace are not recorded).
+    Returns the span; the caller must end() it.
+    """
+    parent = _current.get()
+    if parent is not None:
+        if not parent.sampled:
+            return NOOP_SPAN
+        return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+    if exporter is None or not (root or traceparent):
+        return NOOP_SPAN
+    remote = parse_traceparent(traceparent) if traceparent else None
+    if remote:
+        trace_id, parent_id, sampled = remote
+    else:
+        trace_id, parent_id = "%032x" % random.getrandbits(128), None
+        sampled = random.random() < TRACE_SAMPLE_RATIO
+    if not sampled:
+        return NOOP_SPAN
+    return Span(name, trace_id, parent_id, kind, attributes)
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, root: bool = False, traceparent: str = None,
+         **attributes):
+    """Context manager: a child span of the current one (see begin_span)."""
+    if exporter is None and _current.get() is None:
+        yield NOOP_SPAN
+        return
+    s = begin_span(name, kind, traceparent, root, **attributes)
+    if s is NOOP_SPAN:
+        # Mark the context as unsampled so nested spans skip the sampling decision
+        token = _current.set(NOOP_SPAN) if _current.get() is None and root else None
+        try:
+            yield s
+        finally:
+            if token is not None:
+                _current.reset(token)
+        return
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.record_exception(e)
+        raise
+    finally:
+        _current.reset(token)
+        s.end()
+
+
+# -------------------------------------------------------------------
+# Exporters
+# -------------------------------------------------------------------
+class BatchExporter:
+    """Buffers finished spans and writes them in OTLP/JSON batches from a daemon thread."""
+
+    def __init__(self, batch_size: int = TRACE_BATCH_SIZE, flush_seconds: float = TRACE_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._start()
+        atexit.register(self.flush)
+        # Pre-forked workers (serve.py) need their own queue and thread
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self.batch_size * 20)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass   # never block a request on tracing
+
+    def _drain(self, block: bool) -> list:
+        batch = []
+        try:
+            batch.append(self._queue.get(block=block, timeout=self.flush_seconds if block else None))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    @staticmethod
+    def payload(spans: list) -> dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", SERVICE_NAME),
+                                        _attribute("process.pid", os.getpid())]},
+            "scopeSpans": [{"scope": {"name": "parking-backend.tracing"},
+                            "spans": [s.to_otlp() for s in spans]}],
+        }]}
+
+    def write(self, payload: dict):
+        raise NotImplementedError
+
+    def _write(self, batch: list):
+        if not batch:
+            return
+        try:
+            self.write(self.payload(batch))
+        except Exception as e:
+            logger.error("Failed to export %d spans: %s", len(batch), e)
+
+    def flush(self):
+        while not self._queue.empty():
+            self._write(self._drain(block=False))
+
+    def _run(self):
+        while True:
+            self._write(self._drain(block=True))
+
+
+class FileExporter(BatchExporter):
+    def __init__(self, path: str = TRACE_FILE, **kwargs):
+        self.path = path
+        super().__init__(**kwargs)
+
+    def write(self, payload):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+
+class OTLPHttpExporter(BatchExporter):
+    def __init__(self, endpoint: str = OTLP_ENDPOINT, **kwargs):
+        self.endpoint = endpoint
+        super().__init__(**kwargs)
+
+    def write(self, payload):
+        request = urllib.request.Request(self.endpoint, data=json.dumps(payload).encode(),
+                                         headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(request, timeout=5).close()
+
+
+def create_exporter(kind: str = TRACE_EXPORTER):
+    if kind == "file":
+        return FileExporter()
+    if kind == "otlp":
+        return OTLPHttpExporter()
+    if kind not in ("none", ""):
+        logger.error("Unknown TRACE_EXPORTER '%s'; tracing disabled", kind)
+    return None
+
+
+exporter = create_exporter()
+
+
+# -------------------------------------------------------------------
+# MongoDB commands
+# -------------------------------------------------------------------
+def mongo_span(operation: str, collection: str):
+    """
+    Client span around an awaited Motor call. Motor runs the command on an
+    executor thread, which only sees the request's span if the driver copies
+    the context there; the span opened on the event loop does not depend on it.
+    """
+    return span(f"mongo {operation}", KIND_CLIENT,
+                **{"db.system": "mongodb", "db.operation": operation, "db.mongodb.collection": collection})
+
+
+class MongoTraceListener(monitoring.CommandListener):
+    """
+    Child spans for pymongo commands issued inside a sampled span. Commands
+    under a mongo_span are already covered by it and get no span of their own.
+    """
+
+    def __init__(self):
+        self._open = {}
+
+    def started(self, event):
+        parent = _current.get()
+        if parent is not None and parent.sampled and parent.kind == KIND_CLIENT:
+            return
+        s = begin_span(f"mongo {event.command_name}", KIND_CLIENT,
+                       **{"db.system": "mongodb", "db.name": event.database_name,
+                          "db.operation": event.command_name})
+        if s.sampled:
+            collection = event.command.get(event.command_name)
+            if isinstance(collection, str):
+                s.set_attribute("db.mongodb.collection", collection)
+            self._open[(event.request_id, event.operation_id)] = s
+
+    def _finish(self, event, error: str = None):
+        s = self._open.pop((event.request_id, event.operation_id), None)
+        if s is not None:
+            if error:
+                s.status, s.status_message = STATUS_ERROR, error
+            s.end()
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure.get("errmsg", "failed")))
+
+
+mongo_trace_listener = MongoTraceListener()
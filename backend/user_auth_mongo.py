@@ -1,45 +1,115 @@
 # user_auth_mongo.py
 
 import os
-from pymongo import MongoClient, errors
-from dotenv import load_dotenv
+import logging
+from pymongo import errors
 
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-if not MONGO_URI:
-    raise RuntimeError("MONGO_URI not set")
+from db import get_db
+from coordination import invalidate, on_invalidate
+from plate_index import USER, plate_index
+from ttl_cache import TTLCache
 
-client = MongoClient(MONGO_URI)
-db = client.get_default_database()
+logger = logging.getLogger(__name__)
+
+db = get_db()
 users = db.users
 
-# Drop any leftover email index
-existing = users.index_information()
-if "email_1" in existing:
-    users.drop_index("email_1")
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+
+# User records (without _id) by username, for profile lookups; logins do not trust them
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+
+def normalize_plate(vehicle_plate: str) -> str:
+    return str(vehicle_plate).strip().upper()
+
+
+def ensure_user_indexes():
+    """Create the users indexes; called once at application startup."""
+    # Drop any leftover email index, and the username+plate one: logins find
+    # the user by the unique username index and compare the plate in code
+    existing = users.index_information()
+    for name in ("email_1", "username_1_vehicle_plate_1"):
+        if name in existing:
+            users.drop_index(name)
+
+    # Unique username and unique plate
+    users.create_index("username", unique=True)
+    try:
+        users.create_index("vehicle_plate", unique=True)
+    except errors.OperationFailure as e:
+        # Existing duplicate plates: keep plate lookups indexed anyway
+        logger.error("Cannot create unique vehicle_plate index (%s); using a plain index", e)
+        users.create_index("vehicle_plate")
+
+
+def remember_user(doc: dict) -> dict:
+    doc.pop("_id", None)
+    _user_cache.set(doc["username"], doc)
+    return doc
+
+
+def cached_user(username: str) -> dict:
+    """Cache-only lookup, for callers that query the database themselves (async)."""
+    return _user_cache.get(username)
+
 
-# Ensure unique index on username only
-users.create_index("username", unique=True)
+def _drop_user(username: str = None, **_):
+    if username is not None:
+        _user_cache.pop(username)
 
-def register_user(username: str, vehicle_plate: str, vehicle_type: str) -> dict:
-    if users.find_one({"username": username}):
-        raise ValueError(f"Username '{username}' is already taken")
+
+def invalidate_user(username: str):
+    """Drop a user from this worker's cache and from every other worker's."""
+    _drop_user(username)
+    invalidate("users", username=username)
+
+
+def follow_user_invalidations():
+    """Apply other workers' user invalidations to the local cache; called at startup."""
+    on_invalidate("users", lambda key: _drop_user(**key))
+
+
+def get_user(username: str) -> dict:
+    """User record by username, served from the cache when possible."""
+    doc = _user_cache.get(username)
+    if doc is None:
+        doc = users.find_one({"username": username}, {"_id": 0})
+        if doc:
+            remember_user(doc)
+    return doc
+
+
+def register_user(username: str, vehicle_plate: str, vehicle_type: str = None) -> dict:
     doc = {
         "username": username,
-        "vehicle_plate": vehicle_plate,
+        "vehicle_plate": normalize_plate(vehicle_plate),
         "vehicle_type": vehicle_type
     }
-    users.insert_one(doc)
-    return doc
+    invalidate_user(username)
+    try:
+        users.insert_one(doc)
+    except errors.DuplicateKeyError as e:
+        key_pattern = (e.details or {}).get("keyPattern")
+        if key_pattern is None:
+            key_pattern = {"username": 1} if users.find_one({"username": username}, {"_id": 1}) else {}
+        if "username" in key_pattern:
+            raise ValueError(f"Username '{username}' is already taken")
+        raise ValueError(f"Vehicle plate '{doc['vehicle_plate']}' is already registered")
+    plate_index.add(doc["vehicle_plate"], USER)
+    return remember_user(doc)
+
 
 def login_user(username: str, vehicle_plate: str) -> dict:
     """
     Authenticates by matching both username and vehicle_plate.
+    The credential is always checked against the database, never the cache,
+    so a changed plate takes effect at once; the fresh record is cached.
     """
-    doc = users.find_one({
-        "username": username,
-        "vehicle_plate": vehicle_plate
-    }, {"_id": 0})
-    if not doc:
+    doc = users.find_one({"username": username}, {"_id": 0})
+    if doc:
+        remember_user(doc)
+    if not doc or normalize_plate(doc["vehicle_plate"]) != normalize_plate(vehicle_plate):
         raise ValueError("Invalid credentials")
-    return doc
\ No newline at end of file
+    return doc